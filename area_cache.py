@@ -0,0 +1,108 @@
+"""地域情報（area.json）のディスクキャッシュ
+
+起動時はキャッシュファイル（なければ同梱の area_debug.json）から
+すぐに読み込み、有効期限が切れていればバックグラウンドで取得し直す。
+ネットワークがなくてもドロップダウンはすぐに埋まる。
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+
+from jma_client import fetch_area_data
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# キャッシュファイルの場所（AREA_CACHE_PATH で変更できる）
+CACHE_PATH = os.environ.get("AREA_CACHE_PATH", os.path.join(_HERE, "area_cache.json"))
+# キャッシュがないときに使う同梱のスナップショット
+SNAPSHOT_PATH = os.path.join(_HERE, "area_debug.json")
+# キャッシュの有効期限（秒）。地域の構成はめったに変わらないので 1 日
+TTL = 24 * 60 * 60
+
+
+class AreaCache:
+    """地域情報のキャッシュ"""
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, snapshot_path=SNAPSHOT_PATH):
+        self.path = path
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.areas = None
+        self.fetched_at = 0.0  # キャッシュした時刻（スナップショットなら 0）
+        self._refreshing = threading.Lock()
+
+    @property
+    def stale(self):
+        """有効期限が切れているかどうか"""
+        return time.time() - self.fetched_at > self.ttl
+
+    def load(self):
+        """地域情報を返す（キャッシュ → スナップショット → ネットワークの順に探す）"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cached = json.load(f)
+            self.areas = cached["areas"]
+            self.fetched_at = cached["fetched_at"]
+            return self.areas
+        except (OSError, ValueError, KeyError):
+            pass
+
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                self.areas = json.load(f)
+            self.fetched_at = 0.0
+            return self.areas
+        except (OSError, ValueError):
+            pass
+
+        # どちらもなければ取得するしかない（失敗すると RequestException）
+        return self.refresh()
+
+    def refresh(self):
+        """地域情報を取得し直してキャッシュに保存する"""
+        areas = fetch_area_data()
+        self._save(areas)
+        self.areas = areas
+        return areas
+
+    def refresh_async(self, on_refresh=None, force=False):
+        """期限切れならバックグラウンドで取得し直す
+
+        内容が変わっていれば on_refresh(areas) を呼ぶ。取得を始めたら
+        スレッドを、その必要がなければ None を返す。
+        """
+        if not (force or self.stale):
+            return None
+        if not self._refreshing.acquire(blocking=False):
+            return None  # すでに取得中
+
+        def worker():
+            try:
+                previous = self.areas
+                areas = self.refresh()
+                if on_refresh is not None and areas != previous:
+                    on_refresh(areas)
+            except requests.RequestException as e:
+                # 取得できなくても手元の情報で動き続ける
+                print(f"[WARN] 地域情報の再取得に失敗しました: {e}")
+            finally:
+                self._refreshing.release()
+
+        thread = threading.Thread(target=worker, name="area-cache-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def _save(self, areas):
+        """キャッシュファイルを書き換える（途中で落ちても壊れないように一時ファイル経由）"""
+        self.fetched_at = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": self.fetched_at, "areas": areas}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARN] 地域情報のキャッシュを保存できませんでした: {e}")
@@ -0,0 +1,206 @@
+"""地域情報（area.json）全階層の検索索引
+
+centers → offices → class10s → class15s → class20s のすべての地域を、
+名前・読み（かな）・英語名・コードの前方一致で検索できるようにする。
+入力途中の文字列で候補を出す用途を想定していて、1 回の検索は
+二分探索と数件の比較だけで終わる（1 ミリ秒未満）。
+
+前方一致で候補が足りないときは、文字の 2-gram の重なりで
+あいまい検索した結果を後ろに足す（「さっぽろ」→「札幌市」の読み違いや
+1 文字の打ち間違いを拾うため）。
+
+どの地域からでも、天気予報の取得に使う office のコードをたどれる。
+"""
+
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+# 階層の並び（上位から）と、それぞれの親の階層
+LEVELS = ("centers", "offices", "class10s", "class15s", "class20s")
+PARENT_LEVEL = {
+    "offices": "centers",
+    "class10s": "offices",
+    "class15s": "class10s",
+    "class20s": "class15s",
+}
+# 階層の表示名
+LEVEL_NAMES = {
+    "centers": "地方",
+    "offices": "府県",
+    "class10s": "一次細分区域",
+    "class15s": "市町村等をまとめた地域",
+    "class20s": "市町村",
+}
+# あいまい検索で候補にする類似度（Dice 係数）の下限
+FUZZY_THRESHOLD = 0.4
+# あいまい検索で類似度を計算する候補の数（limit の何倍まで見るか）
+FUZZY_CANDIDATES = 20
+
+
+class AreaNode:
+    """地域の 1 件"""
+
+    __slots__ = ("level", "code", "name", "en_name", "kana", "parent", "children")
+
+    def __init__(self, level, code, name, en_name=None, kana=None):
+        self.level = level
+        self.code = code
+        self.name = name
+        self.en_name = en_name
+        self.kana = kana
+        self.parent = None
+        self.children = []
+
+    @property
+    def office(self):
+        """この地域を含む office（centers なら None）"""
+        node = self
+        while node is not None and node.level != "offices":
+            node = node.parent
+        return node
+
+    @property
+    def office_code(self):
+        """天気予報の取得に使う office のコード"""
+        office = self.office
+        return office.code if office is not None else None
+
+    def path(self):
+        """最上位（centers）からこの地域までのリスト"""
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        return nodes[::-1]
+
+    def label(self):
+        """候補の表示用（例: 札幌市（石狩地方））"""
+        office = self.office
+        if office is None or office is self:
+            return self.name
+        return f"{self.name}（{office.name}）"
+
+    def __repr__(self):
+        return f"AreaNode({self.level!r}, {self.code!r}, {self.name!r})"
+
+
+def normalize(text):
+    """検索用に表記をそろえる（全角半角・大文字小文字・カタカナ→ひらがな）"""
+    text = unicodedata.normalize("NFKC", text).lower().strip()
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def _bigrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class AreaIndex:
+    """地域情報の全階層の索引"""
+
+    def __init__(self, areas):
+        self.nodes = {}  # (階層, コード) → AreaNode
+        self._by_code = {}  # コード → AreaNode のリスト（階層が違っても同じコードがある）
+        for level in LEVELS:
+            for code, info in areas.get(level, {}).items():
+                node = AreaNode(level, code, info.get("name", ""),
+                                info.get("enName"), info.get("kana"))
+                self.nodes[level, code] = node
+                self._by_code.setdefault(code, []).append(node)
+
+        # 親子のつながり
+        for (level, code), node in self.nodes.items():
+            parent_level = PARENT_LEVEL.get(level)
+            if parent_level is None:
+                continue
+            parent_code = areas[level][code].get("parent")
+            parent = self.nodes.get((parent_level, parent_code))
+            if parent is not None:
+                node.parent = parent
+                parent.children.append(node)
+
+        # 前方一致用: (正規化したキー, 地域の番号) を並べた配列。二分探索で範囲を探す
+        self._order = list(self.nodes.values())
+        entries = set()
+        self._grams = {}  # 2-gram → 地域の番号の集合（あいまい検索用）
+        self._key_grams = []  # 地域の番号 → キーごとの 2-gram の集合のリスト
+        for i, node in enumerate(self._order):
+            entries.add((node.code, i))
+            # コードは前方一致だけ（数字の 2-gram はほとんどの地域に当たるため）
+            keys = {normalize(k) for k in (node.name, node.kana, node.en_name) if k}
+            key_grams = []
+            for key in keys:
+                entries.add((key, i))
+                grams = _bigrams(key)
+                key_grams.append(grams)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(i)
+            self._key_grams.append(key_grams)
+        entries = sorted(entries)
+        self._entry_keys = [key for key, _ in entries]
+        self._entry_ids = [i for _, i in entries]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, code, level=None):
+        """コードで地域を返す（level を省略すると最上位の階層のもの）"""
+        if level is not None:
+            return self.nodes.get((level, code))
+        nodes = self._by_code.get(code)
+        return nodes[0] if nodes else None
+
+    def prefix_search(self, query, limit=20):
+        """キーが query で始まる地域を返す（上位の階層・短いキーを先に）"""
+        return [self._order[i] for i in self._prefix_ids(normalize(query), limit)]
+
+    def fuzzy_search(self, query, limit=20):
+        """文字の 2-gram の重なりが大きい順に地域を返す"""
+        return [self._order[i] for i in self._fuzzy_ids(normalize(query), limit)]
+
+    def search(self, query, limit=20):
+        """入力途中の文字列で候補を返す（前方一致のあとにあいまい検索の結果）"""
+        query = normalize(query)
+        ids = self._prefix_ids(query, limit)
+        if len(ids) < limit:
+            ids += self._fuzzy_ids(query, limit - len(ids), exclude=set(ids))
+        return [self._order[i] for i in ids]
+
+    def _prefix_ids(self, query, limit):
+        if not query:
+            return []
+        keys = self._entry_keys
+        start = bisect_left(keys, query)
+        # query で始まる範囲の終わり（query の後ろに最大の文字を付けたものの手前）
+        end = bisect_left(keys, query + "\U0010ffff", start)
+        ranks = {}
+        for pos in range(start, end):
+            i = self._entry_ids[pos]
+            rank = (LEVELS.index(self._order[i].level), len(keys[pos]))
+            if i not in ranks or rank < ranks[i]:
+                ranks[i] = rank
+        return sorted(ranks, key=ranks.__getitem__)[:limit]
+
+    def _fuzzy_ids(self, query, limit, exclude=()):
+        grams = _bigrams(query)
+        if not grams or query.isdigit():
+            return []
+        votes = Counter()
+        for gram in grams:
+            votes.update(self._grams.get(gram, ()))
+
+        # 共通の 2-gram が多いものから順に、一定数だけ類似度を計算する
+        scored = []
+        for i, _ in votes.most_common(limit * FUZZY_CANDIDATES + len(exclude)):
+            if i in exclude:
+                continue
+            # キーごとの Dice 係数のうち最大のもの
+            score = max(2 * len(grams & key_grams) / (len(grams) + len(key_grams))
+                        for key_grams in self._key_grams[i])
+            if score >= FUZZY_THRESHOLD:
+                scored.append((-score, LEVELS.index(self._order[i].level), i))
+        scored.sort()
+        return [i for _, _, i in scored[:limit]]
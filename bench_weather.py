@@ -0,0 +1,212 @@
+"""天気アプリの取得から保存までのベンチマーク
+
+使い方:
+    python bench_weather.py                          # ローカルの代わりのサーバーで測る
+    python bench_weather.py --latency 0.2 --jitter 0.3 --error-rate 0.05 --concurrency 8
+    python bench_weather.py --path columnar --rounds 5 --scale 4
+    python bench_weather.py --url http://127.0.0.1:8765  # 起動済みのサーバーを使う
+
+アプリと同じ関数で、地域情報の取得（fetch_area_data）→ 予報の取得（fetch_weather_data）
+→ 解析（parse_weather_data）→ 保存（WeatherDatabase.save_forecasts）を全 office について
+rounds 回くり返し、件数あたりの処理量、段階ごとの遅れ（中央値・p95・p99・最大）、
+データベースへの書き込みの速さを表示する。--path columnar では先読み
+（prefetch.py）と同じ列のままの解析と保存を測る。
+"""
+
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jma_client
+from forecast_parser import forecast_rows, parse_forecast_columns, parse_weather_data
+from mock_jma_server import MockJMAServer
+from prefetch import office_codes
+from weather_db import WeatherDatabase
+
+STAGES = ("fetch", "parse", "save", "total")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """p パーセンタイル（最も近い順位の値）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class PipelineBenchmark:
+    """office ごとの取得・解析・保存をスレッドで並行に行い、段階ごとの時間を集める"""
+
+    def __init__(self, db, path="dict", concurrency=4, conditional=False):
+        self.db = db
+        self.path = path
+        self.concurrency = concurrency
+        self.conditional = conditional  # 前回の ETag を使って条件付きで取得する
+        self.timings = {stage: [] for stage in STAGES}
+        self.rows = 0
+        self.saves = 0
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def _load(self, code):
+        """1 office を取得・解析・保存し、(段階ごとの時間, 保存した行数) を返す"""
+        started = time.perf_counter()
+        if self.path == "columnar":
+            try:
+                data = jma_client.fetch_json(jma_client.FORECAST_URL.format(code))
+            except Exception:
+                data = None
+        else:
+            data = jma_client.fetch_weather_data(code)
+        fetched = time.perf_counter()
+        if not data:
+            return {"fetch": fetched - started}, None
+
+        if self.path == "columnar":
+            series_list = parse_forecast_columns(data)
+            rows = list(forecast_rows(series_list))
+            parsed = time.perf_counter()
+            self.db.save_forecast_rows(code, rows, series_list[0].report_datetime)
+            count = len(rows)
+        else:
+            weather_dict = parse_weather_data(data)
+            parsed = time.perf_counter()
+            if not weather_dict:
+                return {"fetch": fetched - started, "parse": parsed - fetched}, None
+            self.db.save_forecasts(code, weather_dict, data[0].get("reportDatetime"))
+            count = sum(len(forecasts) for forecasts in weather_dict.values())
+        saved = time.perf_counter()
+        return {"fetch": fetched - started, "parse": parsed - fetched,
+                "save": saved - parsed, "total": saved - started}, count
+
+    def _run_one(self, code):
+        try:
+            timings, count = self._load(code)
+            error = None if count is not None else "天気データ取得失敗"
+        except Exception as e:
+            timings, count, error = {}, None, repr(e)
+        with self._lock:
+            for stage, seconds in timings.items():
+                self.timings[stage].append(seconds)
+            if error is not None:
+                self.errors[code] = error
+            else:
+                self.rows += count
+                self.saves += 1
+
+    def run(self, codes, rounds=1):
+        """codes を rounds 回取得し、かかった時間（秒）を返す"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="bench") as executor:
+            for _ in range(rounds):
+                if not self.conditional:
+                    jma_client.clear_cache()
+                list(executor.map(self._run_one, codes))
+        return time.perf_counter() - started
+
+    def summary(self, elapsed, area_seconds):
+        """結果の集計を dict で返す"""
+        save_seconds = sum(self.timings["save"])
+        latency = {}
+        for stage in STAGES:
+            values = self.timings[stage]
+            latency[stage] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+            latency[stage]["max"] = max(values) if values else None
+        requests_done = len(self.timings["fetch"])
+        return {
+            "path": self.path,
+            "concurrency": self.concurrency,
+            "area_fetch": area_seconds,
+            "elapsed": elapsed,
+            "requests": requests_done,
+            "saved": self.saves,
+            "failed": requests_done - self.saves,
+            "throughput": self.saves / elapsed if elapsed else None,
+            "rows": self.rows,
+            "rows_per_second": self.rows / save_seconds if save_seconds else None,
+            "transactions_per_second": self.saves / save_seconds if save_seconds else None,
+            "latency": latency,
+        }
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:8.1f}"
+
+
+def print_summary(summary, server_stats=None):
+    print(f"経路: {summary['path']}  同時実行数: {summary['concurrency']}")
+    print(f"地域情報の取得: {summary['area_fetch'] * 1000:.1f} ms")
+    print(f"予報: {summary['saved']}/{summary['requests']} 件を保存 "
+          f"({summary['elapsed']:.2f} 秒, {summary['throughput'] or 0:.1f} 件/秒)")
+    print(f"{'段階':<8}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>8}  (ms)")
+    for stage in STAGES:
+        row = summary["latency"][stage]
+        print(f"{stage:<8}{_ms(row['p50'])} {_ms(row['p95'])} {_ms(row['p99'])} {_ms(row['max'])}")
+    if summary["rows_per_second"] is not None:
+        print(f"書き込み: {summary['rows']} 行, {summary['rows_per_second']:.0f} 行/秒, "
+              f"{summary['transactions_per_second']:.0f} トランザクション/秒")
+    if server_stats is not None:
+        print(f"サーバー: 要求 {server_stats['requests']} 件, エラー {server_stats['errors']} 件, "
+              f"304 {server_stats['not_modified']} 件, {server_stats['bytes'] / 1024:.0f} KiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="天気予報の取得から保存までのベンチマーク")
+    parser.add_argument("--url", help="起動済みのサーバーの URL（省略するとローカルで起動する）")
+    parser.add_argument("--path", choices=("dict", "columnar"), default="dict",
+                        help="dict: 画面と同じ経路, columnar: 先読みと同じ経路")
+    parser.add_argument("--rounds", type=int, default=3, help="全 office を取得する回数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に取得する数")
+    parser.add_argument("--conditional", action="store_true",
+                        help="2 回目以降も ETag を使う（304 の場合を測る）")
+    parser.add_argument("--db", help="データベースのパス（省略すると一時ファイル）")
+    parser.add_argument("--latency", type=float, default=0.05, help="サーバーの応答の遅れ（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅れに足すばらつきの上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す割合（0〜1）")
+    parser.add_argument("--error-status", type=int, default=503, help="エラーのステータスコード")
+    parser.add_argument("--scale", type=int, default=1, help="予報に含める地域の倍率")
+    parser.add_argument("--seed", type=int, default=0, help="遅れとエラーの乱数の種")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url is None:
+        server = MockJMAServer(latency=args.latency, jitter=args.jitter,
+                               error_rate=args.error_rate, error_status=args.error_status,
+                               scale=args.scale, seed=args.seed).start()
+    jma_client.set_base_url(args.url or server.url)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = WeatherDatabase(args.db or os.path.join(tmp, "bench.db"))
+        try:
+            started = time.perf_counter()
+            areas = jma_client.fetch_area_data()
+            area_seconds = time.perf_counter() - started
+            db.insert_areas([(areas["centers"].get(office.get("parent"), {}).get("name", ""),
+                              office["name"], code)
+                             for code, office in areas["offices"].items()])
+
+            benchmark = PipelineBenchmark(db, args.path, args.concurrency, args.conditional)
+            elapsed = benchmark.run(office_codes(areas), args.rounds)
+            summary = benchmark.summary(elapsed, area_seconds)
+        finally:
+            db.close()
+            if server is not None:
+                server.stop()
+
+    server_stats = server.stats if server is not None else None
+    if args.json:
+        print(json.dumps({**summary, "server": server_stats}, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary, server_stats)
+
+
+if __name__ == "__main__":
+    main()
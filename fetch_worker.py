@@ -0,0 +1,121 @@
+"""天気予報の取得をバックグラウンドで行う（天気アプリ共通）
+
+クリックのたびにイベント処理の中で通信すると、その間は画面が止まる。
+FetchWorker は取得をスレッドプールで行い、終わったらコールバックで知らせる。
+
+- 同じ地域コードの取得が進行中なら新しく通信せず、その結果を待つ（二重クリック対策）
+- 別の地域を選び直したら、古い要求の結果は捨てる（まだ始まっていなければ取り消す）
+- 取得した結果は max_age 秒のあいだ覚えておき、次からはすぐに返す
+"""
+
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+# 取得に使うスレッドの数
+MAX_WORKERS = 4
+# 取得した結果を使い回す時間（秒）
+CACHE_MAX_AGE = 10 * 60
+
+
+class FetchWorker:
+    """地域コードごとに 1 本だけ取得を走らせ、最新の要求の結果だけを届ける"""
+
+    def __init__(self, load, max_workers=MAX_WORKERS, max_age=CACHE_MAX_AGE):
+        self.load = load  # 地域コードを受け取って結果を返す関数（別スレッドで呼ばれる）
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="forecast-fetch")
+        self._lock = threading.Lock()
+        self._inflight = {}  # 地域コード → 進行中の Future
+        self._cache = {}  # 地域コード → (取得した時刻, 結果)
+        self._generation = 0  # 要求の世代（新しい要求が来るたびに増やす）
+
+    def get_cached(self, key):
+        """max_age 以内に取得した結果を返す（なければ None）"""
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is None or time.monotonic() - cached[0] > self.max_age:
+            return None
+        return cached[1]
+
+    def request(self, key, on_result, on_error=None):
+        """key の結果を取得して on_result(結果) を呼ぶ
+
+        覚えている結果があればその場で on_result を呼んで True を返す。
+        なければバックグラウンドで取得を始めて False を返す。
+        その後に別の要求が来た場合、この要求のコールバックは呼ばれない。
+        """
+        cached = self.get_cached(key)
+        started = False
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            stale = self._others(keep=key)
+            if cached is None:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._executor.submit(self.load, key)
+                    self._inflight[key] = future
+                    started = True
+
+        # 取得がもう終わっていると _finish はその場で呼ばれ、ロックを取り直すので外で登録する
+        if started:
+            future.add_done_callback(lambda f: self._finish(key, f))
+        self._cancel(stale)
+        if cached is not None:
+            on_result(cached)
+            return True
+        future.add_done_callback(
+            lambda f: self._deliver(generation, f, on_result, on_error))
+        return False
+
+    def cancel(self):
+        """進行中の要求の結果を届けないようにする"""
+        with self._lock:
+            self._generation += 1
+            stale = self._others()
+        self._cancel(stale)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def busy(self):
+        """取得中の要求があるかどうか"""
+        with self._lock:
+            return bool(self._inflight)
+
+    def _others(self, keep=None):
+        """keep 以外の進行中の取得を返す（ロックを持って呼ぶ）"""
+        return [future for key, future in self._inflight.items() if key != keep]
+
+    @staticmethod
+    def _cancel(futures):
+        # まだ始まっていない取得だけ取り消せる（通信中のものは終わるまで待って結果を覚えておく）。
+        # 取り消すと _finish がその場で呼ばれて一覧から外れるので、ロックの外で行う
+        for future in futures:
+            future.cancel()
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.cancelled() and future.exception() is None \
+                    and future.result() is not None:
+                self._cache[key] = (time.monotonic(), future.result())
+
+    def _deliver(self, generation, future, on_result, on_error):
+        with self._lock:
+            if generation != self._generation:
+                return  # もっと新しい要求が来ている
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            return
+        on_result(result)
@@ -0,0 +1,249 @@
+"""発表日時（reportDatetime）ごとの天気予報の履歴
+
+weather_forecasts は同じ時刻の予報を上書きするので、以前の発表で
+どう予報されていたかは残らない。ForecastArchive は発表ごとに版を作り、
+前の版から変わったセル（時刻 × 項目）だけを forecast_changes に保存する。
+
+ある時点の予報は、各セルについて「その版以前で最後に変わった値」を
+集めれば復元できる。主キー（地域, 時刻, 項目, 版）の索引を時刻の範囲で
+たどるだけなので、何年分の履歴があっても復元にかかる時間は変わらない。
+
+時刻は UNIX 秒で、項目は番号で保存する。予報から消えた時刻は
+「存在」項目を NULL にして記録する。
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+JST = timezone(timedelta(hours=9))
+
+# 項目の番号（0 は時刻が予報に含まれているかどうか）
+PRESENT = 0
+FIELDS = ("weather_code", "weather", "temperature", "precipitation_probability")
+# 1 つの発表が含む時刻の範囲（発表日時からの前後）。復元のときはこの範囲だけを読む
+WINDOW_BEFORE = timedelta(days=3)
+WINDOW_AFTER = timedelta(days=14)
+
+
+def _timestamp(value):
+    """ISO 形式の日時を UNIX 秒にする"""
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def _isoformat(timestamp):
+    """UNIX 秒を日本時間の ISO 形式にする（気象庁の timeDefines と同じ形）"""
+    return datetime.fromtimestamp(timestamp, JST).isoformat()
+
+
+class ForecastArchive:
+    """WeatherDatabase と同じファイルに置く、差分で保存した予報の履歴"""
+
+    def __init__(self, db):
+        self.db = db  # 接続とロックは WeatherDatabase のものを使う
+        self._latest = {}  # 地域コード → (版, 発表日時, {時刻: 値のタプル})
+        self.create_tables()
+
+    @property
+    def conn(self):
+        return self.db.conn
+
+    def create_tables(self):
+        with self.db.lock, self.conn:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecast_versions (
+                id INTEGER PRIMARY KEY,
+                area_code TEXT NOT NULL,
+                report_datetime TEXT NOT NULL,
+                archived_at TEXT NOT NULL,
+                changes INTEGER NOT NULL,
+                UNIQUE (area_code, report_datetime)
+            )
+            ''')
+            # value は型を決めない（天気は文字列、気温は実数、降水確率は整数）
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecast_changes (
+                area_code TEXT NOT NULL,
+                forecast_time INTEGER NOT NULL,
+                field INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                value,
+                PRIMARY KEY (area_code, forecast_time, field, version)
+            ) WITHOUT ROWID
+            ''')
+
+    # 記録 ---------------------------------------------------------------
+
+    def record(self, area_code, report_datetime, rows):
+        """1 回の発表を版として記録し、変わったセルの数を返す
+
+        rows は (時刻, 天気コード, 天気, 気温, 降水確率) の並び。
+        同じ時刻が複数あれば、値のある項目をあとのもので上書きする。
+        すでに記録した発表か、それより古い発表なら何もせず None を返す。
+        """
+        with self.db.lock, self.conn:
+            return self.record_in_transaction(area_code, report_datetime, rows)
+
+    def record_in_transaction(self, area_code, report_datetime, rows):
+        """record と同じ（呼び出し側がロックを持ち、トランザクションを開始していること）"""
+        if not report_datetime:
+            return None
+        latest = self._latest_version(area_code)
+        if latest is not None and latest[1] >= report_datetime:
+            return None
+        previous = latest[2] if latest is not None else {}
+
+        current = {}
+        for forecast_time, *values in rows:
+            try:
+                timestamp = _timestamp(forecast_time)
+            except (TypeError, ValueError):
+                continue  # 日時として読めない時刻は記録しない
+            merged = current.get(timestamp)
+            if merged is not None:
+                values = [new if new is not None else old for new, old in zip(values, merged)]
+            current[timestamp] = tuple(values)
+
+        changes = []
+        for timestamp, values in current.items():
+            old = previous.get(timestamp)
+            if old is None:
+                changes.append((timestamp, PRESENT, 1))
+                old = (None,) * len(FIELDS)
+            for field, (new_value, old_value) in enumerate(zip(values, old), start=1):
+                if new_value != old_value:
+                    changes.append((timestamp, field, new_value))
+        for timestamp in previous.keys() - current.keys():
+            changes.append((timestamp, PRESENT, None))  # 予報から消えた時刻
+
+        version = self.conn.execute('''
+        INSERT INTO forecast_versions (area_code, report_datetime, archived_at, changes)
+        VALUES (?, ?, ?, ?)
+        ''', (area_code, report_datetime, datetime.now().isoformat(timespec='seconds'),
+              len(changes))).lastrowid
+        self.conn.executemany('''
+        INSERT INTO forecast_changes (area_code, forecast_time, field, version, value)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [(area_code, timestamp, field, version, value)
+              for timestamp, field, value in changes])
+        self._latest[area_code] = (version, report_datetime, current)
+        return len(changes)
+
+    def _latest_version(self, area_code):
+        """最新の版の (版, 発表日時, {時刻: 値}) を返す（なければ None）"""
+        row = self.conn.execute('''
+        SELECT id, report_datetime FROM forecast_versions
+        WHERE area_code = ? ORDER BY report_datetime DESC LIMIT 1
+        ''', (area_code,)).fetchone()
+        if row is None:
+            return None
+        # ほかのプロセス（先読みなど）が記録した版があれば復元し直す
+        latest = self._latest.get(area_code)
+        if latest is None or latest[0] != row[0]:
+            latest = (row[0], row[1], self._reconstruct(area_code, row[0], row[1]))
+            self._latest[area_code] = latest
+        return latest
+
+    # 復元 ---------------------------------------------------------------
+
+    def _reconstruct(self, area_code, version, report_datetime, start=None, end=None):
+        """版の時点の {時刻(UNIX 秒): 値のタプル} を復元する"""
+        reported = _timestamp(report_datetime)
+        start = max(start, reported - WINDOW_BEFORE.total_seconds()) if start is not None \
+            else reported - WINDOW_BEFORE.total_seconds()
+        end = min(end, reported + WINDOW_AFTER.total_seconds()) if end is not None \
+            else reported + WINDOW_AFTER.total_seconds()
+        # SQLite では MAX() と一緒に選んだ列は、最大の行の値になる
+        rows = self.conn.execute('''
+        SELECT forecast_time, field, value, MAX(version) FROM forecast_changes
+        WHERE area_code = ? AND forecast_time BETWEEN ? AND ? AND version <= ?
+        GROUP BY forecast_time, field
+        ''', (area_code, int(start), int(end), version)).fetchall()
+
+        cells = {}
+        for timestamp, field, value, _ in rows:
+            cells.setdefault(timestamp, [None] * (len(FIELDS) + 1))[field] = value
+        return {timestamp: tuple(values[1:]) for timestamp, values in cells.items()
+                if values[PRESENT] is not None}
+
+    def _version_at(self, area_code, as_of):
+        """as_of 以前で最新の版の (版, 発表日時) を返す"""
+        query = 'SELECT id, report_datetime FROM forecast_versions WHERE area_code = ?'
+        params = [area_code]
+        if as_of is not None:
+            if isinstance(as_of, datetime):
+                as_of = as_of.astimezone(JST).isoformat()
+            query += ' AND report_datetime <= ?'
+            params.append(as_of)
+        query += ' ORDER BY report_datetime DESC LIMIT 1'
+        return self.conn.execute(query, params).fetchone()
+
+    def snapshot(self, area_code, as_of=None):
+        """as_of（発表日時）の時点で最新だった予報を返す
+
+        (発表日時, [(時刻, 天気コード, 天気, 気温, 降水確率), ...]) を返す。
+        as_of を省略すると最新の版。該当する版がなければ None。
+        """
+        try:
+            with self.db.lock:
+                row = self._version_at(area_code, as_of)
+                if row is None:
+                    return None
+                cells = self._reconstruct(area_code, row[0], row[1])
+        except sqlite3.Error as e:
+            print(f"予報履歴取得エラー: {e}")
+            return None
+        return row[1], [(_isoformat(timestamp),) + values
+                        for timestamp, values in sorted(cells.items())]
+
+    def versions(self, area_code):
+        """記録した版の (発表日時, 記録した時刻, 変わったセルの数) を新しい順に返す"""
+        with self.db.lock:
+            return self.conn.execute('''
+            SELECT report_datetime, archived_at, changes FROM forecast_versions
+            WHERE area_code = ? ORDER BY report_datetime DESC
+            ''', (area_code,)).fetchall()
+
+    def replay(self, area_code):
+        """記録した版を古い順にたどり、(発表日時, 行のリスト) を返す
+
+        行は weather_forecasts と同じ (地域, 日付, 時刻, 天気コード, 天気, 気温, 降水確率)。
+        """
+        with self.db.lock:
+            versions = self.conn.execute('''
+            SELECT id, report_datetime FROM forecast_versions
+            WHERE area_code = ? ORDER BY report_datetime
+            ''', (area_code,)).fetchall()
+        for version, report_datetime in versions:
+            with self.db.lock:
+                cells = self._reconstruct(area_code, version, report_datetime)
+            rows = []
+            for timestamp, values in sorted(cells.items()):
+                forecast_time = _isoformat(timestamp)
+                rows.append((area_code, forecast_time[:10], forecast_time) + values)
+            yield report_datetime, rows
+
+    def date_history(self, area_code, date):
+        """date（YYYY-MM-DD）の予報が発表ごとにどう変わったかを返す
+
+        その日の予報が変わった版ごとに (発表日時, [(時刻, 天気コード, 天気, 気温, 降水確率), ...])
+        を新しい順に返す。
+        """
+        start = _timestamp(f"{date}T00:00:00+09:00")
+        end = start + 24 * 60 * 60 - 1
+        history = []
+        try:
+            with self.db.lock:
+                versions = self.conn.execute('''
+                SELECT DISTINCT v.id, v.report_datetime
+                FROM forecast_changes c JOIN forecast_versions v ON v.id = c.version
+                WHERE c.area_code = ? AND c.forecast_time BETWEEN ? AND ?
+                ORDER BY v.report_datetime DESC
+                ''', (area_code, start, end)).fetchall()
+                for version, report_datetime in versions:
+                    cells = self._reconstruct(area_code, version, report_datetime, start, end)
+                    if cells:
+                        history.append((report_datetime, [(_isoformat(timestamp),) + values
+                                                          for timestamp, values in sorted(cells.items())]))
+        except sqlite3.Error as e:
+            print(f"予報履歴取得エラー: {e}")
+        return history
@@ -0,0 +1,222 @@
+"""気象庁の天気予報 JSON の解析
+
+気象庁の timeSeries は「時刻の配列」と「値の配列」が並んだ列指向の形を
+している。parse_forecast_columns はその形のまま、地域と系列ごとに
+ForecastSeries（__slots__ の軽いオブジェクト）にまとめる。文字列の配列は
+JSON のリストをそのまま参照し、気温と降水確率は数値の配列（欠損は NaN）にする。
+時刻ごとの dict や "情報なし" の文字列は作らない。
+
+iter_forecast_stream はファイルから 1 件ずつ JSON を読み込むので、
+全地域分をまとめたファイルでも一度にすべてを読み込まずに済む。
+"""
+
+import json
+import math
+from array import array
+from collections import defaultdict
+from itertools import chain, repeat
+
+# 欠損値の表示
+MISSING = "情報なし"
+# ストリームから一度に読み込む文字数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def _numbers(values):
+    """文字列の配列を数値の配列にする（空文字や数値でないものは NaN）"""
+    try:
+        return array("d", map(float, values))
+    except (TypeError, ValueError):
+        pass
+    # 数値でないものが混ざっているときだけ 1 件ずつ変換する
+    numbers = array("d")
+    for value in values:
+        try:
+            numbers.append(float(value))
+        except (TypeError, ValueError):
+            numbers.append(math.nan)
+    return numbers
+
+
+def _padded(values, length):
+    """列を length 件にそろえる（足りない分とない列は None）"""
+    if values is None:
+        return repeat(None, length)
+    if len(values) < length:
+        return chain(values, repeat(None, length - len(values)))
+    return values
+
+
+class ForecastSeries:
+    """1 つの系列（timeSeries）の 1 地域分の予報"""
+
+    __slots__ = ("report_datetime", "area_code", "area_name", "times",
+                 "weather_codes", "weathers", "winds", "waves", "reliabilities",
+                 "temps", "pops")
+
+    def __init__(self, report_datetime, area, times):
+        self.report_datetime = report_datetime
+        info = area.get("area", {})
+        self.area_code = info.get("code")
+        self.area_name = info.get("name", "不明")
+        self.times = times
+        # 文字列の列は JSON のリストをそのまま使う（ない列は None）
+        self.weather_codes = area.get("weatherCodes")
+        self.weathers = area.get("weathers")
+        self.winds = area.get("winds")
+        self.waves = area.get("waves")
+        self.reliabilities = area.get("reliabilities")
+        temps = area.get("temps")
+        pops = area.get("pops")
+        self.temps = _numbers(temps) if temps is not None else None
+        self.pops = _numbers(pops) if pops is not None else None
+
+    def __len__(self):
+        return len(self.times)
+
+    def text(self, column, index):
+        """文字列の列の値（ない場合は None）"""
+        values = getattr(self, column)
+        if values is None or index >= len(values):
+            return None
+        return values[index]
+
+    def number(self, column, index):
+        """数値の列の値（ない場合は None）"""
+        values = getattr(self, column)
+        if values is None or index >= len(values) or math.isnan(values[index]):
+            return None
+        return values[index]
+
+    def rows(self):
+        """(日付, 時刻, 天気コード, 天気, 気温, 降水確率) を順に返す（欠損は None）"""
+        times = self.times
+        length = len(times)
+        temps = self.temps
+        pops = self.pops
+        if temps is not None:
+            temps = [None if math.isnan(v) else v for v in temps]
+        if pops is not None:
+            pops = [None if math.isnan(v) else v for v in pops]
+        return zip([time_define[:10] for time_define in times], times,
+                   _padded(self.weather_codes, length), _padded(self.weathers, length),
+                   _padded(temps, length), _padded(pops, length))
+
+    def __repr__(self):
+        return f"ForecastSeries({self.area_code!r}, {self.area_name!r}, {len(self)} 件)"
+
+
+def parse_forecast_columns(weather_data):
+    """天気情報を地域・系列ごとの ForecastSeries のリストにする"""
+    if not weather_data:
+        return []
+    series_list = []
+    for weather_entry in weather_data:
+        report_datetime = weather_entry.get("reportDatetime")
+        for series in weather_entry.get("timeSeries", []):
+            times = series.get("timeDefines", [])
+            for area in series.get("areas", []):
+                series_list.append(ForecastSeries(report_datetime, area, times))
+    return series_list
+
+
+def forecast_rows(series_list):
+    """ForecastSeries のリストから、保存用の行を順に返す"""
+    for series in series_list:
+        yield from series.rows()
+
+
+def _display(value):
+    """表示用の文字列にする（None と空文字列は "情報なし"、整数の気温は小数点なし）"""
+    if value is None or value == "":
+        return MISSING
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def parse_weather_data(weather_data, extra_columns=()):
+    """天気情報を辞書形式で解析し、日付ごとにグループ化する関数
+
+    extra_columns に (キー, ForecastSeries の文字列の列) の組を渡すと、
+    その列も加える（例: ("wind", "winds")）。
+    """
+    series_list = parse_forecast_columns(weather_data)
+    if not series_list:
+        return None
+
+    weather_dict = defaultdict(list)
+    for series in series_list:
+        for index, (date, time_define, weather_code, weather, temp, pop) in enumerate(series.rows()):
+            forecast = {
+                "datetime": time_define,
+                "weather_code": _display(weather_code),
+                "weather": _display(weather),
+                "temp": _display(temp),
+                "pop": _display(pop),
+            }
+            for key, column in extra_columns:
+                forecast[key] = _display(series.text(column, index))
+            weather_dict[date].append(forecast)
+    return weather_dict
+
+
+def iter_json_values(fp, chunk_size=STREAM_CHUNK_SIZE):
+    """ファイルから JSON の値を 1 件ずつ読み込んで返す
+
+    最上位が配列ならその要素を 1 件ずつ返す。JSON Lines のように
+    値が並んでいるだけのファイルにも使える。
+    """
+    buffer = ""
+    position = 0
+    depth = 0  # 最上位の配列の中にいるかどうか
+    eof = False
+    while True:
+        # 空白と区切り文字を読み飛ばす
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "[" and depth == 0:
+            depth = 1
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == "]" and depth == 1:
+            depth = 0
+            position += 1
+            continue
+
+        if position < len(buffer):
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # 値が途中で切れていないことを確かめる（数値は次の文字まで読む必要がある）
+                if end < len(buffer) or eof:
+                    yield value
+                    position = end
+                    continue
+
+        if eof:
+            return
+        # 大きな値の途中なら読み込む量を増やす（同じ部分を何度も解析し直さないように）
+        chunk = fp.read(max(chunk_size, len(buffer) - position))
+        if not chunk:
+            eof = True
+        # 読み終えた部分を捨ててから足す
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_forecast_stream(fp, chunk_size=STREAM_CHUNK_SIZE):
+    """ファイルから天気予報を読み込み、ForecastSeries を順に返す
+
+    1 地域の予報（発表ごとの配列）を並べたファイルでも、
+    全地域分を 1 つの配列にしたファイルでも読める。
+    """
+    for value in iter_json_values(fp, chunk_size):
+        # 1 地域分の予報は発表（reportDatetime）ごとの配列
+        reports = value if isinstance(value, list) else [value]
+        yield from parse_forecast_columns(reports)
@@ -0,0 +1,340 @@
+"""天気予報の集計表（ダッシュボード用）
+
+weather_forecasts の行を毎回集計すると、何年分もたまったときに遅くなる。
+ForecastRollups は保存のたびに、その発表で変わった分だけ集計表を更新する。
+
+- daily_rollups: 地域・日付ごとの気温の最低・最高・合計と降水確率の最高・合計
+- daily_pop_histogram: 地域・日付ごとの降水確率の分布（10% 刻みの件数）
+- forecast_drift: 発表ごとの、対象日の予報（何日前の発表か、最低・最高気温、降水確率）
+- forecast_accuracy: 対象日を過ぎた予報について、最後の発表との差を
+  「何日前の発表か」ごとに月単位で合計したもの
+
+weather_forecasts は同じ時刻の行を上書きするので、日ごとの集計は足し込まずに、
+保存した日付の分だけ索引から計算し直す（1 回の保存で数日分）。
+"""
+
+import sqlite3
+from datetime import date as Date
+
+# 降水確率の分布の区切り（0, 10, ..., 100%）
+POP_BUCKETS = 11
+
+
+def _lead_days(report_datetime, target_date):
+    """発表日から対象日までの日数"""
+    return (Date.fromisoformat(target_date) - Date.fromisoformat(report_datetime[:10])).days
+
+
+def _mean(total, count):
+    return total / count if count else None
+
+
+class ForecastRollups:
+    """WeatherDatabase と同じファイルに置く、保存のたびに更新する集計表"""
+
+    def __init__(self, db):
+        self.db = db  # 接続とロックは WeatherDatabase のものを使う
+        if self.create_tables():
+            self.rebuild()
+
+    @property
+    def conn(self):
+        return self.db.conn
+
+    def create_tables(self):
+        """集計表を作る。新しく作ったときは True を返す"""
+        with self.db.lock, self.conn:
+            created = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_rollups'"
+            ).fetchone() is None
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                area_code TEXT NOT NULL,
+                forecast_date TEXT NOT NULL,
+                min_temp REAL,
+                max_temp REAL,
+                temp_sum REAL NOT NULL,
+                temp_count INTEGER NOT NULL,
+                max_pop INTEGER,
+                pop_sum INTEGER NOT NULL,
+                pop_count INTEGER NOT NULL,
+                PRIMARY KEY (area_code, forecast_date)
+            ) WITHOUT ROWID
+            ''')
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS daily_pop_histogram (
+                area_code TEXT NOT NULL,
+                forecast_date TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (area_code, forecast_date, bucket)
+            ) WITHOUT ROWID
+            ''')
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecast_drift (
+                area_code TEXT NOT NULL,
+                target_date TEXT NOT NULL,
+                report_datetime TEXT NOT NULL,
+                lead_days INTEGER NOT NULL,
+                weather_code TEXT,
+                min_temp REAL,
+                max_temp REAL,
+                max_pop INTEGER,
+                PRIMARY KEY (area_code, target_date, report_datetime)
+            ) WITHOUT ROWID
+            ''')
+            # 月 = 対象日の年月（YYYY-MM）
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecast_accuracy (
+                area_code TEXT NOT NULL,
+                month TEXT NOT NULL,
+                lead_days INTEGER NOT NULL,
+                temp_count INTEGER NOT NULL,
+                temp_error_sum REAL NOT NULL,
+                temp_bias_sum REAL NOT NULL,
+                pop_count INTEGER NOT NULL,
+                pop_error_sum INTEGER NOT NULL,
+                PRIMARY KEY (area_code, month, lead_days)
+            ) WITHOUT ROWID
+            ''')
+            # 地域ごとに、どの対象日まで forecast_accuracy に足し込んだか
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                area_code TEXT PRIMARY KEY,
+                finalized_through TEXT NOT NULL
+            )
+            ''')
+        return created
+
+    # 更新 ---------------------------------------------------------------
+
+    def update_in_transaction(self, area_code, report_datetime, rows, new_report=True):
+        """保存した行の分だけ集計表を更新する（呼び出し側がロックを持ち、トランザクションを開始していること）
+
+        rows は weather_forecasts に挿入した (地域, 日付, 時刻, 天気コード, 天気, 気温, 降水確率)。
+        new_report が偽（すでに記録した発表か、それより古い発表）なら、
+        日ごとの集計だけを更新する。
+        """
+        dates = sorted({row[1] for row in rows})
+        if not dates:
+            return
+        self._refresh_days(area_code, dates[0], dates[-1])
+        if new_report and report_datetime:
+            self._record_drift(area_code, report_datetime, rows)
+            self._finalize(area_code, report_datetime[:10])
+
+    def _refresh_days(self, area_code, start_date, end_date):
+        """日付の範囲の集計を weather_forecasts から計算し直す（索引だけを読む）"""
+        params = (area_code, start_date, end_date)
+        self.conn.execute('''
+        INSERT OR REPLACE INTO daily_rollups
+        SELECT area_code, forecast_date,
+               MIN(temperature), MAX(temperature), TOTAL(temperature), COUNT(temperature),
+               MAX(precipitation_probability), TOTAL(precipitation_probability),
+               COUNT(precipitation_probability)
+        FROM weather_forecasts
+        WHERE area_code = ? AND forecast_date BETWEEN ? AND ?
+        GROUP BY forecast_date
+        ''', params)
+        self.conn.execute('''
+        DELETE FROM daily_pop_histogram
+        WHERE area_code = ? AND forecast_date BETWEEN ? AND ?
+        ''', params)
+        self.conn.execute(f'''
+        INSERT INTO daily_pop_histogram
+        SELECT area_code, forecast_date,
+               MIN(precipitation_probability / 10, {POP_BUCKETS - 1}) AS bucket, COUNT(*)
+        FROM weather_forecasts
+        WHERE area_code = ? AND forecast_date BETWEEN ? AND ?
+              AND precipitation_probability IS NOT NULL
+        GROUP BY forecast_date, bucket
+        ''', params)
+
+    def _record_drift(self, area_code, report_datetime, rows):
+        """この発表での対象日ごとの予報を記録する"""
+        days = {}
+        for _, forecast_date, _, weather_code, _, temperature, pop in rows:
+            day = days.setdefault(forecast_date, [None, None, None, None])
+            if day[0] is None:
+                day[0] = weather_code  # 最初の系列（日ごとの天気）の天気コード
+            if temperature is not None:
+                day[1] = temperature if day[1] is None else min(day[1], temperature)
+                day[2] = temperature if day[2] is None else max(day[2], temperature)
+            if pop is not None:
+                day[3] = pop if day[3] is None else max(day[3], pop)
+        drift = []
+        for forecast_date, values in days.items():
+            try:
+                lead_days = _lead_days(report_datetime, forecast_date)
+            except ValueError:
+                continue  # 日付として読めないものは記録しない
+            if lead_days >= 0:  # 発表日より前の日は予報ではない
+                drift.append((area_code, forecast_date, report_datetime, lead_days, *values))
+        self.conn.executemany('''
+        INSERT OR REPLACE INTO forecast_drift
+        (area_code, target_date, report_datetime, lead_days, weather_code, min_temp, max_temp, max_pop)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', drift)
+
+    def _finalize(self, area_code, report_date):
+        """report_date より前の対象日を確定し、最後の発表との差を forecast_accuracy に足す"""
+        row = self.conn.execute(
+            'SELECT finalized_through FROM rollup_state WHERE area_code = ?',
+            (area_code,)).fetchone()
+        finalized_through = row[0] if row else ''
+        drift = self.conn.execute('''
+        SELECT target_date, lead_days, max_temp, max_pop FROM forecast_drift
+        WHERE area_code = ? AND target_date > ? AND target_date < ?
+        ORDER BY target_date, report_datetime DESC
+        ''', (area_code, finalized_through, report_date)).fetchall()
+        if not drift:
+            return
+
+        totals = {}  # (月, 何日前) → [気温の件数, 誤差の合計, 偏りの合計, 降水確率の件数, 誤差の合計]
+        final = None
+        for target_date, lead_days, max_temp, max_pop in drift:
+            if final is None or final[0] != target_date:
+                final = (target_date, max_temp, max_pop)  # 最後の発表（対象日ごとに最初の行）
+                continue
+            total = totals.setdefault((target_date[:7], lead_days), [0, 0.0, 0.0, 0, 0])
+            if max_temp is not None and final[1] is not None:
+                total[0] += 1
+                total[1] += abs(max_temp - final[1])
+                total[2] += max_temp - final[1]
+            if max_pop is not None and final[2] is not None:
+                total[3] += 1
+                total[4] += abs(max_pop - final[2])
+
+        self.conn.executemany('''
+        INSERT INTO forecast_accuracy
+        (area_code, month, lead_days, temp_count, temp_error_sum, temp_bias_sum, pop_count, pop_error_sum)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (area_code, month, lead_days) DO UPDATE SET
+            temp_count = temp_count + excluded.temp_count,
+            temp_error_sum = temp_error_sum + excluded.temp_error_sum,
+            temp_bias_sum = temp_bias_sum + excluded.temp_bias_sum,
+            pop_count = pop_count + excluded.pop_count,
+            pop_error_sum = pop_error_sum + excluded.pop_error_sum
+        ''', [(area_code, month, lead_days, *total) for (month, lead_days), total in totals.items()])
+        self.conn.execute('''
+        INSERT OR REPLACE INTO rollup_state (area_code, finalized_through) VALUES (?, ?)
+        ''', (area_code, drift[-1][0]))
+
+    def rebuild(self, area_code=None):
+        """集計表を保存済みのデータから作り直す（集計表を追加する前のデータベース用）
+
+        日ごとの集計は weather_forecasts から、発表ごとの予報は予報の履歴
+        （ForecastArchive）の版を古い順にたどって作る。
+        """
+        archive = getattr(self.db, "archive", None)
+        with self.db.lock, self.conn:
+            if area_code is None:
+                codes = [row[0] for row in self.conn.execute(
+                    'SELECT DISTINCT area_code FROM weather_forecasts')]
+            else:
+                codes = [area_code]
+            for code in codes:
+                for table in ("daily_rollups", "daily_pop_histogram", "forecast_drift",
+                              "forecast_accuracy", "rollup_state"):
+                    self.conn.execute(f'DELETE FROM {table} WHERE area_code = ?', (code,))
+                self._refresh_days(code, '', '9999-12-31')
+                if archive is None:
+                    continue
+                for report_datetime, rows in archive.replay(code):
+                    self._record_drift(code, report_datetime, rows)
+                    self._finalize(code, report_datetime[:10])
+
+    # 集計の取得 ---------------------------------------------------------
+
+    def _query(self, query, params):
+        try:
+            with self.db.lock:
+                return self.conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"天気予報集計エラー: {e}")
+            return []
+
+    @staticmethod
+    def _date_range(column, start, end, params):
+        """期間の条件を作る（省略した端は条件にしない）"""
+        condition = ''
+        if start:
+            condition += f' AND {column} >= ?'
+            params.append(start)
+        if end:
+            condition += f' AND {column} <= ?'
+            params.append(end)
+        return condition
+
+    def daily_summary(self, area_code, start_date=None, end_date=None):
+        """日ごとの (日付, 最低気温, 最高気温, 平均気温, 最高降水確率, 平均降水確率) を返す"""
+        params = [area_code]
+        condition = self._date_range('forecast_date', start_date, end_date, params)
+        rows = self._query(f'''
+        SELECT forecast_date, min_temp, max_temp, temp_sum, temp_count, max_pop, pop_sum, pop_count
+        FROM daily_rollups WHERE area_code = ?{condition} ORDER BY forecast_date
+        ''', params)
+        return [(day, min_temp, max_temp, _mean(temp_sum, temp_count), max_pop,
+                 _mean(pop_sum, pop_count))
+                for day, min_temp, max_temp, temp_sum, temp_count, max_pop, pop_sum, pop_count
+                in rows]
+
+    def monthly_summary(self, area_code, start_date=None, end_date=None):
+        """月ごとの (年月, 最低気温, 最高気温, 平均気温, 最高降水確率, 平均降水確率) を返す"""
+        params = [area_code]
+        condition = self._date_range('forecast_date', start_date, end_date, params)
+        rows = self._query(f'''
+        SELECT substr(forecast_date, 1, 7) AS month, MIN(min_temp), MAX(max_temp),
+               SUM(temp_sum), SUM(temp_count), MAX(max_pop), SUM(pop_sum), SUM(pop_count)
+        FROM daily_rollups WHERE area_code = ?{condition}
+        GROUP BY month ORDER BY month
+        ''', params)
+        return [(month, min_temp, max_temp, _mean(temp_sum, temp_count), max_pop,
+                 _mean(pop_sum, pop_count))
+                for month, min_temp, max_temp, temp_sum, temp_count, max_pop, pop_sum, pop_count
+                in rows]
+
+    def pop_distribution(self, area_code, start_date=None, end_date=None):
+        """期間内の降水確率の分布を返す（0%, 10%, ..., 100% ごとの件数のリスト）"""
+        params = [area_code]
+        condition = self._date_range('forecast_date', start_date, end_date, params)
+        counts = [0] * POP_BUCKETS
+        for bucket, count in self._query(f'''
+        SELECT bucket, SUM(count) FROM daily_pop_histogram
+        WHERE area_code = ?{condition} GROUP BY bucket
+        ''', params):
+            counts[bucket] = count
+        return counts
+
+    def forecast_drift(self, area_code, target_date):
+        """target_date の予報が発表ごとにどう変わったかを古い順に返す
+
+        (発表日時, 何日前の発表か, 天気コード, 最低気温, 最高気温, 最高降水確率) のリスト。
+        """
+        return self._query('''
+        SELECT report_datetime, lead_days, weather_code, min_temp, max_temp, max_pop
+        FROM forecast_drift WHERE area_code = ? AND target_date = ?
+        ORDER BY report_datetime
+        ''', (area_code, target_date))
+
+    def accuracy_by_lead(self, area_code, start_month=None, end_month=None):
+        """何日前の発表かごとに、最後の発表との差を返す（対象日を過ぎた予報だけ）
+
+        {何日前: {"temp_count", "temp_mae", "temp_bias", "pop_count", "pop_mae"}} を返す。
+        start_month と end_month は YYYY-MM。
+        """
+        params = [area_code]
+        condition = self._date_range('month', start_month, end_month, params)
+        rows = self._query(f'''
+        SELECT lead_days, SUM(temp_count), SUM(temp_error_sum), SUM(temp_bias_sum),
+               SUM(pop_count), SUM(pop_error_sum)
+        FROM forecast_accuracy WHERE area_code = ?{condition}
+        GROUP BY lead_days ORDER BY lead_days
+        ''', params)
+        return {lead_days: {"temp_count": temp_count,
+                            "temp_mae": _mean(temp_error_sum, temp_count),
+                            "temp_bias": _mean(temp_bias_sum, temp_count),
+                            "pop_count": pop_count,
+                            "pop_mae": _mean(pop_error_sum, pop_count)}
+                for lead_days, temp_count, temp_error_sum, temp_bias_sum, pop_count, pop_error_sum
+                in rows}
@@ -0,0 +1,210 @@
+"""気象庁の発表時刻に合わせて天気予報を更新するスケジューラ
+
+気象庁の府県天気予報は毎日 5 時・11 時・17 時（日本時間）に発表される。
+ForecastScheduler は発表の少し後に各地域（office）の予報を取得して
+WeatherDatabase に保存しておくので、利用者が開いたときには新しい予報が
+すでにデータベースにある。
+
+- 地域ごとに発表時刻からのずれ（SPREAD 以内）をコードから決めて、
+  取得が一度に集中しないようにする。さらに取得と取得の間は
+  MIN_INTERVAL 以上あける
+- 保存済みの発表日時（reportDatetime）がすでに最新の発表のものなら取得しない。
+  取得しても発表日時が変わっていなければ保存せず、少し後にやり直す
+"""
+
+import heapq
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import jma_client
+from forecast_parser import forecast_rows, parse_forecast_columns
+from jma_client import fetch_json
+
+JST = timezone(timedelta(hours=9))
+# 発表時刻（日本時間の時, 分）
+PUBLISH_TIMES = ((5, 0), (11, 0), (17, 0))
+# 発表から取得を始めるまでの時間（発表直後はまだ反映されていないことがある）
+PUBLISH_DELAY = timedelta(minutes=5)
+# 地域ごとの取得をこの時間の中に散らす
+SPREAD = timedelta(minutes=10)
+# 取得と取得の間の最小の間隔（秒）
+MIN_INTERVAL = 1.0
+# 発表日時が変わっていなかったときにやり直すまでの時間と、やり直す期限
+RETRY_INTERVAL = timedelta(minutes=10)
+RETRY_LIMIT = timedelta(hours=2)
+
+# アプリのプロセスで 1 つだけ動かすスケジューラ
+_app_scheduler = None
+_app_scheduler_lock = threading.Lock()
+
+
+def latest_publish(now=None):
+    """now 以前で最も新しい発表時刻（日本時間）"""
+    now = (now or datetime.now(JST)).astimezone(JST)
+    for days in (0, 1):
+        day = now - timedelta(days=days)
+        for hour, minute in reversed(PUBLISH_TIMES):
+            published = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if published <= now:
+                return published
+    raise AssertionError("発表時刻が見つかりません")  # PUBLISH_TIMES が空でなければ起きない
+
+
+def next_publish(now=None):
+    """now より後で最も早い発表時刻（日本時間）"""
+    now = (now or datetime.now(JST)).astimezone(JST)
+    for days in (0, 1):
+        day = now + timedelta(days=days)
+        for hour, minute in PUBLISH_TIMES:
+            published = day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if published > now:
+                return published
+    raise AssertionError("発表時刻が見つかりません")
+
+
+def spread_offset(code):
+    """地域コードから決まる、発表時刻からのずれ（地域ごとに毎回同じ）"""
+    return timedelta(seconds=zlib.crc32(code.encode()) % int(SPREAD.total_seconds()))
+
+
+def parse_report_datetime(value):
+    """発表日時の文字列を datetime にする（ないときは None）"""
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+class ForecastScheduler:
+    """地域ごとに次の取得時刻を管理し、バックグラウンドで順に取得する"""
+
+    def __init__(self, db, codes, fetch=fetch_json, min_interval=MIN_INTERVAL):
+        self.db = db  # WeatherDatabase（スレッドをまたいで使える）
+        self.fetch = fetch
+        self.min_interval = min_interval
+        self._queue = []  # (取得する時刻, 地域コード) のヒープ
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {"fetched": 0, "saved": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+        for code in codes:
+            self._push(self._first_due(code), code)
+
+    # 予定の管理 -------------------------------------------------------
+
+    def _push(self, due, code):
+        with self._lock:
+            heapq.heappush(self._queue, (due, code))
+        self._wakeup.set()
+
+    def _first_due(self, code, now=None):
+        """起動時の取得予定（最新の発表のものがなければ今から散らして取得する）"""
+        now = now or datetime.now(JST)
+        if self._is_current(code, now):
+            return self._due_after(code, now)
+        return now + spread_offset(code)
+
+    def _due_after(self, code, now):
+        """次の発表の後の取得予定"""
+        return next_publish(now) + PUBLISH_DELAY + spread_offset(code)
+
+    def _is_current(self, code, now):
+        """保存済みの予報が最新の発表のものかどうか"""
+        last_fetch = self.db.get_last_fetch(code)
+        if last_fetch is None:
+            return False
+        reported = parse_report_datetime(last_fetch[0])
+        return reported is not None and reported >= latest_publish(now)
+
+    def pending(self):
+        """(取得する時刻, 地域コード) の予定を早い順に返す"""
+        with self._lock:
+            return sorted(self._queue)
+
+    # 取得 ---------------------------------------------------------------
+
+    def refresh(self, code, now=None):
+        """1 地域を取得して保存し、次の取得予定を返す"""
+        now = now or datetime.now(JST)
+        if self._is_current(code, now):
+            # ほかの経路（先読みや画面からの取得）で最新になっている
+            self.stats["skipped"] += 1
+            return self._due_after(code, now)
+
+        previous = self.db.get_last_fetch(code)
+        try:
+            data = self.fetch(jma_client.FORECAST_URL.format(code))
+        except (requests.RequestException, ValueError) as e:
+            print(f"[WARN] {code} の天気予報の更新に失敗しました: {e}")
+            self.stats["failed"] += 1
+            return now + RETRY_INTERVAL
+        self.stats["fetched"] += 1
+
+        series_list = parse_forecast_columns(data)
+        report_datetime = series_list[0].report_datetime if series_list else None
+        if previous is not None and report_datetime == previous[0]:
+            # まだ新しい予報が出ていない。期限まではしばらくしてからやり直す
+            self.stats["unchanged"] += 1
+            if now - latest_publish(now) < RETRY_LIMIT:
+                return now + RETRY_INTERVAL
+            return self._due_after(code, now)
+
+        if series_list:
+            self.db.save_forecast_rows(code, forecast_rows(series_list), report_datetime)
+            self.stats["saved"] += 1
+        return self._due_after(code, now)
+
+    def run_pending(self, now=None):
+        """予定の時刻を過ぎた地域を 1 件だけ取得する。次の予定までの秒数を返す"""
+        now = now or datetime.now(JST)
+        with self._lock:
+            if not self._queue:
+                return None
+            due, code = self._queue[0]
+            if due > now:
+                return (due - now).total_seconds()
+            heapq.heappop(self._queue)
+        self._push(self.refresh(code, now), code)
+        return 0.0
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # 予定の追加で起こされたら待つ時間を計算し直す
+            self._wakeup.clear()
+            wait = self.run_pending()
+            if wait == 0.0:
+                # 続けて取得するときも間隔をあける
+                self._stopped.wait(self.min_interval)
+                continue
+            self._wakeup.wait(wait)
+
+    def start(self):
+        """バックグラウンドのスレッドで動かし始める"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="forecast-scheduler",
+                                            daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+
+def start_scheduler_once(db, codes):
+    """プロセスで最初の呼び出しのときだけスケジューラを動かし始め、それを返す
+
+    Flet はセッション（ウィンドウやタブ）ごとに main を呼ぶので、アプリからは
+    こちらを使い、セッションの数だけ気象庁に同じ取得を送らないようにする。
+    db は最初の呼び出しのものをプロセスが終わるまで使う。
+    """
+    global _app_scheduler
+    with _app_scheduler_lock:
+        if _app_scheduler is None:
+            _app_scheduler = ForecastScheduler(db, codes)
+            _app_scheduler.start()
+        return _app_scheduler
@@ -0,0 +1,131 @@
+"""天気予報の結果を表示する ListView（天気アプリ共通）
+
+表示する行は最初の PAGE_SIZE 件だけ作り、残りはスクロールして
+末尾に近づいたときに追加する。行のコントロールは使い回し、
+地域を切り替えたときは文字や色などの値だけを書き換える。
+Flet は変わったプロパティと増減した行だけを送るので、
+全体を作り直すよりも送る量がずっと少ない。
+"""
+
+import threading
+
+import flet as ft
+
+# 一度に追加する行の数
+PAGE_SIZE = 30
+# 末尾からこの距離（ピクセル）まで来たら次の行を追加する
+LOAD_MORE_EXTENT = 300
+
+# カードに表示する項目: (見出し, キー, 単位, 色)
+FORECAST_FIELDS = (
+    ("時間", "datetime", "", "#374151"),
+    ("天気", "weather", "", "#1e40af"),
+    ("気温", "temp", "℃", "#d97706"),
+    ("降水確率", "pop", "%", "#dc2626"),
+)
+
+# 見出し行の種類ごとの (文字の大きさ, 色)
+HEADING_STYLES = {
+    "title": (20, "#0d9488"),
+    "date": (16, "#6d28d9"),
+    "message": (14, "red"),
+}
+
+
+class ForecastRow(ft.Container):
+    """結果の 1 行（見出しか予報のカード）。種類が変わっても使い回せる"""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.heading = ft.Text(weight="bold")
+        self.texts = [ft.Text(size=14, color=color) for _, _, _, color in fields]
+        self.card = ft.Card(
+            content=ft.Container(content=ft.Column(self.texts, spacing=5), padding=10),
+            width=350,
+            elevation=2,
+        )
+        super().__init__(content=ft.Column([self.heading, self.card], spacing=0))
+
+    def set_item(self, item):
+        """表示する内容を書き換える（変わった値だけが送られる）"""
+        kind, value = item
+        if kind == "forecast":
+            self.heading.visible = False
+            self.card.visible = True
+            for text, (label, key, unit, _) in zip(self.texts, self.fields):
+                text.value = f"{label}: {value.get(key, '情報なし')}{unit}"
+        else:
+            size, color = HEADING_STYLES[kind]
+            self.heading.visible = True
+            self.heading.value = value
+            self.heading.size = size
+            self.heading.color = color
+            self.card.visible = False
+
+
+class ForecastListView(ft.ListView):
+    """必要な分だけ行を作り、行を使い回して予報を表示する ListView"""
+
+    def __init__(self, fields=FORECAST_FIELDS, page_size=PAGE_SIZE, **kwargs):
+        kwargs.setdefault("spacing", 10)
+        kwargs.setdefault("padding", 20)
+        super().__init__(on_scroll=self._on_scroll, **kwargs)
+        self.fields = fields
+        self.page_size = page_size
+        self._items = []  # 表示する行の内容（("title" | "date" | "message" | "forecast", 値)）
+        self._rows = []  # 作成済みの行（使い回す）
+        self._shown = 0  # 表示中の行数
+        self._lock = threading.Lock()
+
+    @property
+    def item_count(self):
+        return len(self._items)
+
+    def show_items(self, items):
+        """行の内容を差し替えて、先頭から表示し直す"""
+        with self._lock:
+            self._items = list(items)
+            self._render(min(self.page_size, len(self._items)))
+        if self.page is not None:
+            self.scroll_to(offset=0, duration=0)
+
+    def show_forecasts(self, title, weather_dict):
+        """parse_weather_data の形の予報を日付ごとに表示する"""
+        items = [("title", title)]
+        for date, forecasts in weather_dict.items():
+            items.append(("date", f"日付: {date}"))
+            items.extend(("forecast", forecast) for forecast in forecasts)
+        self.show_items(items)
+
+    def show_message(self, message, title=None):
+        """メッセージを 1 行だけ表示する"""
+        items = [("title", title)] if title else []
+        items.append(("message", message))
+        self.show_items(items)
+
+    def append_message(self, message):
+        """今の表示の末尾にメッセージを足す"""
+        with self._lock:
+            all_shown = self._shown == len(self._items)
+            self._items.append(("message", message))
+            if all_shown:
+                self._render(self._shown + 1, self._shown)
+
+    def _render(self, count, start=0):
+        """先頭から count 行を表示する（start 行目から書き換え、足りない行だけ新しく作る）"""
+        while len(self._rows) < count:
+            self._rows.append(ForecastRow(self.fields))
+        for index in range(start, count):
+            self._rows[index].set_item(self._items[index])
+        self.controls = self._rows[:count]
+        self._shown = count
+        if self.page is not None:
+            self.update()
+
+    def _on_scroll(self, e):
+        """末尾に近づいたら次の行を追加する"""
+        if e.max_scroll_extent - e.pixels > LOAD_MORE_EXTENT:
+            return
+        with self._lock:
+            if self._shown < len(self._items):
+                self._render(min(self._shown + self.page_size, len(self._items)), self._shown)
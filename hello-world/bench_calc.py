@@ -0,0 +1,255 @@
+"""電卓コアのベンチマーク
+
+使い方:
+    python bench_calc.py              # 計測して基準値と比較（遅くなっていれば終了コード 1）
+    python bench_calc.py --save       # 計測結果を基準値として保存
+    python bench_calc.py -k sin       # 名前に sin を含むベンチマークだけ実行
+
+各ベンチマークについて ops/sec、1 回あたりの時間（最速の繰り返し best と、
+繰り返しごとの平均の p50 / p99。1 回ずつの時間のパーセンタイルではない）、
+1 回あたりに確保したメモリ（tracemalloc のピーク）を表示する。
+
+基準値との比較には繰り返しの中で最も速かった回（best）を使い、平均のように
+他のプロセスの影響で大きくぶれないようにする。さらに決まった処理（較正ループ）の
+速さで割って、マシンの速さの違いを打ち消す（CI など別のマシンでも同じ基準で判定する）。
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+import calc_core
+import calc_engine
+
+# 基準値ファイル
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+# 基準値からの低下をどこまで許すか（0.3 なら 30% 遅くなるまで許容）
+DEFAULT_TOLERANCE = 0.3
+# 1 回の計測で関数を呼ぶ回数と計測の繰り返し回数
+INNER_LOOPS = 200
+REPEATS = 50
+# メモリ計測で関数を呼ぶ回数
+ALLOC_CALLS = 200
+# 基準値ファイルで計測環境の情報を入れるキー
+META_KEY = "_meta"
+
+# ボタン操作のシーケンス（sin(π/6)+3²×2= と 1/3= と AC）
+KEY_SEQUENCE = ["sin", "π", "/", "6", "+", "3", "x²", "*", "2", "=",
+                "1", "/", "3", "=", "+/-", "AC"]
+
+
+def _benchmarks():
+    """ベンチマーク名と、引数なしで 1 回分の処理を行う関数の組を返す"""
+    benches = {}
+
+    for operator in ("+", "-", "*", "/", "x^y"):
+        benches[f"calculate[{operator}]"] = (
+            lambda op=operator: calc_core.calculate(7.25, 3.5, op))
+
+    for name in ("sin", "cos", "tan", "log", "ln", "√"):
+        expression = f"{name}(x)"
+        benches[f"evaluate[{expression}]"] = (
+            lambda expr=expression: calc_core.evaluate(expr, x=0.75))
+    benches["evaluate[x²]"] = lambda: calc_core.evaluate("x²", x=0.75)
+
+    benches["evaluate[formula]"] = lambda: calc_core.evaluate("sin(x)^2 + log(x) * 3 - 1/x", x=2.5)
+    benches["evaluate[formula,digits=12]"] = (
+        lambda: calc_core.evaluate("sin(x)^2 + log(x) * 3 - 1/x", 12, x=2.5))
+    benches["parse[uncached]"] = lambda: calc_engine.parse.__wrapped__("sin(x)^2 + log(x) * 3 - 1/x")
+
+    benches["format_number[int]"] = lambda: calc_core.format_number(42.0)
+    benches["format_number[float]"] = lambda: calc_core.format_number(0.1 + 0.2)
+
+    keypad = calc_core.Keypad()
+
+    def keypad_sequence():
+        for key in KEY_SEQUENCE:
+            keypad.press(key)
+    benches["keypad[sequence]"] = keypad_sequence
+
+    app = _headless_app()
+    if app is not None:
+        events = [types.SimpleNamespace(control=types.SimpleNamespace(data=key))
+                  for key in KEY_SEQUENCE]
+
+        def button_sequence():
+            for event in events:
+                app.button_clicked(event)
+        benches["button_clicked[sequence]"] = button_sequence
+
+    return benches
+
+
+def _headless_app():
+    """画面なしで CalculatorApp を作る（flet がなければ None）"""
+    try:
+        import main
+    except ImportError:
+        return None
+    app = main.CalculatorApp()
+    app.update = lambda: None  # ページに追加していないので描画しない
+    return app
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "ops_per_sec": round(1e9 * len(samples) / total, 1),
+        "best_us": round(samples[0] / 1000, 3),
+        # 1 回ずつではなく、繰り返しごとの平均のパーセンタイル
+        "mean_p50_us": round(samples[len(samples) // 2] / 1000, 3),
+        "mean_p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000, 3),
+    }
+
+
+def measure_all(funcs, inner=INNER_LOOPS, repeats=REPEATS):
+    """名前 → 関数の各関数について ops/sec とレイテンシ（マイクロ秒）を計測する
+
+    1 つずつ続けて計測すると、その間だけ他のプロセスが動いたときに結果がまとめてずれる。
+    繰り返しを関数の間で順番に回し、各関数の計測を全体の時間に散らばらせる。
+    """
+    for func in funcs.values():
+        for _ in range(inner):  # ウォームアップ（キャッシュを温める）
+            func()
+
+    samples = {name: [] for name in funcs}
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            for name, func in funcs.items():
+                start = time.perf_counter_ns()
+                for _ in range(inner):
+                    func()
+                samples[name].append((time.perf_counter_ns() - start) / inner)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {name: _summary(values) for name, values in samples.items()}
+
+
+def measure(func, inner=INNER_LOOPS, repeats=REPEATS):
+    """ops/sec とレイテンシのパーセンタイル（マイクロ秒）を計測する"""
+    return measure_all({"func": func}, inner, repeats)["func"]
+
+
+def _calibration_loop():
+    """マシンの速さを測るための決まった処理"""
+    total = 0
+    for i in range(200):
+        total += i * i % 7
+    return total
+
+
+def measure_allocations(func, calls=ALLOC_CALLS):
+    """1 回あたりに確保したメモリのピーク（バイト）と確保したブロック数の平均を計測する"""
+    func()
+    tracemalloc.start()
+    try:
+        peak_total = 0
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(calls):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - current
+        blocks_after = sys.getallocatedblocks()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_bytes": round(peak_total / calls, 1),
+        "retained_blocks": round((blocks_after - blocks_before) / calls, 3),
+    }
+
+
+def run(pattern=None):
+    """(ベンチマークごとの結果, 較正ループ 1 回の最速の時間) を返す"""
+    funcs = {name: func for name, func in _benchmarks().items()
+             if not pattern or pattern in name}
+    results = measure_all({**funcs, META_KEY: _calibration_loop})
+    calibration = results.pop(META_KEY)["best_us"]
+    for name, func in funcs.items():
+        results[name].update(measure_allocations(func))
+    return results, calibration
+
+
+def speed_ratio(name, result, baseline, scale=1.0):
+    """基準値に対する速さの比（1 より小さければ遅い）。基準値がなければ None
+
+    scale は今の較正ループの時間 / 基準値を記録したときの時間。
+    """
+    expected = baseline.get(name, {}).get("best_us")
+    if not expected or not result["best_us"]:
+        return None
+    return expected * scale / result["best_us"]
+
+
+def compare(results, baseline, tolerance, scale=1.0):
+    """基準値より遅くなったベンチマークの一覧 (名前, 比) を返す"""
+    regressions = []
+    for name, result in results.items():
+        ratio = speed_ratio(name, result, baseline, scale)
+        if ratio is not None and ratio < 1 - tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def print_table(results, baseline, scale=1.0):
+    print(f"{'benchmark':34} {'ops/sec':>12} {'best us':>9} {'p50/rep':>9} {'p99/rep':>9} "
+          f"{'alloc B':>9} {'vs base':>8}")
+    for name, r in results.items():
+        ratio = speed_ratio(name, r, baseline, scale)
+        ratio = f"{ratio:7.2f}x" if ratio is not None else "      -"
+        print(f"{name:34} {r['ops_per_sec']:12,.0f} {r['best_us']:9.3f} {r['mean_p50_us']:9.3f} "
+              f"{r['mean_p99_us']:9.3f} {r['alloc_bytes']:9.0f} {ratio:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電卓コアのベンチマーク")
+    parser.add_argument("-k", dest="pattern", help="名前にこの文字列を含むベンチマークだけ実行")
+    parser.add_argument("--save", action="store_true", help="結果を基準値として保存する")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準値ファイル")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="許容する速度低下の割合")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    meta = baseline.get(META_KEY, {})
+
+    results, calibration = run(args.pattern)
+    scale = calibration / meta["calibration_us"] if meta.get("calibration_us") else 1.0
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results, baseline, scale)
+
+    if args.save:
+        baseline.update(results)
+        baseline[META_KEY] = {"calibration_us": calibration}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"基準値を保存しました: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, scale)
+    for name, ratio in regressions:
+        print(f"[REGRESSION] {name}: 基準値の {ratio:.2f} 倍の速さ"
+              f"（best {results[name]['best_us']:.3f} us, 基準値 {baseline[name]['best_us']:.3f} us）",
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+from functools import lru_cache
+
+import numpy as np
+
+import calc_engine
+
+# 科学計算用の関数を NumPy の ufunc に対応させる
+# 値は (関数, 定義域外を判定する関数)
+NUMPY_FUNCTIONS = {
+    "sin": (np.sin, None),
+    "cos": (np.cos, None),
+    "tan": (np.tan, None),
+    "log": (np.log10, lambda x: x <= 0),
+    "ln": (np.log, lambda x: x <= 0),
+    "√": (np.sqrt, lambda x: x < 0),
+    "sqrt": (np.sqrt, lambda x: x < 0),
+}
+
+
+class BatchResult:
+    """一括評価の結果（値の配列とエラー位置のマスク）"""
+
+    __slots__ = ("values", "errors")
+
+    def __init__(self, values, errors):
+        self.values = values  # float64 の配列（エラーの要素は NaN）
+        self.errors = errors  # エラーになった要素が True の配列
+
+    def __len__(self):
+        # 変数のない式は 0 次元の配列になるので len は使えない
+        return int(np.size(self.values))
+
+    def formatted(self):
+        """format_number と同じ規則で整形した結果のリストを返す（エラーは "Error"）"""
+        return format_numbers(self.values, self.errors)
+
+
+def _divide(left, right):
+    errors = right == 0
+    return np.divide(left, right), errors
+
+
+def _power(left, right):
+    # 負の底に整数でない指数は実数にならない
+    errors = (left < 0) & (right != np.floor(right))
+    # 0 の負の累乗はゼロ除算
+    errors |= (left == 0) & (right < 0)
+    return np.power(left, right), errors
+
+
+def _with_errors(func):
+    def wrapper(left, right):
+        return func(left, right), None
+    return wrapper
+
+
+NUMPY_BINARY_OPS = {
+    "+": _with_errors(np.add),
+    "-": _with_errors(np.subtract),
+    "*": _with_errors(np.multiply),
+    "/": _divide,
+    "^": _power,
+}
+
+NUMPY_POSTFIX_OPS = {
+    "²": np.square,
+    "%": lambda x: np.divide(x, 100),
+}
+
+
+def _merge(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a | b
+
+
+def _compile_node(node):
+    """構文木を配列全体に対するクロージャに変換する。戻り値は (値, エラーマスク)"""
+    kind = node[0]
+    if kind == "num":
+        value = np.float64(node[1])
+        return lambda env: (value, None)
+
+    if kind == "const":
+        value = np.float64(calc_engine.CONSTANTS[node[1]])
+        return lambda env: (value, None)
+
+    if kind == "var":
+        name = node[1]
+        return lambda env: (env[name], None)
+
+    if kind == "neg":
+        child = _compile_node(node[1])
+
+        def negate(env):
+            value, errors = child(env)
+            return np.negative(value), errors
+        return negate
+
+    if kind == "postfix":
+        func = NUMPY_POSTFIX_OPS[node[1]]
+        child = _compile_node(node[2])
+
+        def postfix(env):
+            value, errors = child(env)
+            return func(value), errors
+        return postfix
+
+    if kind == "call":
+        func, domain_error = NUMPY_FUNCTIONS[node[1]]
+        child = _compile_node(node[2])
+
+        def call(env):
+            value, errors = child(env)
+            if domain_error is not None:
+                errors = _merge(errors, domain_error(value))
+            return func(value), errors
+        return call
+
+    if kind == "bin":
+        func = NUMPY_BINARY_OPS[node[1]]
+        left = _compile_node(node[2])
+        right = _compile_node(node[3])
+
+        def binary(env):
+            left_value, left_errors = left(env)
+            right_value, right_errors = right(env)
+            value, errors = func(left_value, right_value)
+            return value, _merge(_merge(left_errors, right_errors), errors)
+        return binary
+
+    raise calc_engine.ExpressionError(f"未知のノードです: {kind}")
+
+
+class BatchExpression:
+    """NumPy 配列に対して一括評価できるコンパイル済みの式"""
+
+    __slots__ = ("source", "variables", "_func")
+
+    def __init__(self, source, tree):
+        self.source = source
+        self.variables = calc_engine.compile_expression(source).variables
+        self._func = _compile_node(tree)
+
+    def __call__(self, **arrays):
+        """変数に配列を割り当てて評価し、BatchResult を返す"""
+        missing = self.variables.difference(arrays)
+        if missing:
+            raise calc_engine.ExpressionError(f"変数の値がありません: {', '.join(sorted(missing))}")
+
+        env = {name: np.asarray(arrays[name], dtype=np.float64) for name in self.variables}
+        shape = np.broadcast_shapes(*(a.shape for a in env.values())) if env else ()
+
+        with np.errstate(all="ignore"):
+            values, errors = self._func(env)
+            values = np.broadcast_to(values, shape).astype(np.float64, copy=True)
+            if errors is None:
+                errors = np.zeros(shape, dtype=bool)
+            else:
+                errors = np.broadcast_to(errors, shape).copy()
+            # 途中の NaN（inf - inf など）やオーバーフローした inf もエラーとして扱う
+            errors |= ~np.isfinite(values)
+            values[errors] = np.nan
+        return BatchResult(values, errors)
+
+    def __repr__(self):
+        return f"BatchExpression({self.source!r})"
+
+
+@lru_cache(maxsize=calc_engine.CACHE_SIZE)
+def compile_batch(text):
+    """式の文字列を一括評価用にコンパイルする（同じ式は再解析しない）"""
+    return BatchExpression(text, calc_engine.parse(text))
+
+
+def evaluate_batch(text, **arrays):
+    """式を配列に対して一括評価する"""
+    return compile_batch(text)(**arrays)
+
+
+def format_numbers(values, errors=None):
+    """配列を format_number と同じ規則で整形する（整数値は int、エラーは "Error"）
+
+    変数のない式の結果（0 次元の配列）も要素 1 つのリストにする。
+    """
+    values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+    if errors is None:
+        errors = ~np.isfinite(values)
+    else:
+        errors = np.atleast_1d(errors) | ~np.isfinite(values)
+    with np.errstate(invalid="ignore"):
+        integral = np.isfinite(values) & (values % 1 == 0)
+    result = values.astype(object)
+    result[integral] = [int(v) for v in values[integral]]
+    result[errors] = "Error"
+    return result.tolist()
@@ -0,0 +1,73 @@
+"""電卓のバッチ評価用 CLI
+
+使い方:
+    python calc_cli.py formulas.txt            # 1 行に 1 つの式
+    python calc_cli.py --jsonl requests.jsonl  # {"id": ..., "expr": ..., "vars": {...}}
+    echo "sin(π/2)+1" | python calc_cli.py     # 標準入力から読む
+
+結果は 1 行ずつ逐次書き出す。
+"""
+
+import argparse
+import json
+import sys
+
+import calc_core
+
+
+def evaluate_lines(lines, digits=None):
+    """1 行に 1 つの式を評価し、結果を順に返す"""
+    for line in lines:
+        expression = line.strip()
+        if not expression:
+            continue
+        yield f"{calc_core.evaluate(expression, digits)}\n"
+
+
+def evaluate_jsonl(lines, digits=None):
+    """JSONL 形式のリクエストを評価し、JSONL 形式の結果を順に返す"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            expression = request["expr"]
+            env = request.get("vars") or {}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield json.dumps({"error": f"不正なリクエスト: {e}"}, ensure_ascii=False) + "\n"
+            continue
+
+        response = {"id": request.get("id"), "expr": expression}
+        try:
+            response["result"] = calc_core.evaluate(expression, digits, **env)
+        except TypeError as e:
+            response["result"] = "Error"
+            response["error"] = str(e)
+        yield json.dumps(response, ensure_ascii=False, default=str) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電卓の式を一括評価する")
+    parser.add_argument("input", nargs="?", help="入力ファイル（省略時は標準入力）")
+    parser.add_argument("--jsonl", action="store_true", help="入力と出力を JSONL 形式にする")
+    parser.add_argument("--digits", type=int, help="精度保証モードで評価する有効桁数")
+    args = parser.parse_args(argv)
+
+    source = open(args.input, encoding="utf-8") if args.input else sys.stdin
+    # 対話的に使う場合は 1 行ごとに結果を表示する
+    interactive = source.isatty()
+    process = evaluate_jsonl if args.jsonl else evaluate_lines
+    try:
+        for output in process(source, args.digits):
+            sys.stdout.write(output)
+            if interactive:
+                sys.stdout.flush()
+    except BrokenPipeError:
+        pass  # head などで出力が途中で閉じられた場合
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""電卓の計算処理（GUI に依存しない部分）
+
+flet を読み込まずに使えるので、CLI やバッチ処理からも利用できる。
+"""
+
+import calc_engine
+import calc_precision
+
+# 関数ボタン（押すと「関数名(」を入力する）
+FUNCTION_KEYS = {"sin", "cos", "tan", "log", "ln", "√"}
+
+# 式に追加する文字への変換表
+KEY_TOKENS = {"x^y": "^", "x²": "²", "π": "π", "e": "ℯ", "%": "%"}
+
+
+def format_number(num, digits=None):
+    """数値のフォーマット処理（整数値は int で返す）
+
+    digits を指定すると有効桁数に丸めてから整形するので、
+    0.1+0.2 のような float の丸め誤差が表示に出ない。
+    """
+    if digits is not None:
+        return calc_precision.round_significant(num, digits)
+    if num % 1 == 0:
+        return int(num)  # 整数として返す
+    else:
+        return num  # 小数のまま返す
+
+
+def calculate(operand1, operand2, operator):
+    """二項演算を演算子の表から実行する"""
+    try:
+        func = calc_engine.BINARY_OPS[calc_engine.OPERATOR_ALIASES.get(operator, operator)]
+        return format_number(func(operand1, operand2))
+    except KeyError:
+        return None  # 未知の演算子
+    except (ArithmeticError, ValueError, TypeError):
+        return "Error"  # ゼロ除算などをエラーで返す
+
+
+def evaluate(expression, digits=None, **env):
+    """式全体を評価して表示用の値を返す（エラーは "Error"）
+
+    digits を指定すると精度保証モードで評価し、その桁数まで正しい値を返す。
+    """
+    if not expression:
+        return 0
+    try:
+        if digits is not None:
+            return calc_precision.evaluate(expression, digits, **env).rounded()
+        return format_number(calc_engine.evaluate(expression, **env))
+    except (ArithmeticError, ValueError, TypeError):
+        return "Error"  # 構文エラー・ゼロ除算・定義域エラー
+
+
+class Keypad:
+    """電卓のキー入力を式に組み立てる状態機械"""
+
+    def __init__(self, digits=calc_precision.DEFAULT_DIGITS, history=None):
+        self.digits = digits  # 表示する有効桁数（None なら float のまま）
+        self.history = history  # 計算履歴（calc_history.CalculationHistory、任意）
+        self.reset()
+
+    def reset(self):
+        """初期化処理"""
+        self.operator = "+"  # 直前の演算子
+        self.operand1 = 0  # 直前の計算結果
+        self.new_operand = True  # 新しい入力を示すフラグ
+        self.expression = ""  # 入力中の式
+        self.recall_position = 0  # 履歴を何件さかのぼって表示しているか
+
+    def press(self, key):
+        """キーを 1 つ入力し、表示する値を返す"""
+        if key == "AC":
+            self.reset()
+            return "0"
+
+        if key == "=":
+            result = evaluate(self.expression, self.digits)
+            if self.history is not None and self.expression:
+                self.history.append(self.expression, result)
+            self.recall_position = 0
+            # 結果に続けて演算子を押した場合は結果から計算を続ける
+            self.expression = "" if result == "Error" else str(result)
+            if result != "Error":
+                self.operand1 = result
+            self.new_operand = True
+            return result
+
+        if key in ("↑", "↓"):
+            return self.recall(1 if key == "↑" else -1)
+
+        if key == "+/-":
+            if self.expression.startswith("-(") and self.expression.endswith(")"):
+                self.expression = self.expression[2:-1]
+            elif self.expression:
+                self.expression = f"-({self.expression})"
+            return self.expression or "0"
+
+        if self.new_operand and (key.isdigit() or key == "." or key in FUNCTION_KEYS):
+            # 計算結果の直後に数字を押した場合は新しい式を始める
+            self.expression = ""
+        self.new_operand = False
+        if key in FUNCTION_KEYS:
+            self.expression += f"{key}("
+        elif key in calc_engine.BINARY_OPS:
+            self.operator = key
+            self.expression += key
+        else:
+            self.expression += KEY_TOKENS.get(key, key)
+        return self.expression
+
+    def recall(self, step):
+        """履歴の式を呼び出す（step=1 で 1 件古く、-1 で 1 件新しく）"""
+        if not self.history:
+            return self.expression or "0"
+        self.recall_position = max(0, min(len(self.history), self.recall_position + step))
+        if self.recall_position == 0:
+            self.expression = ""
+        else:
+            self.expression = self.history[-self.recall_position].expression
+        self.new_operand = False
+        return self.expression or "0"
@@ -0,0 +1,397 @@
+import math
+import operator
+from functools import lru_cache
+
+from calc_power import safe_pow
+
+# 式の解析結果をキャッシュする件数
+CACHE_SIZE = 1024
+# 解析の入れ子の上限（括弧 1 段で 2 つ数える）。解析は再帰で行うので、深すぎる式は
+# RecursionError になる前に ExpressionError にする
+MAX_NESTING = 200
+# 構文木の深さの上限（評価も再帰で行う。1+1+…+1 のような長い式は左に深くなる）
+MAX_TREE_DEPTH = 300
+
+
+class ExpressionError(ValueError):
+    """式の構文エラー"""
+
+
+# 二項演算子の表（電卓ボタンの表記 → 関数）
+BINARY_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "^": safe_pow,  # 巨大な整数を作らないように大きさを見積もってから計算
+}
+
+# 電卓ボタンの別表記
+OPERATOR_ALIASES = {
+    "×": "*",
+    "÷": "/",
+    "−": "-",
+    "x^y": "^",
+    "**": "^",
+}
+
+# 科学計算用の関数（角度はラジアン）
+FUNCTIONS = {
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "log": math.log10,
+    "ln": math.log,
+    "√": math.sqrt,
+    "sqrt": math.sqrt,
+}
+
+# 定数
+CONSTANTS = {
+    "π": math.pi,
+    "pi": math.pi,
+    "e": math.e,
+    "ℯ": math.e,  # e ボタンが入力する記号（2e5 のような指数表記と区別する）
+}
+
+# 1 文字で名前になる記号（前後の文字とつなげて名前にしない）
+SYMBOL_NAMES = frozenset("π√ℯ")
+
+# 後置演算子（x² と %）
+POSTFIX_OPS = {
+    "²": lambda x: x * x,
+    "%": lambda x: x / 100,
+}
+
+# 数字として扱う文字（str.isdigit は ² も数字とみなすため使わない）
+DIGITS = frozenset("0123456789")
+
+# 演算子の優先順位
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+# 字句解析 ------------------------------------------------------------
+
+def tokenize(text):
+    """式の文字列をトークン (種類, 値) のリストに分解する"""
+    tokens = []
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+            continue
+
+        # ** はべき乗（ボタンの表記 x^y は Keypad で ^ に変換するので、ここでは扱わない）
+        if text.startswith("**", i):
+            tokens.append(("op", "^"))
+            i += 2
+            continue
+
+        if ch in DIGITS or ch == ".":
+            start = i
+            while i < n and (text[i] in DIGITS or text[i] == "."):
+                i += 1
+            # 指数表記（1e5, 2.5e-3）
+            if i < n and text[i] in "eE" and i + 1 < n and (
+                text[i + 1] in DIGITS
+                or (text[i + 1] in "+-" and i + 2 < n and text[i + 2] in DIGITS)
+            ):
+                i += 2
+                while i < n and text[i] in DIGITS:
+                    i += 1
+            literal = text[start:i]
+            try:
+                tokens.append(("num", float(literal)))
+            except ValueError:
+                raise ExpressionError(f"不正な数値です: {literal}")
+            continue
+
+        if ch.isalpha() and ch not in SYMBOL_NAMES:
+            start = i
+            while i < n and text[i].isalpha() and text[i] not in SYMBOL_NAMES:
+                i += 1
+            tokens.append(("name", text[start:i]))
+            continue
+
+        if ch in SYMBOL_NAMES:
+            tokens.append(("name", ch))
+        elif ch in "+-*/^":
+            tokens.append(("op", ch))
+        elif ch in OPERATOR_ALIASES:
+            tokens.append(("op", OPERATOR_ALIASES[ch]))
+        elif ch in POSTFIX_OPS:
+            tokens.append(("postfix", ch))
+        elif ch in "()":
+            tokens.append((ch, ch))
+        else:
+            raise ExpressionError(f"不正な文字です: {ch}")
+        i += 1
+    return tokens
+
+
+# 構文解析 ------------------------------------------------------------
+#
+# 構文木はタプルで表現する
+#   ("num", 値) / ("const", 定数名) / ("var", 名前) / ("neg", 子)
+#   ("bin", 演算子, 左, 右) / ("call", 関数名, 引数) / ("postfix", 記号, 子)
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.nesting = 0  # parse_unary と parse_primary の入れ子の深さ
+
+    def enter(self):
+        self.nesting += 1
+        if self.nesting > MAX_NESTING:
+            raise ExpressionError("式の入れ子が深すぎます")
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def advance(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("式が空です")
+        node = self.parse_expr()
+        if self.pos < len(self.tokens):
+            raise ExpressionError(f"余分なトークンがあります: {self.peek()[1]}")
+        return node
+
+    def parse_expr(self, min_prec=1):
+        """加減乗除を優先順位付きで解析する"""
+        left = self.parse_unary()
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in PRECEDENCE:
+                prec = PRECEDENCE[value]
+                if prec < min_prec:
+                    break
+                self.advance()
+                right = self.parse_expr(prec + 1)
+                left = ("bin", value, left, right)
+            elif _starts_operand(kind) and min_prec <= 2:
+                # 暗黙の掛け算（2π, 3(4+5), 2sin(x) など）
+                right = self.parse_expr(3)
+                left = ("bin", "*", left, right)
+            else:
+                break
+        return left
+
+    def parse_unary(self):
+        self.enter()
+        kind, value = self.peek()
+        if kind == "op" and value in "+-":
+            self.advance()
+            operand = self.parse_unary()
+            node = ("neg", operand) if value == "-" else operand
+        else:
+            node = self.parse_power()
+        self.nesting -= 1
+        return node
+
+    def parse_power(self):
+        base = self.parse_postfix()
+        kind, value = self.peek()
+        if kind == "op" and value == "^":
+            self.advance()
+            # 累乗は右結合（2^3^2 = 2^9）
+            exponent = self.parse_unary()
+            return ("bin", "^", base, exponent)
+        return base
+
+    def parse_postfix(self):
+        node = self.parse_primary()
+        while self.peek()[0] == "postfix":
+            node = ("postfix", self.advance()[1], node)
+        return node
+
+    def parse_primary(self):
+        self.enter()
+        node = self._primary()
+        self.nesting -= 1
+        return node
+
+    def _primary(self):
+        kind, value = self.advance()
+        if kind == "num":
+            return ("num", value)
+        if kind == "(":
+            node = self.parse_expr()
+            # 閉じ括弧の省略を許す（電卓入力の途中で = を押した場合）
+            if self.peek()[0] == ")":
+                self.advance()
+            return node
+        if kind == "name":
+            if value in FUNCTIONS:
+                if self.peek()[0] == "(":
+                    argument = self.parse_primary()
+                else:
+                    argument = self.parse_postfix()
+                return ("call", value, argument)
+            if value in CONSTANTS:
+                return ("const", value)
+            return ("var", value)
+        if kind is None:
+            raise ExpressionError("式が途中で終わっています")
+        raise ExpressionError(f"予期しないトークンです: {value}")
+
+
+def _starts_operand(kind):
+    """暗黙の掛け算を始めるトークンかどうか"""
+    return kind in ("num", "name", "(")
+
+
+def _children(node):
+    kind = node[0]
+    if kind == "bin":
+        return node[2:]
+    if kind in ("call", "postfix"):
+        return node[2:]
+    if kind == "neg":
+        return node[1:]
+    return ()
+
+
+def tree_depth(node):
+    """構文木の深さ（再帰を使わずに数える）"""
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in _children(node))
+    return deepest
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(text):
+    """式の文字列を構文木に変換する（結果はキャッシュされる）"""
+    tree = _Parser(tokenize(text)).parse()
+    if tree_depth(tree) > MAX_TREE_DEPTH:
+        raise ExpressionError("式が長すぎます")
+    return tree
+
+
+# コンパイル ----------------------------------------------------------
+
+def _compile_node(node):
+    """構文木をクロージャに変換する。定数部分は事前に計算しておく"""
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        return (lambda env: value), value
+
+    if kind == "const":
+        value = CONSTANTS[node[1]]
+        return (lambda env: value), value
+
+    if kind == "var":
+        name = node[1]
+        return (lambda env: env[name]), None
+
+    if kind == "neg":
+        child, const = _compile_node(node[1])
+        if const is not None:
+            value = -const
+            return (lambda env: value), value
+        return (lambda env: -child(env)), None
+
+    if kind == "postfix":
+        func = POSTFIX_OPS[node[1]]
+        child, const = _compile_node(node[2])
+        if const is not None:
+            value = func(const)
+            return (lambda env: value), value
+        return (lambda env: func(child(env))), None
+
+    if kind == "call":
+        func = FUNCTIONS[node[1]]
+        child, const = _compile_node(node[2])
+        if const is not None:
+            try:
+                value = func(const)
+            except (ValueError, OverflowError):
+                # 定義域エラーは評価時に発生させる
+                return (lambda env: func(child(env))), None
+            return (lambda env: value), value
+        return (lambda env: func(child(env))), None
+
+    if kind == "bin":
+        func = BINARY_OPS[node[1]]
+        left, left_const = _compile_node(node[2])
+        right, right_const = _compile_node(node[3])
+        if left_const is not None and right_const is not None:
+            try:
+                value = func(left_const, right_const)
+            except (ZeroDivisionError, ValueError, OverflowError):
+                return (lambda env: func(left(env), right(env))), None
+            if not isinstance(value, complex):
+                return (lambda env: value), value
+        return (lambda env: func(left(env), right(env))), None
+
+    raise ExpressionError(f"未知のノードです: {kind}")
+
+
+def _collect_variables(node, names):
+    kind = node[0]
+    if kind == "var":
+        names.add(node[1])
+    elif kind in ("neg",):
+        _collect_variables(node[1], names)
+    elif kind in ("postfix", "call"):
+        _collect_variables(node[2], names)
+    elif kind == "bin":
+        _collect_variables(node[2], names)
+        _collect_variables(node[3], names)
+    return names
+
+
+class CompiledExpression:
+    """コンパイル済みの式"""
+
+    __slots__ = ("source", "tree", "variables", "_func")
+
+    def __init__(self, source, tree):
+        self.source = source
+        self.tree = tree
+        self.variables = frozenset(_collect_variables(tree, set()))
+        self._func = _compile_node(tree)[0]
+
+    def __call__(self, **env):
+        """変数を与えて式を評価する"""
+        missing = self.variables.difference(env)
+        if missing:
+            raise ExpressionError(f"変数の値がありません: {', '.join(sorted(missing))}")
+        result = self._func(env)
+        if isinstance(result, complex):
+            raise ValueError("math domain error")
+        return result
+
+    def __repr__(self):
+        return f"CompiledExpression({self.source!r})"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(text):
+    """式の文字列をコンパイルする（同じ式は再解析しない）"""
+    return CompiledExpression(text, parse(text))
+
+
+def evaluate(text, **env):
+    """式の文字列を評価して数値を返す"""
+    return compile_expression(text)(**env)
+
+
+def clear_cache():
+    """解析・コンパイルのキャッシュを消去する"""
+    parse.cache_clear()
+    compile_expression.cache_clear()
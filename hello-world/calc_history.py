@@ -0,0 +1,217 @@
+"""計算履歴（容量固定のリングバッファ、SQLite への保存は任意）
+
+追加は O(1) で、古い履歴は容量を超えたときに押し出される。
+位置による呼び出しと、式の先頭文字列による検索ができる。
+"""
+
+import sqlite3
+import time
+from array import array
+
+# 既定の容量（件数）
+DEFAULT_CAPACITY = 100000
+# 先頭何文字までを索引に登録するか
+PREFIX_INDEX_LENGTH = 4
+
+
+class HistoryEntry:
+    """履歴の 1 件"""
+
+    __slots__ = ("seq", "expression", "result", "timestamp")
+
+    def __init__(self, seq, expression, result, timestamp):
+        self.seq = seq  # 通し番号（削除されても振り直さない）
+        self.expression = expression
+        self.result = result
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return f"HistoryEntry({self.seq}, {self.expression!r}, {self.result!r})"
+
+
+class _SeqList:
+    """通し番号を昇順に保持する配列（先頭からの削除は償却 O(1)）"""
+
+    __slots__ = ("items", "head")
+
+    def __init__(self):
+        self.items = array("q")
+        self.head = 0
+
+    def append(self, seq):
+        self.items.append(seq)
+
+    def drop_before(self, seq):
+        """seq より古い番号を取り除く"""
+        items = self.items
+        while self.head < len(items) and items[self.head] < seq:
+            self.head += 1
+        # 使わなくなった先頭部分が半分を超えたら詰める
+        if self.head > 64 and self.head * 2 > len(items):
+            del items[:self.head]
+            self.head = 0
+
+    def __len__(self):
+        return len(self.items) - self.head
+
+    def newest_first(self):
+        items = self.items
+        for i in range(len(items) - 1, self.head - 1, -1):
+            yield items[i]
+
+
+class CalculationHistory:
+    """容量固定の計算履歴"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None):
+        if capacity <= 0:
+            raise ValueError("capacity は 1 以上にしてください")
+        self.capacity = capacity
+        self._expressions = [None] * capacity
+        self._results = [None] * capacity
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._next_seq = 0  # 次に追加する履歴の通し番号
+        self._size = 0
+        self._index = {}  # 式の先頭文字列 → _SeqList
+
+        self.conn = None
+        if path is not None:
+            self._open(path)
+
+    # 基本操作 --------------------------------------------------------
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def oldest_seq(self):
+        return self._next_seq - self._size
+
+    def append(self, expression, result):
+        """計算結果を履歴に追加する（容量を超えたら最も古い履歴を捨てる）"""
+        result = str(result)
+        timestamp = time.time()
+        self._append(expression, result, timestamp)
+        if self.conn is not None:
+            self._save(self._next_seq - 1, expression, result, timestamp)
+
+    def _append(self, expression, result, timestamp):
+        if self._size == self.capacity:
+            self._evict()
+        seq = self._next_seq
+        slot = seq % self.capacity
+        self._expressions[slot] = expression
+        self._results[slot] = result
+        self._timestamps[slot] = timestamp
+        self._next_seq += 1
+        self._size += 1
+
+        for length in range(1, min(len(expression), PREFIX_INDEX_LENGTH) + 1):
+            prefix = expression[:length]
+            seqs = self._index.get(prefix)
+            if seqs is None:
+                seqs = self._index[prefix] = _SeqList()
+            seqs.append(seq)
+
+    def _evict(self):
+        seq = self.oldest_seq
+        slot = seq % self.capacity
+        expression = self._expressions[slot]
+        self._expressions[slot] = None
+        self._results[slot] = None
+        self._size -= 1
+        for length in range(1, min(len(expression), PREFIX_INDEX_LENGTH) + 1):
+            prefix = expression[:length]
+            seqs = self._index[prefix]
+            seqs.drop_before(seq + 1)
+            if not len(seqs):
+                del self._index[prefix]
+
+    def _entry(self, seq):
+        slot = seq % self.capacity
+        return HistoryEntry(seq, self._expressions[slot], self._results[slot],
+                            self._timestamps[slot])
+
+    def __getitem__(self, position):
+        """位置で呼び出す（0 が最も古く、-1 が最新）"""
+        if position < 0:
+            position += self._size
+        if not 0 <= position < self._size:
+            raise IndexError("履歴の範囲外です")
+        return self._entry(self.oldest_seq + position)
+
+    def get(self, seq):
+        """通し番号で呼び出す（押し出された履歴は None）"""
+        if self.oldest_seq <= seq < self._next_seq:
+            return self._entry(seq)
+        return None
+
+    def recent(self, count=10):
+        """新しい順に count 件を返す"""
+        return [self._entry(seq) for seq in
+                range(self._next_seq - 1, max(self.oldest_seq, self._next_seq - count) - 1, -1)]
+
+    def search(self, prefix, limit=20):
+        """式が prefix で始まる履歴を新しい順に最大 limit 件返す"""
+        if not prefix:
+            return self.recent(limit)
+        seqs = self._index.get(prefix[:PREFIX_INDEX_LENGTH])
+        if seqs is None:
+            return []
+        results = []
+        for seq in seqs.newest_first():
+            slot = seq % self.capacity
+            # 索引は先頭 PREFIX_INDEX_LENGTH 文字までなので、長い prefix は確認する
+            if self._expressions[slot].startswith(prefix):
+                results.append(self._entry(seq))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def clear(self):
+        """履歴をすべて消去する"""
+        self._expressions = [None] * self.capacity
+        self._results = [None] * self.capacity
+        self._size = 0
+        self._index = {}
+        if self.conn is not None:
+            self.conn.execute("DELETE FROM history")
+            self.conn.commit()
+
+    # SQLite への保存 -------------------------------------------------
+
+    def _open(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 1 件ごとに確定するので、WAL では毎回の fsync を省く
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS history (
+            seq INTEGER PRIMARY KEY,
+            expression TEXT NOT NULL,
+            result TEXT NOT NULL,
+            timestamp REAL NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+        rows = self.conn.execute(
+            "SELECT seq, expression, result, timestamp FROM history ORDER BY seq DESC LIMIT ?",
+            (self.capacity,)).fetchall()
+        for seq, expression, result, timestamp in reversed(rows):
+            # 通し番号は保存されたものに合わせる
+            self._next_seq = seq
+            self._append(expression, result, timestamp)
+
+    def _save(self, seq, expression, result, timestamp):
+        """1 件を書き込み、容量を超えた古い行を削除する（アプリが閉じられても残るように毎回確定する）"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO history (seq, expression, result, timestamp) "
+                "VALUES (?, ?, ?, ?)", (seq, expression, result, timestamp))
+            self.conn.execute("DELETE FROM history WHERE seq < ?", (self.oldest_seq,))
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
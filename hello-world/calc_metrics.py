@@ -0,0 +1,155 @@
+"""キー入力から表示までのレイテンシ計測と、描画の間引き（GUI に依存しない部分）"""
+
+import math
+import threading
+import time
+
+# ヒストグラムの最小バケット（秒）と、1 桁（10 倍）あたりのバケット数
+HISTOGRAM_MIN = 1e-6
+BUCKETS_PER_DECADE = 10
+# 1µs 〜 10s を扱う
+HISTOGRAM_DECADES = 7
+
+# 連続入力をまとめる時間窓（秒）。60fps の 1 フレーム分
+COALESCE_WINDOW = 0.016
+
+
+class LatencyHistogram:
+    """対数スケールのバケットでレイテンシを数えるヒストグラム"""
+
+    __slots__ = ("name", "counts", "count", "total", "max")
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * (BUCKETS_PER_DECADE * HISTOGRAM_DECADES + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """1 件のレイテンシ（秒）を記録する"""
+        if seconds <= HISTOGRAM_MIN:
+            index = 0
+        else:
+            index = int(math.log10(seconds / HISTOGRAM_MIN) * BUCKETS_PER_DECADE) + 1
+            index = min(index, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @staticmethod
+    def bucket_upper(index):
+        """バケットの上限（秒）"""
+        return HISTOGRAM_MIN * 10 ** (index / BUCKETS_PER_DECADE)
+
+    def percentile(self, p):
+        """p（0〜1）パーセンタイルの上限値（秒）を返す"""
+        if not self.count:
+            return None
+        target = p * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self):
+        """件数・平均・パーセンタイル（ミリ秒）をまとめて返す"""
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(0.5)),
+            "p90_ms": ms(self.percentile(0.9)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+    def buckets(self):
+        """空でないバケットの (上限ミリ秒, 件数) のリストを返す"""
+        return [(round(self.bucket_upper(i) * 1000, 4), c) for i, c in enumerate(self.counts) if c]
+
+
+class KeystrokeMetrics:
+    """キー入力ごとの処理時間と表示までの時間"""
+
+    def __init__(self):
+        self.handler = LatencyHistogram("handler")  # イベント処理にかかった時間
+        self.render = LatencyHistogram("time_to_render")  # キー入力から描画完了まで
+        self.renders = 0  # 実際に描画した回数
+        self.coalesced = 0  # 描画をまとめて省いたキー入力の数
+
+    def report(self):
+        """計測結果を文字列で返す"""
+        lines = [f"keystrokes={self.handler.count} renders={self.renders} "
+                 f"coalesced={self.coalesced}"]
+        for histogram in (self.handler, self.render):
+            s = histogram.summary()
+            lines.append(f"{histogram.name:15} p50={s['p50_ms']}ms p90={s['p90_ms']}ms "
+                         f"p99={s['p99_ms']}ms max={s['max_ms']}ms")
+        return "\n".join(lines)
+
+
+class UpdateCoalescer:
+    """短い間隔の連続した描画要求を 1 回の描画にまとめる
+
+    前回の描画から COALESCE_WINDOW 以上たっていればすぐ描画し、
+    それより短い間隔で来た要求は窓の終わりにまとめて 1 回だけ描画する。
+    貼り付けやキーリピートのような連続入力でも往復は 1 フレームに 1 回で済む。
+    """
+
+    def __init__(self, render, metrics=None, window=COALESCE_WINDOW):
+        self.render = render  # 最新の状態を描画する関数
+        self.metrics = metrics
+        self.window = window
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._pending = []  # 描画待ちのキー入力の開始時刻
+        self._timer = None
+        self._last_render = 0.0
+
+    def request(self, started):
+        """描画を要求する。started はキー入力を受け取った時刻（perf_counter）"""
+        with self._lock:
+            self._pending.append(started)
+            if self._timer is not None:
+                return  # すでに描画が予定されている
+            wait = self._last_render + self.window - time.perf_counter()
+            if wait > 0:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """待っている要求をまとめて 1 回描画する"""
+        with self._render_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._timer = None
+            if not pending:
+                return
+            self.render()
+            done = time.perf_counter()
+            with self._lock:
+                self._last_render = done
+
+        if self.metrics is not None:
+            self.metrics.renders += 1
+            self.metrics.coalesced += len(pending) - 1
+            for started in pending:
+                self.metrics.render.record(done - started)
+
+    def cancel(self):
+        """予定されている描画を取り消す"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = []
+
@@ -0,0 +1,175 @@
+"""関数のグラフ・数表用の適応サンプリング（GUI に依存しない部分）
+
+曲率の大きいところや漸近線（tan など）の近くは細かく、
+平坦なところは粗くサンプリングする。評価は calc_batch で一括して行う。
+"""
+
+import numpy as np
+
+import calc_batch
+
+# 最初に等間隔で取る点の数
+INITIAL_POINTS = 64
+# 1 回の描画で使う点の上限
+MAX_POINTS = 4096
+# 細分化の最大回数
+MAX_ROUNDS = 12
+# 画面の高さに対する許容誤差（この割合より直線から外れる区間を細分化する）
+TOLERANCE = 0.002
+
+
+def _evaluate(expression, x, variable):
+    result = calc_batch.evaluate_batch(expression, **{variable: x})
+    values = np.broadcast_to(result.values, x.shape).astype(np.float64)
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+
+def _y_scale(y):
+    finite = y[np.isfinite(y)]
+    if finite.size == 0:
+        return 1.0
+    # 漸近線の巨大な値に引きずられないように分位点で幅を測る
+    low, high = np.percentile(finite, [2, 98])
+    return max(high - low, 1e-12)
+
+
+def refine(expression, x, y, max_points=MAX_POINTS, tolerance=TOLERANCE, variable="x"):
+    """サンプル点 (x, y) を曲率と不連続に応じて細分化する"""
+    for _ in range(MAX_ROUNDS):
+        if len(x) >= max_points:
+            break
+        scale = _y_scale(y)
+        mid = (x[:-1] + x[1:]) / 2
+        y_mid = _evaluate(expression, mid, variable)
+
+        # 中点の値と直線補間との差（曲率の目安）
+        linear = (y[:-1] + y[1:]) / 2
+        deviation = np.abs(y_mid - linear)
+        with np.errstate(invalid="ignore"):
+            curved = deviation > tolerance * scale
+        # 片側だけ値がない区間や、値が大きく跳ぶ区間（漸近線の候補）
+        broken = np.isnan(y[:-1]) != np.isnan(y[1:])
+        with np.errstate(invalid="ignore"):
+            jump = np.abs(y[1:] - y[:-1]) > scale
+        split = np.nan_to_num(curved, nan=False) | broken | jump | (
+            np.isnan(linear) & ~np.isnan(y_mid))
+
+        # 浮動小数点の限界まで細かくなった区間は分けない
+        split &= (x[1:] - x[:-1]) > np.abs(mid) * 1e-12 + 1e-300
+        count = int(split.sum())
+        if count == 0:
+            break
+        budget = max_points - len(x)
+        if count > budget:
+            # 予算を超える場合は差の大きい区間を優先する
+            priority = np.where(split, np.nan_to_num(deviation, nan=np.inf), -1.0)
+            keep = np.argsort(priority)[::-1][:budget]
+            split = np.zeros_like(split)
+            split[keep] = True
+
+        x = np.insert(x, np.nonzero(split)[0] + 1, mid[split])
+        y = np.insert(y, np.nonzero(split)[0] + 1, y_mid[split])
+    return x, y
+
+
+def adaptive_sample(expression, start, stop, initial_points=INITIAL_POINTS,
+                    max_points=MAX_POINTS, tolerance=TOLERANCE, variable="x"):
+    """区間 [start, stop] で式を適応的にサンプリングし、(x, y) の配列を返す"""
+    x = np.linspace(start, stop, initial_points)
+    y = _evaluate(expression, x, variable)
+    return refine(expression, x, y, max_points, tolerance, variable)
+
+
+def segments(x, y, scale=None):
+    """値がない点や漸近線で区切った連続区間ごとの (x, y) のリストを返す"""
+    if scale is None:
+        scale = _y_scale(y)
+    valid = np.isfinite(y)
+    with np.errstate(invalid="ignore"):
+        # 符号が反転して画面の何倍も跳ぶところは漸近線とみなして線をつながない
+        jump = (np.abs(y[1:] - y[:-1]) > 4 * scale) & (np.sign(y[1:]) != np.sign(y[:-1]))
+    breaks = np.nonzero(~valid[:-1] | ~valid[1:] | jump)[0] + 1
+    result = []
+    for seg_x, seg_y in zip(np.split(x, breaks), np.split(y, breaks)):
+        keep = np.isfinite(seg_y)
+        if keep.sum() >= 1:
+            result.append((seg_x[keep], seg_y[keep]))
+    return result
+
+
+def y_range(x, y, margin=0.1):
+    """縦軸の表示範囲を返す（値がなければ None）
+
+    漸近線の近くは点が密なので、等間隔に補間し直してから分位点を取る。
+    """
+    valid = np.isfinite(y)
+    if valid.sum() < 2:
+        return None
+    grid = np.linspace(x[0], x[-1], 256)
+    uniform = np.interp(grid, x[valid], y[valid])
+    low, high = np.percentile(uniform, [2, 98])
+    pad = (high - low) * margin or 1.0
+    return low - pad, high + pad
+
+
+def tabulate(expression, start, stop, step, variable="x"):
+    """数表を作る。(x, 整形した値) のリストを返す（エラーは "Error"）"""
+    count = int(round((stop - start) / step)) + 1
+    x = start + step * np.arange(max(count, 1))
+    result = calc_batch.evaluate_batch(expression, **{variable: x})
+    values = np.broadcast_to(result.values, x.shape)
+    errors = np.broadcast_to(result.errors, x.shape)
+    formatted = calc_batch.format_numbers(values, errors)
+    return list(zip(calc_batch.format_numbers(x), formatted))
+
+
+class PlotSampler:
+    """拡大・縮小のたびにサンプル点を再利用するサンプラー
+
+    すでに評価した点はキャッシュしておき、新しい表示範囲に足りない
+    部分だけを評価してから細分化する。
+    """
+
+    def __init__(self, expression, variable="x", max_points=MAX_POINTS,
+                 tolerance=TOLERANCE):
+        self.expression = expression
+        self.variable = variable
+        self.max_points = max_points
+        self.tolerance = tolerance
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+
+    def sample(self, start, stop, initial_points=INITIAL_POINTS):
+        """表示範囲 [start, stop] のサンプル点 (x, y) を返す"""
+        seed = np.linspace(start, stop, initial_points)
+        inside = (self.x >= start) & (self.x <= stop)
+        known_x = self.x[inside]
+
+        # キャッシュ済みの点から遠い種の点だけを新たに評価する
+        spacing = (stop - start) / (initial_points - 1)
+        if known_x.size >= 2:
+            nearest = np.searchsorted(known_x, seed).clip(1, known_x.size - 1)
+            distance = np.minimum(np.abs(known_x[nearest - 1] - seed),
+                                  np.abs(known_x[nearest] - seed))
+            seed = seed[distance > spacing / 2]
+        if seed.size:
+            new_y = _evaluate(self.expression, seed, self.variable)
+            self._merge(seed, new_y)
+
+        inside = (self.x >= start) & (self.x <= stop)
+        x, y = refine(self.expression, self.x[inside], self.y[inside],
+                      self.max_points, self.tolerance, self.variable)
+        self._merge(x, y)
+        return x, y
+
+    def _merge(self, x, y):
+        """サンプル点をキャッシュに加える（x は昇順に保つ）"""
+        all_x = np.concatenate([self.x, x])
+        all_y = np.concatenate([self.y, y])
+        all_x, index = np.unique(all_x, return_index=True)
+        self.x, self.y = all_x, all_y[index]
+        if self.x.size > 4 * self.max_points:
+            # キャッシュが大きくなりすぎたら間引く
+            step = self.x.size // (2 * self.max_points) + 1
+            self.x, self.y = self.x[::step], self.y[::step]
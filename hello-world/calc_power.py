@@ -0,0 +1,65 @@
+import math
+import sys
+
+# 整数のまま計算する上限桁数（int → str 変換の上限に合わせる）
+MAX_EXACT_DIGITS = getattr(sys, "get_int_max_str_digits", lambda: 4300)() or 4300
+
+# float で表せる最大の桁数（log10）
+FLOAT_MAX_LOG10 = math.log10(sys.float_info.max)
+
+
+class PowerOverflow(OverflowError):
+    """累乗の結果が大きすぎる場合のエラー（結果の桁数を log10 で保持する）"""
+
+    def __init__(self, base, exponent, log10):
+        super().__init__(f"{base}^{exponent} は大きすぎます（約 10^{log10:.6g}）")
+        self.base = base
+        self.exponent = exponent
+        self.log10 = log10  # |base^exponent| の常用対数
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def power_log10(base, exponent):
+    """|base^exponent| の常用対数を計算せずに見積もる"""
+    if base == 0:
+        return -math.inf if exponent > 0 else math.inf
+    return exponent * math.log10(abs(base))
+
+
+def safe_pow(base, exponent):
+    """結果の大きさを対数で見積もってから累乗を計算する
+
+    整数同士で結果が MAX_EXACT_DIGITS 桁以内なら正確な整数を返す。
+    それを超える場合は float で計算し、float でも表せない場合は
+    巨大な整数を作らずにすぐ PowerOverflow を送出する。
+    """
+    # 自明なケース（巨大な指数でも即座に決まる）
+    if exponent == 0 or base == 1:
+        return 1 if _is_int(base) and _is_int(exponent) else 1.0
+    if base == 0:
+        if exponent < 0:
+            raise ZeroDivisionError("0 の負の累乗は計算できません")
+        return base
+    if base == -1 and _is_int(exponent):
+        return 1 if exponent % 2 == 0 else -1
+
+    if base < 0 and not float(exponent).is_integer():
+        raise ValueError("math domain error")
+
+    log10 = power_log10(base, exponent)
+
+    if _is_int(base) and _is_int(exponent) and exponent > 0:
+        if log10 < MAX_EXACT_DIGITS:
+            return base ** exponent
+        # 正確な値は高すぎるので float に切り替える
+
+    if log10 > FLOAT_MAX_LOG10:
+        raise PowerOverflow(base, exponent, log10)
+    if log10 < -FLOAT_MAX_LOG10 - 16:
+        # 非正規化数の範囲も下回るので 0 に丸める
+        negative = base < 0 and float(exponent) % 2 == 1
+        return -0.0 if negative else 0.0
+    return math.pow(base, exponent)
@@ -0,0 +1,379 @@
+"""精度保証付きの評価
+
+まず float で計算しながら誤差の上限を見積もり（実行時誤差解析）、
+要求された桁数まで信頼できればその結果をそのまま使う。
+信頼できない場合だけ、有理式は fractions で厳密に、それ以外は
+decimal で精度を上げながら再計算する。
+"""
+
+import decimal
+import math
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+
+import calc_engine
+from calc_power import safe_pow
+
+# 既定の有効桁数
+DEFAULT_DIGITS = 12
+# decimal で再計算するときの最大精度（誤差の上限を float で扱える範囲）
+MAX_PRECISION = 200
+# float の単位丸め誤差
+FLOAT_UNIT = 2.0 ** -53
+
+
+class PreciseResult:
+    """精度保証付きの評価結果"""
+
+    __slots__ = ("value", "error", "digits", "method")
+
+    def __init__(self, value, error, digits, method):
+        self.value = value  # 計算結果（float / Decimal / Fraction）
+        self.error = error  # 誤差の上限（絶対値）
+        self.digits = digits  # 要求された有効桁数
+        self.method = method  # "float" / "fraction" / "decimal"
+
+    def rounded(self):
+        """要求された有効桁数に丸めた値を返す（整数値は int）"""
+        return round_significant(self.value, self.digits)
+
+    def __repr__(self):
+        return f"PreciseResult({self.value!r}, error={self.error!r}, method={self.method!r})"
+
+
+def round_significant(value, digits):
+    """値を有効桁数 digits に丸める（整数値は int）"""
+    # 厳密に求めた整数（Fraction）も丸める。巨大な int のまま返すと表示できない
+    if isinstance(value, (Fraction, Decimal)):
+        with decimal.localcontext() as ctx:
+            ctx.prec = digits
+            if isinstance(value, Fraction):
+                value = Decimal(value.numerator) / Decimal(value.denominator)
+            value = +value
+            # 有効桁数を超える整数は指数表記のまま返す
+            if value == value.to_integral_value() and value.adjusted() < digits:
+                return int(value)
+            return value.normalize()
+    if isinstance(value, int):
+        return value
+    if not math.isfinite(value):
+        return value
+    value = float(f"{value:.{digits}g}")
+    if value.is_integer() and abs(value) < 10 ** digits:
+        return int(value)
+    return value
+
+
+# 演算の実装 ----------------------------------------------------------
+#
+# 各バックエンドは (値, 誤差の上限) の組を受け取り、同じ組を返す。
+# 誤差の伝播は一次近似に丸め誤差 unit * |結果| を加えたもの。
+
+class _FloatBackend:
+    unit = FLOAT_UNIT
+
+    def number(self, value):
+        value = float(value)
+        # 2^53 未満の整数は float で正確に表せる
+        exact = value.is_integer() and abs(value) < 2 ** 53
+        return value, 0.0 if exact else abs(value) * self.unit
+
+    def constant(self, name):
+        value = calc_engine.CONSTANTS[name]
+        return value, abs(value) * self.unit
+
+    def function(self, name, x):
+        return calc_engine.FUNCTIONS[name](x)
+
+    def power(self, a, b):
+        return float(safe_pow(a, b))
+
+    def log(self, x):
+        return math.log(x)
+
+
+class _DecimalBackend:
+    def __init__(self, precision):
+        self.precision = precision
+        self.unit = float(Decimal(5).scaleb(-precision))
+        self.context = decimal.Context(prec=precision, Emax=999999, Emin=-999999,
+                                       traps=[decimal.DivisionByZero, decimal.Overflow,
+                                              decimal.InvalidOperation])
+
+    def number(self, value):
+        # repr は元の入力の最短表記なので 0.1 は Decimal("0.1") になる
+        value = Decimal(repr(float(value))) if isinstance(value, float) else Decimal(value)
+        return value, 0.0
+
+    def constant(self, name):
+        if name in ("π", "pi"):
+            value = _pi(self.precision)
+        else:
+            value = Decimal(1).exp(self.context)
+        return value, abs(float(value)) * self.unit
+
+    def function(self, name, x):
+        ctx = self.context
+        if name == "sin":
+            return _sin(x, self.precision)
+        if name == "cos":
+            return _cos(x, self.precision)
+        if name == "tan":
+            return ctx.divide(_sin(x, self.precision), _cos(x, self.precision))
+        if name == "log":
+            return x.log10(ctx)
+        if name == "ln":
+            return x.ln(ctx)
+        return x.sqrt(ctx)
+
+    def power(self, a, b):
+        if b == b.to_integral_value() and abs(b) < 10 ** 6:
+            return self.context.power(a, int(b))
+        if a < 0:
+            raise ValueError("math domain error")
+        return self.context.power(a, b)
+
+    def log(self, x):
+        return float(x.ln(self.context))
+
+
+def _pi(precision):
+    """π を指定精度で計算する（decimal モジュールのレシピ）"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision + 2
+        three = Decimal(3)
+        lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = (t * n) / d
+            s += t
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision
+        return +s
+
+
+def _reduce_angle(x, precision):
+    """角度を [-π, π] に縮約する"""
+    with decimal.localcontext() as ctx:
+        # 縮約で失う桁の分だけ精度を上げる
+        ctx.prec = precision + max(0, x.adjusted()) + 5
+        two_pi = 2 * _pi(ctx.prec)
+        x = x - two_pi * (x / two_pi).to_integral_value()
+        return x
+
+
+def _series(x, precision, start, first):
+    """sin / cos のテイラー級数"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision + 5
+        x = _reduce_angle(x, precision)
+        x2 = x * x
+        term = first(x)
+        total = term
+        i = start
+        lasts = None
+        while total != lasts:
+            lasts = total
+            term = -term * x2 / ((i + 1) * (i + 2))
+            total += term
+            i += 2
+    with decimal.localcontext() as ctx:
+        ctx.prec = precision
+        return +total
+
+
+def _sin(x, precision):
+    return _series(x, precision, 1, lambda v: v)
+
+
+def _cos(x, precision):
+    return _series(x, precision, 0, lambda v: Decimal(1))
+
+
+def _propagate(backend, node, env):
+    """構文木を評価し、(値, 誤差の上限) を返す"""
+    kind = node[0]
+    unit = backend.unit
+
+    if kind == "num":
+        return backend.number(node[1])
+    if kind == "const":
+        return backend.constant(node[1])
+    if kind == "var":
+        return backend.number(env[node[1]])
+
+    if kind == "neg":
+        value, error = _propagate(backend, node[1], env)
+        return -value, error
+
+    if kind == "postfix":
+        a, ea = _propagate(backend, node[2], env)
+        if node[1] == "²":
+            r = a * a
+            return r, 2 * abs(float(a)) * ea + ea * ea + unit * abs(float(r))
+        r = a / 100
+        return r, ea / 100 + unit * abs(float(r))
+
+    if kind == "call":
+        name = node[1]
+        a, ea = _propagate(backend, node[2], env)
+        fa = float(a)
+        if name in ("log", "ln", "√", "sqrt"):
+            if a < 0 or (a == 0 and name not in ("√", "sqrt")):
+                raise ValueError("math domain error")
+        r = backend.function(name, a)
+        fr = abs(float(r))
+        if name in ("sin", "cos"):
+            return r, ea + 2 * unit
+        if name == "tan":
+            return r, (1 + fr * fr) * ea + 2 * unit * (1 + fr)
+        if name in ("log", "ln"):
+            scale = 1 / math.log(10) if name == "log" else 1.0
+            if ea >= abs(fa):
+                return r, math.inf
+            return r, scale * ea / (abs(fa) - ea) + unit * (fr + 1)
+        # 平方根
+        if ea >= abs(fa):
+            return r, math.sqrt(ea) + unit * fr
+        return r, ea / (2 * math.sqrt(abs(fa) - ea)) + unit * fr
+
+    if kind == "bin":
+        op = node[1]
+        a, ea = _propagate(backend, node[2], env)
+        b, eb = _propagate(backend, node[3], env)
+        fa, fb = abs(float(a)), abs(float(b))
+        if op == "+":
+            r = a + b
+            return r, ea + eb + unit * abs(float(r))
+        if op == "-":
+            r = a - b
+            return r, ea + eb + unit * abs(float(r))
+        if op == "*":
+            r = a * b
+            return r, fa * eb + fb * ea + ea * eb + unit * abs(float(r))
+        if op == "/":
+            if b == 0:
+                raise ZeroDivisionError("division by zero")
+            r = a / b
+            fr = abs(float(r))
+            if eb >= fb:
+                return r, math.inf
+            return r, (ea + fr * eb) / (fb - eb) + unit * fr
+        # 累乗
+        r = backend.power(a, b)
+        fr = abs(float(r))
+        if a == 0:
+            return r, 0.0 if ea == 0 else math.inf
+        if ea >= fa:
+            return r, math.inf
+        error = fr * (fb * ea / (fa - ea) + abs(backend.log(abs(a))) * eb)
+        return r, error + unit * fr
+
+    raise calc_engine.ExpressionError(f"未知のノードです: {kind}")
+
+
+def _is_rational(node):
+    """有理数の演算だけで書けた式かどうか（fractions で厳密に計算できる）"""
+    kind = node[0]
+    if kind in ("num", "var"):
+        return True
+    if kind == "neg":
+        return _is_rational(node[1])
+    if kind == "postfix":
+        return _is_rational(node[2])
+    if kind == "bin":
+        if node[1] == "^":
+            exponent = node[3]
+            return (_is_rational(node[2]) and exponent[0] == "num"
+                    and float(exponent[1]).is_integer() and abs(exponent[1]) <= 1024)
+        return _is_rational(node[2]) and _is_rational(node[3])
+    return False
+
+
+def _exact(node, env):
+    """fractions で厳密に評価する"""
+    kind = node[0]
+    if kind == "num":
+        return Fraction(repr(node[1]))
+    if kind == "var":
+        value = env[node[1]]
+        return Fraction(repr(value)) if isinstance(value, float) else Fraction(value)
+    if kind == "neg":
+        return -_exact(node[1], env)
+    if kind == "postfix":
+        value = _exact(node[2], env)
+        return value * value if node[1] == "²" else value / 100
+    a = _exact(node[2], env)
+    b = _exact(node[3], env)
+    if node[1] == "+":
+        return a + b
+    if node[1] == "-":
+        return a - b
+    if node[1] == "*":
+        return a * b
+    if node[1] == "/":
+        if b == 0:
+            raise ZeroDivisionError("division by zero")
+        return a / b
+    return a ** int(b)
+
+
+@lru_cache(maxsize=calc_engine.CACHE_SIZE)
+def _analyse(text):
+    tree = calc_engine.parse(text)
+    return tree, _is_rational(tree)
+
+
+def _trusted(value, error, digits):
+    """誤差の上限から、値が要求桁数まで正しいといえるか判定する"""
+    if error == 0:
+        return True
+    return error <= abs(float(value)) * 10.0 ** -digits
+
+
+def evaluate(text, digits=DEFAULT_DIGITS, **env):
+    """式を評価し、digits 桁まで信頼できる PreciseResult を返す"""
+    tree, rational = _analyse(text)
+    missing = calc_engine.compile_expression(text).variables.difference(env)
+    if missing:
+        raise calc_engine.ExpressionError(f"変数の値がありません: {', '.join(sorted(missing))}")
+
+    # 速い経路: float で計算して誤差の上限を確かめる
+    value, error = _propagate(_FloatBackend(), tree, env)
+    if math.isfinite(value) and _trusted(value, error, digits):
+        return PreciseResult(value, error, digits, "float")
+
+    # 有理式は厳密に計算できる
+    if rational:
+        return PreciseResult(_exact(tree, env), 0.0, digits, "fraction")
+
+    # decimal で精度を上げながら再計算する
+    precision = digits + 10
+    while True:
+        backend = _DecimalBackend(precision)
+        try:
+            with decimal.localcontext(backend.context):
+                value, error = _propagate(backend, tree, env)
+        except decimal.DivisionByZero:
+            raise ZeroDivisionError("division by zero")
+        except decimal.Overflow:
+            raise OverflowError("result too large")
+        except decimal.InvalidOperation:
+            raise ValueError("math domain error")
+        if _trusted(value, error, digits):
+            return PreciseResult(value, error, digits, "decimal")
+        if precision >= MAX_PRECISION:
+            break
+        precision = min(precision * 2, MAX_PRECISION)
+
+    if abs(float(value)) > error:
+        # 要求桁数には届かないが、得られた範囲までは信頼できる
+        return PreciseResult(value, error, digits, "decimal")
+    if error <= 10.0 ** -digits:
+        # 誤差の範囲内に 0 が含まれる場合は 0 とみなす（sin(π) など）
+        return PreciseResult(Decimal(0), error, digits, "decimal")
+    # tan(π/2) のような極では値が定まらない
+    raise ArithmeticError("結果の精度を保証できません")
@@ -0,0 +1,273 @@
+"""電卓の評価サービス（社内ツール向けのローカル HTTP サーバー）
+
+使い方:
+    python calc_server.py --port 8765
+    python calc_server.py --unix /tmp/calc.sock
+
+    curl -s localhost:8765/evaluate -d '{"expr": "sin(x)^2", "vars": {"x": 1}}'
+    curl -s localhost:8765/evaluate -d '[{"expr": "1+2"}, {"expr": "9^99"}]'
+    curl -s localhost:8765/stats
+
+リクエストは有限長のキューに入り、短い時間窓でまとめてプロセスプールに
+渡される。キューが満杯のときは 503 を返して呼び出し側に待ってもらう。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import calc_core
+
+# 1 回でプロセスに渡す最大件数
+BATCH_SIZE = 256
+# バッチを集める最大待ち時間（秒）
+BATCH_WINDOW = 0.002
+# 待ち行列の上限（これを超えると 503 を返す）
+QUEUE_SIZE = 10000
+# レイテンシ統計に使う直近の件数
+LATENCY_WINDOW = 10000
+# リクエスト本文の上限（バイト）
+MAX_BODY = 1 << 20
+
+
+def evaluate_chunk(items):
+    """ワーカープロセスで式をまとめて評価する"""
+    results = []
+    for expression, env in items:
+        try:
+            results.append(calc_core.evaluate(expression, **env))
+        except Exception:
+            # vars が数値でない場合など。1 件の失敗でバッチ全体を失敗させない
+            results.append("Error")
+    return results
+
+
+class CalculatorService:
+    """マイクロバッチ化してプロセスプールで式を評価するサービス"""
+
+    def __init__(self, workers=None, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW,
+                 queue_size=QUEUE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.pool = None
+        self.batchers = []
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.completed = 0
+        self.rejected = 0
+        self.batches = 0
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # ワーカー数だけバッチャーを動かし、全コアを使い切る
+        self.batchers = [asyncio.create_task(self._batcher()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.batchers:
+            task.cancel()
+        await asyncio.gather(*self.batchers, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+
+    def submit(self, expression, env):
+        """式をキューに入れる。満杯なら None を返す"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((expression, env, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return None
+        return future
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [(expression, env) for expression, env, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.pool, evaluate_chunk, items)
+            except Exception as e:
+                results = [e] * len(batch)
+            self.batches += 1
+
+            now = time.perf_counter()
+            for (_, _, future, started), result in zip(batch, results):
+                latency = now - started
+                self.latencies.append(latency)
+                self.completed += 1
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result((result, latency))
+
+    def stats(self):
+        """処理件数とレイテンシのパーセンタイルを返す"""
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+        return {
+            "workers": self.workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "queued": self.queue.qsize(),
+            "latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)},
+        }
+
+
+# HTTP 処理 -----------------------------------------------------------
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found",
+               413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def _response(status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+             "Content-Type: application/json; charset=utf-8",
+             f"Content-Length: {len(body)}", *headers, "", ""]
+    return "\r\n".join(lines).encode("latin-1") + body
+
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise OverflowError
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+async def _evaluate(service, payload):
+    """1 件またはリストのリクエストを評価する"""
+    single = isinstance(payload, dict)
+    requests = [payload] if single else payload
+    futures = []
+    for request in requests:
+        future = service.submit(request["expr"], request.get("vars") or {})
+        if future is None:
+            for pending in futures:
+                pending.cancel()
+            return None
+        futures.append(future)
+
+    responses = []
+    for request, (result, latency) in zip(requests, await asyncio.gather(*futures)):
+        responses.append({"id": request.get("id"), "result": result,
+                          "latency_ms": round(latency * 1000, 3)})
+    return responses[0] if single else responses
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except OverflowError:
+                writer.write(_response(413, {"error": "リクエストが大きすぎます"}))
+                break
+            except (ValueError, asyncio.IncompleteReadError):
+                writer.write(_response(400, {"error": "不正なリクエストです"}))
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+
+            if method == "GET" and path == "/stats":
+                writer.write(_response(200, service.stats()))
+            elif method == "POST" and path == "/evaluate":
+                try:
+                    result = await _evaluate(service, json.loads(body))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    writer.write(_response(400, {"error": f"不正なリクエスト: {e}"}))
+                else:
+                    if result is None:
+                        # 背圧: キューが満杯なので少し待ってから再送してもらう
+                        writer.write(_response(503, {"error": "混雑しています"}, ["Retry-After: 1"]))
+                    else:
+                        writer.write(_response(200, result))
+            else:
+                writer.write(_response(404, {"error": "見つかりません"}))
+            await writer.drain()
+
+            if headers.get("connection", "").lower() == "close":
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, **options):
+    service = CalculatorService(**options)
+    await service.start()
+
+    def handler(reader, writer):
+        return handle_connection(service, reader, writer)
+
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+        print(f"calc_server: {unix_path} で待ち受け中 (workers={service.workers})")
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        print(f"calc_server: http://{host}:{port} で待ち受け中 (workers={service.workers})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="電卓の評価サービスを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Unix ソケットのパス（指定すると TCP の代わりに使う）")
+    parser.add_argument("--workers", type=int, help="ワーカープロセス数（既定は CPU 数）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, workers=args.workers,
+                          batch_size=args.batch_size, queue_size=args.queue_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
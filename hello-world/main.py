@@ -1,5 +1,27 @@
+import os
+import threading
+import time
+
+# 起動時間はこのモジュールを import した時刻から数えるので、flet より先に import する
+import startup_profile
+
 import flet as ft
-import math
+
+import calc_core
+import calc_history
+import calc_metrics
+
+# グラフ用の calc_plot は numpy の import に時間がかかるので、最初の画面を表示したあとに import する
+IMPORT_SECONDS = startup_profile.elapsed()  # import にかかった時間
+
+# キーボードのキー → 電卓のボタン
+KEYBOARD_KEYS = {
+    "Enter": "=", "Numpad Enter": "=", "=": "=", "Escape": "AC",
+    "Numpad Add": "+", "Numpad Subtract": "-", "Numpad Multiply": "*", "Numpad Divide": "/",
+    "Numpad Decimal": ".", "+": "+", "-": "-", "*": "*", "/": "/", "^": "x^y",
+    "%": "%", ".": ".", "(": "(", ")": ")",
+    "Arrow Up": "↑", "Arrow Down": "↓",  # 計算履歴の呼び出し
+}
 
 # ボタンの基本クラス
 class CalcButton(ft.ElevatedButton):
@@ -46,6 +68,12 @@ class CalculatorApp(ft.Container):
 
         # 結果表示用テキスト
         self.result = ft.Text(value="0", color=ft.colors.WHITE, size=20)
+        self.display = "0"  # 次の描画で表示する値
+
+        # キー入力のレイテンシ計測と、連続入力の描画をまとめる仕組み
+        self.lock = threading.Lock()
+        self.metrics = calc_metrics.KeystrokeMetrics()
+        self.coalescer = calc_metrics.UpdateCoalescer(self.render, self.metrics)
 
         # 電卓の全体デザイン
         self.width = 450  # 幅を増やしてボタンを収容
@@ -123,49 +151,236 @@ class CalculatorApp(ft.Container):
 
     # ボタンがクリックされたときの処理
     def button_clicked(self, e):
-        data = e.control.data  # クリックされたボタンのデータ（テキスト）
-        print(f"Button clicked with data = {data}")
+        self.press(e.control.data)  # クリックされたボタンのデータ（テキスト）
+
+    # キーボードが押されたときの処理
+    def key_pressed(self, e):
+        key = e.key
+        if key.startswith("Numpad ") and key[-1].isdigit():
+            key = key[-1]
+        if e.shift and key == "=":
+            key = "+"  # Shift + = で + を入力するキーボード配列
+        key = KEYBOARD_KEYS.get(key, key)
+        if key.isdigit() or key in KEYBOARD_KEYS.values():
+            self.press(key)
 
-        # 各ボタンに応じた動作（ACでリセット、四則演算、科学計算など）
-        # ここに記述されたロジックは省略せず、特定の計算やエラー処理を行う
+    # キー入力を処理して描画を要求する
+    def press(self, data):
+        started = time.perf_counter()
+        # キー入力の処理は GUI に依存しない calc_core.Keypad に任せる
+        with self.lock:
+            self.display = self.keypad.press(data)
+        self.metrics.handler.record(time.perf_counter() - started)
+        # 連続入力はまとめて 1 回だけ描画する
+        self.coalescer.request(started)
+
+    # 最新の表示内容を描画する
+    def render(self):
+        self.result.value = self.display
+        self.update()
+
+    # 式全体を評価する
+    def evaluate(self, expression):
+        return calc_core.evaluate(expression)
 
     # 数値のフォーマット処理
     def format_number(self, num):
-        if num % 1 == 0:
-            return int(num)  # 整数として返す
-        else:
-            return num  # 小数のまま返す
+        return calc_core.format_number(num)
 
     # 計算処理
     def calculate(self, operand1, operand2, operator):
-        # 四則演算や累乗などを実行
-        try:
-            if operator == "+":
-                return self.format_number(operand1 + operand2)
-            elif operator == "-":
-                return self.format_number(operand1 - operand2)
-            elif operator == "*":
-                return self.format_number(operand1 * operand2)
-            elif operator == "/":
-                if operand2 == 0:
-                    return "Error"  # ゼロ除算をエラーで返す
-                else:
-                    return self.format_number(operand1 / operand2)
-            elif operator == "x^y":
-                return self.format_number(operand1 ** operand2)
-        except:
-            return "Error"  # 例外処理
+        return calc_core.calculate(operand1, operand2, operator)
 
     # 初期化処理
     def reset(self):
-        self.operator = "+"  # 初期演算子
-        self.operand1 = 0  # 最初のオペランド
-        self.new_operand = True  # 新しい入力を示すフラグ
+        # 計算履歴（保存先のデータベースは最初の画面を表示したあとに open_history で開く）
+        self.history = calc_history.CalculationHistory()
+        self.keypad = calc_core.Keypad(history=self.history)
+
+    # 保存した計算履歴を読み込む（CALC_HISTORY_DB を指定すると SQLite に保存する）
+    def open_history(self):
+        path = os.environ.get("CALC_HISTORY_DB")
+        if path is None:
+            return
+        history = calc_history.CalculationHistory(path=path)
+        with self.lock:
+            # 読み込む前に計算した分も新しい履歴として残す
+            for position in range(len(self.history)):
+                entry = self.history[position]
+                history.append(entry.expression, entry.result)
+            self.history = history
+            self.keypad.history = history
+
+# グラフ・数表モード
+class PlotView(ft.Container):
+    def __init__(self, expression="sin(x)"):
+        super().__init__()
+        self.sampler = None  # 式ごとのサンプラー（拡大・縮小で点を再利用する）
+        self.view = (-10.0, 10.0)  # 表示範囲
+
+        self.expression_field = ft.TextField(label="f(x)", value=expression, expand=True,
+                                             on_submit=self.draw_clicked)
+        self.start_field = ft.TextField(label="開始", value="-10", width=90)
+        self.stop_field = ft.TextField(label="終了", value="10", width=90)
+        self.message = ft.Text(color=ft.colors.RED_300, size=12)
+
+        self.chart = ft.LineChart(
+            data_series=[],
+            min_x=self.view[0],
+            max_x=self.view[1],
+            height=260,
+            interactive=False,
+            horizontal_grid_lines=ft.ChartGridLines(color=ft.colors.WHITE10),
+            vertical_grid_lines=ft.ChartGridLines(color=ft.colors.WHITE10),
+        )
+        self.table = ft.Column(scroll=ft.ScrollMode.AUTO, height=160, spacing=2)
+
+        self.width = 450
+        self.bgcolor = ft.colors.BLACK
+        self.border_radius = ft.border_radius.all(20)
+        self.padding = 20
+        self.content = ft.Column(
+            controls=[
+                ft.Row(controls=[self.expression_field]),
+                ft.Row(
+                    controls=[
+                        self.start_field,
+                        self.stop_field,
+                        ScientificButton(text="描画", button_clicked=self.draw_clicked),
+                        ScientificButton(text="数表", button_clicked=self.table_clicked),
+                    ]
+                ),
+                ft.Row(
+                    controls=[
+                        ExtraActionButton(text="拡大", button_clicked=self.zoom_clicked),
+                        ExtraActionButton(text="縮小", button_clicked=self.zoom_clicked),
+                        ExtraActionButton(text="←", button_clicked=self.pan_clicked),
+                        ExtraActionButton(text="→", button_clicked=self.pan_clicked),
+                    ]
+                ),
+                self.message,
+                self.chart,
+                self.table,
+            ]
+        )
+
+    # 入力欄の内容で描画する
+    def draw_clicked(self, e):
+        try:
+            self.view = (float(self.start_field.value), float(self.stop_field.value))
+        except ValueError:
+            self.show_message("範囲には数値を入力してください。")
+            return
+        self.redraw()
+
+    # 表示範囲の中心を保ったまま拡大・縮小する
+    def zoom_clicked(self, e):
+        factor = 0.5 if e.control.data == "拡大" else 2.0
+        center = (self.view[0] + self.view[1]) / 2
+        half = (self.view[1] - self.view[0]) / 2 * factor
+        self.view = (center - half, center + half)
+        self.redraw()
+
+    # 表示範囲を左右に動かす
+    def pan_clicked(self, e):
+        shift = (self.view[1] - self.view[0]) / 4
+        if e.control.data == "←":
+            shift = -shift
+        self.view = (self.view[0] + shift, self.view[1] + shift)
+        self.redraw()
+
+    def show_message(self, text):
+        self.message.value = text
+        self.message.update()
+
+    # グラフを再描画する（既存の点のコントロールを再利用して差分だけ送る）
+    def redraw(self):
+        import calc_plot
+
+        expression = self.expression_field.value
+        start, stop = self.view
+        if not stop > start:
+            self.show_message("終了は開始より大きくしてください。")
+            return
+        try:
+            if self.sampler is None or self.sampler.expression != expression:
+                self.sampler = calc_plot.PlotSampler(expression)
+            x, y = self.sampler.sample(start, stop)
+        except (ArithmeticError, ValueError, TypeError) as error:
+            self.show_message(f"式を評価できません: {error}")
+            return
+
+        segments = calc_plot.segments(x, y)
+        series = self.chart.data_series
+        for index, (seg_x, seg_y) in enumerate(segments):
+            if index == len(series):
+                series.append(ft.LineChartData(data_points=[], color=ft.colors.ORANGE,
+                                               stroke_width=2))
+            points = series[index].data_points
+            for i, (px, py) in enumerate(zip(seg_x.tolist(), seg_y.tolist())):
+                if i < len(points):
+                    points[i].x = px
+                    points[i].y = py
+                else:
+                    points.append(ft.LineChartDataPoint(px, py))
+            del points[len(seg_x):]
+        del series[len(segments):]
+
+        # 漸近線の巨大な値で縦軸がつぶれないように分位点で範囲を決める
+        y_range = calc_plot.y_range(x, y)
+        if y_range is not None:
+            self.chart.min_y, self.chart.max_y = y_range
+        self.chart.min_x, self.chart.max_x = start, stop
+        self.start_field.value = f"{start:g}"
+        self.stop_field.value = f"{stop:g}"
+        self.message.value = f"{len(x)} 点"
+        self.update()
+
+    # 数表を表示する
+    def table_clicked(self, e):
+        import calc_plot
+
+        try:
+            start, stop = float(self.start_field.value), float(self.stop_field.value)
+            rows = calc_plot.tabulate(self.expression_field.value, start, stop, (stop - start) / 20)
+        except (ArithmeticError, ValueError, TypeError) as error:
+            self.show_message(f"数表を作れません: {error}")
+            return
+        self.table.controls = [
+            ft.Text(f"x = {x:<12}  f(x) = {value}", color=ft.colors.WHITE, size=12)
+            for x, value in rows
+        ]
+        self.table.update()
 
 # メインアプリケーションの起動
 def main(page: ft.Page):
+    # 起動時間はセッションごとに、main に入った時刻から記録する
+    startup = startup_profile.StartupProfile(IMPORT_SECONDS)
     page.title = "Scientific Calculator"  # タイトル
     calc = CalculatorApp()  # 電卓アプリのインスタンス
-    page.add(calc)  # ページに追加
+    plot = PlotView()  # グラフ・数表モード
+    page.on_keyboard_event = calc.key_pressed  # キーボード入力
+    if os.environ.get("CALC_METRICS"):
+        # 終了時にキー入力のレイテンシを表示する
+        page.on_disconnect = lambda e: print(calc.metrics.report())
+    page.add(
+        ft.Tabs(
+            tabs=[
+                ft.Tab(text="電卓", content=calc),
+                ft.Tab(text="グラフ", content=plot),
+            ],
+            expand=True,
+        )
+    )  # ページに追加
+    startup.mark("最初の画面")
+
+    # 重い import と I/O は最初の画面を送ったあとに行う
+    calc.open_history()
+    startup.mark("履歴の読み込み")
+    # グラフを初めて描くときに待たないように、ここで読み込んでおく
+    import calc_plot
+    startup.mark("遅延 import")
+    startup.report()
 
-ft.app(target=main)  # アプリを起動
+if __name__ == "__main__":
+    ft.app(target=main)  # アプリを起動
@@ -0,0 +1,126 @@
+"""気象庁 API の取得処理（天気アプリ共通）
+
+接続を使い回す requests.Session に、タイムアウトと再試行を設定する。
+一度取得した JSON は ETag / Last-Modified と一緒に覚えておき、
+次回は条件付きリクエストを送る。変化がなければ 304 が返るので本文を
+ダウンロードせずに済む。
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 気象庁のAPIエンドポイント（JMA_BASE_URL で差し替えられる）
+JMA_BASE_URL = os.environ.get("JMA_BASE_URL", "http://www.jma.go.jp/bosai")
+AREA_URL = f"{JMA_BASE_URL}/common/const/area.json"
+FORECAST_URL = JMA_BASE_URL + "/forecast/data/forecast/{}.json"
+
+# (接続, 読み込み) のタイムアウト（秒）
+TIMEOUT = (3.05, 10)
+# 再試行の回数と間隔（0.5 秒, 1 秒, 2 秒 …）
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# 接続プールの大きさ
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+# URL → (ETag, Last-Modified, JSON)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def set_base_url(base_url):
+    """取得先を差し替える（ローカルのサーバーで試すとき用）
+
+    fetch_area_data、fetch_weather_data、先読み（prefetch.py）、スケジューラは
+    次の取得から新しい取得先を使う（どれも取得のたびに jma_client.FORECAST_URL を読む）。
+    """
+    global JMA_BASE_URL, AREA_URL, FORECAST_URL
+    JMA_BASE_URL = base_url.rstrip("/")
+    AREA_URL = f"{JMA_BASE_URL}/common/const/area.json"
+    FORECAST_URL = JMA_BASE_URL + "/forecast/data/forecast/{}.json"
+    clear_cache()
+
+
+def get_session():
+    """共有の Session を返す（初回だけ作成する）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            _session = session
+        return _session
+
+
+def fetch_json(url, timeout=TIMEOUT):
+    """URL の JSON を取得する（変化がなければ前回の結果を返す）
+
+    失敗した場合は requests.RequestException を送出する。
+    """
+    with _cache_lock:
+        cached = _cache.get(url)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    response = get_session().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        if cached is not None:
+            return cached[2]
+        # 条件を付けずに送ったのに 304 が返った（途中のキャッシュなど）。本文がないので取り直す
+        response = get_session().get(url, headers={"Cache-Control": "no-cache"}, timeout=timeout)
+        if response.status_code == 304:
+            raise requests.HTTPError(f"304 が返りましたが前回の結果がありません: {url}",
+                                     response=response)
+    response.raise_for_status()
+    data = response.json()
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        with _cache_lock:
+            _cache[url] = (etag, last_modified, data)
+    return data
+
+
+def fetch_area_data():
+    """地域情報（area.json）を取得する"""
+    return fetch_json(AREA_URL)
+
+
+def fetch_weather_data(region_code):
+    """指定された地域コードの天気データを取得する関数"""
+    try:
+        return fetch_json(FORECAST_URL.format(region_code))
+    except requests.HTTPError as e:
+        print(f"[ERROR] 天気データ取得失敗: ステータスコード {e.response.status_code}")
+        return None
+    except Exception as e:
+        print(f"[EXCEPTION] 天気データ取得中にエラー発生: {e}")
+        return None
+
+
+def clear_cache():
+    """条件付きリクエスト用に覚えている結果を消去する"""
+    with _cache_lock:
+        _cache.clear()
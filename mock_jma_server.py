@@ -0,0 +1,266 @@
+"""気象庁 API の代わりに使うローカルのサーバー（ベンチマークや通信なしの動作確認用）
+
+使い方:
+    python mock_jma_server.py --port 8765 --latency 0.2 --error-rate 0.05
+    JMA_BASE_URL=http://127.0.0.1:8765 python weather2.py
+
+- /common/const/area.json: area_debug.json をそのまま返す
+- /forecast/data/forecast/<office>.json: 気象庁と同じ形の予報を作って返す。
+  値は地域コードと発表日時から決まるので、同じ発表の間は毎回同じ内容になる
+- 応答の遅れ（latency + 0〜jitter 秒）、エラーの割合、予報の大きさ（scale 倍の地域数）を変えられる
+- ETag を付けるので、条件付きリクエスト（304）の動作も確かめられる
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from forecast_scheduler import latest_publish
+
+AREA_DEBUG_PATH = Path(__file__).with_name("area_debug.json")
+FORECAST_PATH = re.compile(r"^/forecast/data/forecast/(\d+)\.json$")
+AREA_PATH = "/common/const/area.json"
+
+# 予報に使う (天気コード, 天気)
+WEATHERS = (
+    ("100", "晴れ"),
+    ("101", "晴れ　時々　くもり"),
+    ("200", "くもり"),
+    ("202", "くもり　一時　雨"),
+    ("300", "雨"),
+    ("400", "雪"),
+)
+WINDS = ("北の風", "北の風　やや強く", "南の風", "西の風　後　北の風")
+WAVES = ("０．５メートル", "１メートル", "１．５メートル　後　２メートル")
+
+
+def _time_defines(start, hours, count):
+    """start から hours 時間ごとの時刻を count 個、気象庁の形式で返す"""
+    return [(start + timedelta(hours=hours * i)).isoformat() for i in range(count)]
+
+
+def synthetic_forecast(office_code, areas, report, scale=1):
+    """office の予報（3 日分と週間の 2 件の発表）を作る
+
+    class10（一次細分区域）ごとに天気・風・波・降水確率・気温の系列を並べる。
+    scale を大きくすると地域を増やして応答を大きくできる。
+    """
+    rng = random.Random(f"{office_code}/{report.isoformat()}")
+    office = areas["offices"][office_code]
+    regions = [(code, areas["class10s"][code]["name"])
+               for code in office.get("children", []) if code in areas["class10s"]]
+    regions = regions or [(office_code, office["name"])]
+    regions = [(code if copy == 0 else f"{code}{copy:02d}", name)
+               for copy in range(scale) for code, name in regions]
+    day = report.replace(hour=0, minute=0, second=0, microsecond=0)
+    base_temp = rng.uniform(-5, 30)
+
+    def weather_columns(count):
+        picks = [rng.choice(WEATHERS) for _ in range(count)]
+        return [code for code, _ in picks], [name for _, name in picks]
+
+    short_weather, short_pops, short_temps = [], [], []
+    for code, name in regions:
+        codes, names = weather_columns(3)
+        short_weather.append({
+            "area": {"name": name, "code": code},
+            "weatherCodes": codes,
+            "weathers": names,
+            "winds": [rng.choice(WINDS) for _ in range(3)],
+            "waves": [rng.choice(WAVES) for _ in range(3)],
+        })
+        short_pops.append({
+            "area": {"name": name, "code": code},
+            "pops": [str(rng.randrange(0, 101, 10)) for _ in range(6)],
+        })
+        short_temps.append({
+            "area": {"name": name, "code": code},
+            "temps": [str(round(base_temp + rng.uniform(-8, 8))) for _ in range(4)],
+        })
+
+    codes, _ = weather_columns(7)
+    weekly = [{
+        "area": {"name": office["name"], "code": office_code},
+        "weatherCodes": codes,
+        "pops": [""] + [str(rng.randrange(0, 101, 10)) for _ in range(6)],
+        "reliabilities": ["", ""] + [rng.choice("ABC") for _ in range(5)],
+    }]
+    report_datetime = report.isoformat()
+    return [
+        {
+            "publishingOffice": office.get("officeName", ""),
+            "reportDatetime": report_datetime,
+            "timeSeries": [
+                {"timeDefines": _time_defines(report, 24, 3), "areas": short_weather},
+                {"timeDefines": _time_defines(day + timedelta(hours=report.hour // 6 * 6), 6, 6),
+                 "areas": short_pops},
+                {"timeDefines": _time_defines(day + timedelta(hours=9), 15, 4),
+                 "areas": short_temps},
+            ],
+        },
+        {
+            "publishingOffice": office.get("officeName", ""),
+            "reportDatetime": report_datetime,
+            "timeSeries": [
+                {"timeDefines": _time_defines(day + timedelta(days=1), 24, 7), "areas": weekly},
+            ],
+        },
+    ]
+
+
+class MockJMAServer:
+    """バックグラウンドのスレッドで動く気象庁 API の代わり"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, scale=1, etag=True, area_path=AREA_DEBUG_PATH, seed=None):
+        with open(area_path, encoding="utf-8") as f:
+            self.areas = json.load(f)
+        self._area_body = json.dumps(self.areas, ensure_ascii=False).encode("utf-8")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.scale = scale
+        self.etag = etag
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bodies = {}  # (office, 発表日時) → (ETag, 本文)
+        self.stats = {"requests": 0, "errors": 0, "not_modified": 0, "bytes": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """JMA_BASE_URL に指定する URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def forecast_body(self, office_code, report=None):
+        """office の予報の (ETag, 本文) を返す（同じ発表の間は作り直さない）"""
+        report = report or latest_publish()
+        key = (office_code, report)
+        with self._lock:
+            cached = self._bodies.get(key)
+        if cached is None:
+            data = synthetic_forecast(office_code, self.areas, report, self.scale)
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            cached = (f'"{hashlib.md5(body).hexdigest()}"', body)
+            with self._lock:
+                self._bodies[key] = cached
+        return cached
+
+    def _draw(self):
+        """この要求の (遅れ, エラーにするかどうか) を決める"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        return delay, failed
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 接続を使い回せるようにする
+            # ヘッダーと本文を別々に書くので、Nagle を止めないと遅延 ACK の分（約 40ms）待たされる
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server._count("requests")
+                delay, failed = server._draw()
+                if delay:
+                    time.sleep(delay)
+                if failed:
+                    server._count("errors")
+                    self._send(server.error_status, b'{"error": "mock error"}')
+                    return
+
+                path = self.path.split("?", 1)[0]
+                if path == AREA_PATH:
+                    self._send(200, server._area_body)
+                    return
+                match = FORECAST_PATH.match(path)
+                if match is None or match.group(1) not in server.areas["offices"]:
+                    self._send(404, b'{"error": "not found"}')
+                    return
+                etag, body = server.forecast_body(match.group(1))
+                if server.etag and self.headers.get("If-None-Match") == etag:
+                    server._count("not_modified")
+                    self._send(304, b"", etag)
+                    return
+                self._send(200, body, etag if server.etag else None)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count("bytes", len(body))
+
+            def log_message(self, format, *args):
+                pass  # 要求ごとのログは出さない
+
+        return Handler
+
+    def start(self):
+        """バックグラウンドのスレッドで待ち受けを始める"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever,
+                                            name="mock-jma-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """このスレッドで待ち受ける（Ctrl+C で終了）"""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="気象庁 API の代わりのローカルサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答の遅れ（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅れに足すばらつきの上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す割合（0〜1）")
+    parser.add_argument("--error-status", type=int, default=503, help="エラーのステータスコード")
+    parser.add_argument("--scale", type=int, default=1, help="予報に含める地域の倍率")
+    parser.add_argument("--no-etag", action="store_true", help="ETag を付けない")
+    args = parser.parse_args(argv)
+
+    server = MockJMAServer(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                           args.error_status, args.scale, etag=not args.no_etag)
+    print(f"{server.url} で待ち受けています（JMA_BASE_URL={server.url}）")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""全地域（office）の天気予報を並行して取得し、WeatherDatabase に保存する
+
+使い方:
+    python prefetch.py                 # weather_forecast.db に全地域を保存
+    python prefetch.py --concurrency 4
+
+取得は asyncio で同時実行数を制限しながら並行に行い、保存は
+イベントループのスレッドで 1 件ずつ行う（SQLite の接続を共有しないため）。
+全体の所要時間はおおよそ最も遅い 1 リクエスト分になる。
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from area_cache import AreaCache
+import jma_client
+from forecast_parser import forecast_rows, parse_forecast_columns
+from jma_client import POOL_SIZE, fetch_json
+from weather_db import WeatherDatabase
+
+# 同時に送るリクエストの上限（接続プールの大きさを超えないようにする）
+DEFAULT_CONCURRENCY = 8
+
+# アプリのプロセスで 1 回だけ行う先読みのスレッド
+_app_prefetch = None
+_app_prefetch_lock = threading.Lock()
+
+
+def office_codes(areas):
+    """地域情報から office のコードを返す"""
+    return list(areas.get("offices", {}).keys())
+
+
+async def _fetch_office(code, semaphore, executor):
+    """1 地域の予報を取得し、(コード, データ, 所要時間, エラー) を返す"""
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            # requests は同期処理なのでスレッドで実行する（接続は共有の Session で使い回す）
+            data = await asyncio.get_running_loop().run_in_executor(
+                executor, fetch_json, jma_client.FORECAST_URL.format(code))
+        except (requests.RequestException, ValueError) as e:
+            return code, None, time.perf_counter() - started, e
+        return code, data, time.perf_counter() - started, None
+
+
+async def prefetch_all(db, codes, concurrency=DEFAULT_CONCURRENCY):
+    """codes の天気予報を並行して取得して db に保存し、結果の集計を返す"""
+    concurrency = max(1, min(concurrency, POOL_SIZE))
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    saved, failed, slowest = 0, {}, 0.0
+    # 既定のスレッドプールは CPU 数で上限が決まるので、同時実行数に合わせて用意する
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="prefetch") as executor:
+        tasks = [asyncio.create_task(_fetch_office(code, semaphore, executor)) for code in codes]
+        for task in asyncio.as_completed(tasks):
+            code, data, elapsed, error = await task
+            if error is not None:
+                failed[code] = str(error)
+                continue
+            slowest = max(slowest, elapsed)
+            # 時刻ごとの dict を作らず、列のまま保存する
+            series_list = parse_forecast_columns(data)
+            if not series_list:
+                failed[code] = "天気情報が見つかりませんでした"
+                continue
+            db.save_forecast_rows(code, forecast_rows(series_list), series_list[0].report_datetime)
+            saved += 1
+
+    return {
+        "offices": len(codes),
+        "saved": saved,
+        "failed": failed,
+        "elapsed": time.perf_counter() - started,
+        "slowest_request": slowest,
+    }
+
+
+def run_prefetch(db_path="weather_forecast.db", concurrency=DEFAULT_CONCURRENCY, areas=None):
+    """全地域の先読みを同期的に実行する"""
+    if areas is None:
+        areas = AreaCache().load()
+    db = WeatherDatabase(db_path)
+    try:
+        return asyncio.run(prefetch_all(db, office_codes(areas), concurrency))
+    finally:
+        db.close()
+
+
+def start_background_prefetch(db_path="weather_forecast.db", concurrency=DEFAULT_CONCURRENCY,
+                              areas=None, on_done=None):
+    """全地域の先読みをバックグラウンドのスレッドで始める"""
+    def worker():
+        try:
+            summary = run_prefetch(db_path, concurrency, areas)
+        except Exception as e:
+            print(f"[WARN] 天気予報の先読みに失敗しました: {e}")
+            return
+        if on_done is not None:
+            on_done(summary)
+
+    thread = threading.Thread(target=worker, name="forecast-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_prefetch_once(db_path="weather_forecast.db", concurrency=DEFAULT_CONCURRENCY, areas=None):
+    """プロセスで最初の呼び出しのときだけ先読みを始め、そのスレッドを返す
+
+    Flet はセッション（ウィンドウやタブ）ごとに main を呼ぶので、アプリからは
+    こちらを使い、セッションが増えても全地域の取得を何度も行わないようにする。
+    """
+    global _app_prefetch
+    with _app_prefetch_lock:
+        if _app_prefetch is None:
+            _app_prefetch = start_background_prefetch(db_path, concurrency, areas)
+        return _app_prefetch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="全地域の天気予報を先読みする")
+    parser.add_argument("--db", default="weather_forecast.db", help="データベースのパス")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="同時に送るリクエストの上限")
+    args = parser.parse_args(argv)
+
+    summary = run_prefetch(args.db, args.concurrency)
+    print(f"{summary['saved']}/{summary['offices']} 地域を保存しました "
+          f"({summary['elapsed']:.2f} 秒, 最も遅いリクエスト {summary['slowest_request']:.2f} 秒)")
+    for code, error in summary["failed"].items():
+        print(f"  [ERROR] {code}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""起動時間の計測（天気アプリ・辞書アプリ共通。電卓アプリは hello-world/ に同じものを置いている）
+
+使い方:
+    STARTUP_PROFILE=1 python weather2.py
+
+アプリで最初に import し、import にかかった時間と、main の中の段階（最初の画面、
+プルダウンの表示など）ごとの時間を記録する。STARTUP_PROFILE を指定したときだけ表示する。
+Python 自体の起動時間は含まない。モジュールごとの import 時間を詳しく見るときは
+python -X importtime weather2.py を使う。
+
+Flet はセッション（ウィンドウやブラウザのタブ）ごとに main を呼ぶので、
+StartupProfile は main の中でセッションごとに作る。段階の時間は main に入った時刻から、
+import の時間だけはこのモジュールを読み込んだ時刻から数える。
+"""
+
+import os
+import sys
+import time
+
+# 記録を表示するかどうか
+ENABLED = bool(os.environ.get("STARTUP_PROFILE"))
+# このモジュールを最初に import した時刻（import の時間はここから数える）
+STARTED = time.perf_counter()
+
+
+def elapsed():
+    """このモジュールを import してからの秒数を返す"""
+    return time.perf_counter() - STARTED
+
+
+class StartupProfile:
+    """1 つのセッションの起動時間を段階ごとに記録する"""
+
+    def __init__(self, import_seconds=None, enabled=ENABLED):
+        self.enabled = enabled
+        self.import_seconds = import_seconds  # import にかかった秒数（モジュールで測っておいた値）
+        self.started = time.perf_counter()  # main に入った時刻
+        self.marks = []  # (段階, main に入ってからの秒数)
+
+    def mark(self, name):
+        """段階 name が終わった時刻を記録し、main に入ってからの秒数を返す"""
+        seconds = time.perf_counter() - self.started
+        self.marks.append((name, seconds))
+        return seconds
+
+    def report(self, file=None):
+        """記録を表示する（STARTUP_PROFILE のときだけ）"""
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        print("起動時間:", file=file)
+        if self.import_seconds is not None:
+            print(f"  {'import':<20}{self.import_seconds * 1000:8.1f} ms  (プロセスの起動から)",
+                  file=file)
+        previous = 0.0
+        for name, seconds in self.marks:
+            print(f"  {name:<20}{seconds * 1000:8.1f} ms  (+{(seconds - previous) * 1000:.1f} ms)",
+                  file=file)
+            previous = seconds
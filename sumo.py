@@ -1,6 +1,10 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from retry import retry
+import argparse
+import queue
+import threading
 import time
 import logging
 import sqlite3
@@ -115,40 +119,261 @@ def extract_property_data(property_item):
     
     return property_data
 
-def main():
-    conn, cursor = init_database()
-    
+# 並行取得モードの設定
+# 同時に取得するスレッドの数
+DEFAULT_WORKERS = 4
+# 1 秒あたりのリクエスト数（開始時・下限・上限）
+DEFAULT_RATE = 0.5
+MIN_RATE = 0.2
+MAX_RATE = 4.0
+# 1 ページを取得し直す回数の上限
+MAX_ATTEMPTS = 3
+# 混雑を示すステータスコード（レートを下げて取得し直す）
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+class AdaptiveRateLimiter:
+    """トークンバケットでリクエストの間隔を制御し、応答に合わせてレートを変える
+
+    トークンは 1 秒に rate 個たまり（最大 burst 個）、リクエストごとに 1 個使う。
+    429 や 5xx、タイムアウトが返ったらレートを decrease 倍に下げ（Retry-After が
+    あればその間はすべてのスレッドを止める）、混雑せずに healthy_interval 秒たつごとに
+    レートを上げる。最初に混雑するまでは 2 倍ずつ上げて上限を早く探し、
+    その後は increase ずつ上げる（AIMD）。上げる間隔を件数ではなく時間で決めるので、
+    レートが下がったあとも同じ速さで戻る。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE, burst=1,
+                 increase=0.25, decrease=0.5, healthy_interval=2.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0 or min_rate <= 0 or max_rate <= 0:
+            raise ValueError('レートは 0 より大きくしてください')
+        # 上限が下限より小さければ上限に合わせ、開始時のレートは下限と上限の間に収める
+        self.min_rate = min(min_rate, max_rate)
+        self.max_rate = max_rate
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.healthy_interval = healthy_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._resume_at = 0.0  # Retry-After で止めている間はこの時刻まで待つ
+        self._slow_start = True  # まだ一度も混雑していない
+        self._changed = clock()  # 最後にレートを変えた時刻
+        self._last_decrease = float('-inf')
+        self.stats = {'requests': 0, 'throttled': 0, 'increased': 0, 'decreased': 0}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """トークンが 1 個たまるまで待ってから使う"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._resume_at - now
+                if wait <= 0:
+                    # 待ったあとの補充は丸め誤差で 1 にわずかに届かないことがある
+                    if self._tokens >= 1 - 1e-9:
+                        self._tokens -= 1
+                        self.stats['requests'] += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def on_success(self):
+        """混雑しない状態が続いていればレートを上げる"""
+        with self._lock:
+            now = self._clock()
+            if now - self._changed >= self.healthy_interval and self.rate < self.max_rate:
+                self._refill(now)
+                increased = self.rate * 2 if self._slow_start else self.rate + self.increase
+                self.rate = min(self.max_rate, increased)
+                self._changed = now
+                self.stats['increased'] += 1
+
+    def on_throttle(self, retry_after=None):
+        """混雑を示す応答が返ったらレートを下げる（retry_after 秒のあいだは止める）"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._slow_start = False
+            self._changed = now
+            self.stats['throttled'] += 1
+            if retry_after:
+                self._resume_at = max(self._resume_at, now + retry_after)
+            # 同時に送っていたリクエストの失敗で何度も下げないよう、1 間隔に 1 回だけ下げる
+            if now - self._last_decrease >= 1 / self.rate:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._tokens = min(self._tokens, 0.0)
+                self._last_decrease = now
+                self.stats['decreased'] += 1
+
+def parse_retry_after(response):
+    """Retry-After ヘッダーの秒数（ないか読めなければ None）"""
     try:
-        # 最初のページで総ページ数を取得
-        first_page_soup = load_page(url.format(1))
-        max_page = get_total_pages(first_page_soup)
-        
-        for page in range(1, max_page + 1):
-            # ページ間隔を設定（サーバー負荷に配慮）
-            time.sleep(2)  # リクエスト間隔を2秒に変更
-            
-            try:
-                soup = load_page(url.format(page))
-            except Exception as e:
-                logging.error(f"ページ {page} の取得に失敗しました: {e}")
-                continue  # 次のページに進む
-            
-            properties = soup.find_all(class_='cassetteitem')
-            
-            all_data = []
-            for prop in properties:
-                property_data = extract_property_data(prop)
-                all_data.extend(property_data)
-            
-            # データベースに保存
+        return max(0.0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+def fetch_page(session, page_url, limiter):
+    """レート制限に従ってページを取得する（混雑していればレートを下げて例外を送出）"""
+    limiter.acquire()
+    try:
+        response = session.get(page_url, timeout=20)
+    except requests.exceptions.RequestException:
+        limiter.on_throttle()  # タイムアウトや接続エラーも混雑とみなす
+        raise
+    if response.status_code in THROTTLE_STATUSES:
+        limiter.on_throttle(parse_retry_after(response))
+    response.raise_for_status()
+    limiter.on_success()
+    return BeautifulSoup(response.content, 'html.parser')
+
+def is_retryable(error):
+    """取得し直す意味のあるエラーかどうか（404 などは取得し直さない）"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in THROTTLE_STATUSES
+    return isinstance(error, requests.exceptions.RequestException)
+
+def extract_page_data(soup):
+    """1 ページ分の物件データを抽出する"""
+    all_data = []
+    for prop in soup.find_all(class_='cassetteitem'):
+        all_data.extend(extract_property_data(prop))
+    return all_data
+
+def crawl_worker(session, limiter, pages, results):
+    """キューのページを取得・解析し、(ページ, データ, エラー) を results に入れる"""
+    while True:
+        item = pages.get()
+        if item is None:
+            return
+        page, attempt = item
+        try:
+            soup = fetch_page(session, url.format(page), limiter)
+            results.put((page, extract_page_data(soup), None))
+        except Exception as e:
+            if attempt < MAX_ATTEMPTS and is_retryable(e):
+                # 待たずにキューに戻す（次の取得はレート制限が間隔をあける）
+                logging.warning(f"ページ {page} を取得し直します ({attempt}/{MAX_ATTEMPTS}): {e}")
+                pages.put((page, attempt + 1))
+            else:
+                results.put((page, None, e))
+
+def crawl_concurrent(conn, cursor, workers=DEFAULT_WORKERS, limiter=None):
+    """複数のスレッドでページを並行に取得する（保存はこのスレッドで行う）"""
+    limiter = limiter or AdaptiveRateLimiter()
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # 最初のページで総ページ数を取得（このページの物件もそのまま保存する）
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            first_page_soup = fetch_page(session, url.format(1), limiter)
+            break
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS or not is_retryable(e):
+                raise
+            logging.warning(f"ページ 1 を取得し直します ({attempt}/{MAX_ATTEMPTS}): {e}")
+    max_page = get_total_pages(first_page_soup)
+
+    pages = queue.Queue()
+    results = queue.Queue()
+    results.put((1, extract_page_data(first_page_soup), None))
+    for page in range(2, max_page + 1):
+        pages.put((page, 1))
+
+    threads = [threading.Thread(target=crawl_worker, args=(session, limiter, pages, results),
+                                name=f'suumo-crawl-{i}', daemon=True)
+               for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    failed = []
+    try:
+        for done in range(1, max_page + 1):
+            page, all_data, error = results.get()
+            if error is not None:
+                logging.error(f"ページ {page} の取得に失敗しました: {error}")
+                failed.append(page)
+                continue
+
+            # SQLite の接続はこのスレッドだけで使う
             insert_to_database(conn, cursor, all_data)
-            
-            # CSVに保存
             save_to_csv(all_data)
-            
-            # 進捗表示
-            print(f'ページ {page}/{max_page} 完了 ({round(page/max_page*100, 2)}%)')
+
+            print(f'ページ {page} 完了 {done}/{max_page} ({round(done/max_page*100, 2)}%, '
+                  f'{limiter.rate:.2f} 件/秒)')
             logging.info(f'ページ {page} 完了')
+    finally:
+        for _ in threads:
+            pages.put(None)
+        session.close()
+
+    logging.info(f"並行取得終了: 失敗 {len(failed)} ページ, {limiter.stats}")
+    return failed
+
+def crawl_sequential(conn, cursor):
+    """1 ページずつ順に取得する"""
+    # 最初のページで総ページ数を取得
+    first_page_soup = load_page(url.format(1))
+    max_page = get_total_pages(first_page_soup)
+
+    for page in range(1, max_page + 1):
+        # ページ間隔を設定（サーバー負荷に配慮）
+        time.sleep(2)  # リクエスト間隔を2秒に変更
+
+        try:
+            soup = load_page(url.format(page))
+        except Exception as e:
+            logging.error(f"ページ {page} の取得に失敗しました: {e}")
+            continue  # 次のページに進む
+
+        all_data = extract_page_data(soup)
+
+        # データベースに保存
+        insert_to_database(conn, cursor, all_data)
+
+        # CSVに保存
+        save_to_csv(all_data)
+
+        # 進捗表示
+        print(f'ページ {page}/{max_page} 完了 ({round(page/max_page*100, 2)}%)')
+        logging.info(f'ページ {page} 完了')
+
+def positive_float(value):
+    """argparse 用: 0 より大きい数だけ受け付ける"""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f'0 より大きい数を指定してください: {value}')
+    return number
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SUUMO の物件情報を取得する')
+    parser.add_argument('--concurrent', action='store_true',
+                        help='複数のスレッドで並行に取得する（レートは応答に合わせて調整する）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='並行取得のスレッド数')
+    parser.add_argument('--rate', type=positive_float, default=DEFAULT_RATE, help='開始時の 1 秒あたりのリクエスト数')
+    parser.add_argument('--max-rate', type=positive_float, default=MAX_RATE, help='1 秒あたりのリクエスト数の上限')
+    args = parser.parse_args(argv)
+
+    conn, cursor = init_database()
+    
+    try:
+        if args.concurrent:
+            limiter = AdaptiveRateLimiter(rate=args.rate, max_rate=args.max_rate)
+            crawl_concurrent(conn, cursor, max(1, args.workers), limiter)
+        else:
+            crawl_sequential(conn, cursor)
 
     except Exception as e:
         logging.error(f"スクレイピング中にエラー発生: {e}")
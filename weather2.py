@@ -1,174 +1,42 @@
-import requests
+# 起動時間の計測（STARTUP_PROFILE=1 で表示。最初に import して、ここから数える）
+import startup_profile
 import flet as ft
-import sqlite3
-from collections import defaultdict
 from datetime import datetime, timedelta
 
-# 気象庁のAPIエンドポイント
-AREA_URL = "http://www.jma.go.jp/bosai/common/const/area.json"
-
-class WeatherDatabase:
-    def __init__(self, db_path='weather_forecast.db'):
-        """データベース接続と初期化"""
-        self.conn = sqlite3.connect(db_path)
-        self.create_tables()
-
-    def create_tables(self):
-        """データベースのテーブルを作成"""
-        cursor = self.conn.cursor()
-        
-        # エリア情報テーブル
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS areas (
-            id INTEGER PRIMARY KEY,
-            region_name TEXT NOT NULL,
-            area_name TEXT NOT NULL,
-            area_code TEXT UNIQUE NOT NULL
-        )
-        ''')
-
-        # 天気予報テーブル
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS weather_forecasts (
-            id INTEGER PRIMARY KEY,
-            area_code TEXT NOT NULL,
-            forecast_date TEXT NOT NULL,
-            forecast_time TEXT NOT NULL,
-            weather_code TEXT,
-            weather TEXT,
-            temperature TEXT,
-            precipitation_probability TEXT,
-            FOREIGN KEY (area_code) REFERENCES areas (area_code),
-            UNIQUE (area_code, forecast_date, forecast_time)
-        )
-        ''')
-
-        self.conn.commit()
-
-    def insert_area(self, region_name, area_name, area_code):
-        """エリア情報をデータベースに挿入"""
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute('''
-            INSERT OR REPLACE INTO areas (region_name, area_name, area_code) 
-            VALUES (?, ?, ?)
-            ''', (region_name, area_name, area_code))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"エリア情報挿入エラー: {e}")
-
-    def insert_weather_forecast(self, area_code, forecast_date, forecast_time, 
-                                weather_code, weather, temperature, precipitation_probability):
-        """天気予報情報をデータベースに挿入"""
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute('''
-            INSERT OR REPLACE INTO weather_forecasts 
-            (area_code, forecast_date, forecast_time, weather_code, weather, temperature, precipitation_probability) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (area_code, forecast_date, forecast_time, weather_code, 
-                weather, temperature, precipitation_probability))
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"天気予報情報挿入エラー: {e}")
-
-    def get_weather_forecasts(self, area_code, start_date=None, end_date=None):
-        """指定されたエリアと日付範囲の天気予報を取得"""
-        cursor = self.conn.cursor()
-        query = 'SELECT * FROM weather_forecasts WHERE area_code = ?'
-        params = [area_code]
-
-        if start_date:
-            query += ' AND forecast_date >= ?'
-            params.append(start_date)
-        
-        if end_date:
-            query += ' AND forecast_date <= ?'
-            params.append(end_date)
-        
-        try:
-            cursor.execute(query, params)
-            return cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"天気予報取得エラー: {e}")
-            return []
-
-    def get_all_areas(self):
-        """全エリア情報を取得"""
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute('SELECT DISTINCT region_name, area_name, area_code FROM areas')
-            return cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"エリア情報取得エラー: {e}")
-            return []
-
-    def close(self):
-        """データベース接続を閉じる"""
-        self.conn.close()
-
-def fetch_weather_data(region_code):
-    """指定された地域コードの天気データを取得する関数"""
-    try:
-        weather_url = f"http://www.jma.go.jp/bosai/forecast/data/forecast/{region_code}.json"
-        response = requests.get(weather_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"[ERROR] 天気データ取得失敗: ステータスコード {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"[EXCEPTION] 天気データ取得中にエラー発生: {e}")
-        return None
-
-def parse_weather_data(weather_data):
-    """天気情報を辞書形式で解析し、日付ごとにグループ化する関数"""
-    if not weather_data:
-        return None
-    
-    weather_dict = defaultdict(list)
-    
-    for weather_entry in weather_data:
-        time_series = weather_entry.get("timeSeries", [])
-        for series in time_series:
-            time_defines = series.get("timeDefines", [])
-            areas = series.get("areas", [])
-            
-            for area in areas:
-                area_name = area.get("area", {}).get("name", "不明")
-                weather_codes = area.get("weatherCodes", [])
-                weathers = area.get("weathers", [])
-                temps = area.get("temps", [])
-                pops = area.get("pops", [])
-                
-                for idx, time_define in enumerate(time_defines):
-                    date = time_define.split("T")[0]
-                    forecast = {
-                        "datetime": time_define,
-                        "weather_code": weather_codes[idx] if idx < len(weather_codes) else "情報なし",
-                        "weather": weathers[idx] if idx < len(weathers) else "情報なし",
-                        "temp": temps[idx] if idx < len(temps) else "情報なし",
-                        "pop": pops[idx] if idx < len(pops) else "情報なし",
-                    }
-                    weather_dict[date].append(forecast)
-    
-    return weather_dict
+# 天気予報のデータベースと解析処理
+from weather_db import WeatherDatabase, format_value
+# 結果の表示（行を使い回し、必要な分だけ作る ListView）
+from forecast_view import ForecastListView
+# 天気予報のバックグラウンド取得（同じ地域の要求はまとめ、古い要求の結果は捨てる）
+from fetch_worker import FetchWorker
+from forecast_parser import parse_weather_data
+# 全階層の地域の検索索引
+from area_index import AreaIndex
+# requests を使うモジュール（気象庁の API、地域情報のキャッシュ、先読み、スケジューラ）は
+# import に時間がかかるので、最初の画面を表示したあとに start_services の中で import する
+IMPORT_SECONDS = startup_profile.elapsed()  # import にかかった時間
 
 def main(page: ft.Page):
+    # 起動時間はセッションごとに、main に入った時刻から記録する
+    profile = startup_profile.StartupProfile(IMPORT_SECONDS)
     page.title = "天気予報アプリ (DB版)"
     page.bgcolor = "#f0f8ff"
     page.padding = 30
 
-    # データベース初期化
-    weather_db = WeatherDatabase()
+    # データベースと地域情報のキャッシュは最初の画面を表示したあとに開く
+    weather_db = None
+    area_cache = None
 
     parent_dropdown = ft.Dropdown(label="地方を選択", width=350)
     child_dropdown = ft.Dropdown(label="地名を選択", disabled=True, width=350)
+    search_field = ft.TextField(label="地名・よみ・コードで検索", width=350)
+    suggestion_column = ft.Column(spacing=0)
     date_picker = ft.DatePicker(
         first_date=datetime.now(),
         last_date=datetime.now() + timedelta(days=14)
     )
-    result_listview = ft.ListView(width=400, height=400, spacing=10, padding=20)
+    result_listview = ForecastListView(width=400, height=400)
+    progress_bar = ft.ProgressBar(width=400, visible=False)
 
     region_mapping = {}
     area_mapping = {}
@@ -183,95 +51,135 @@ def main(page: ft.Page):
         child_dropdown.update()
 
     parent_dropdown.on_change = update_child_dropdown
+    area_index = None
+
+    def show_suggestions(e):
+        """入力中の文字列に合う地域を候補として表示"""
+        suggestion_column.controls.clear()
+        query = search_field.value or ""
+        if area_index is not None and query.strip():
+            for node in area_index.search(query, limit=8):
+                if node.office is not None:
+                    suggestion_column.controls.append(
+                        ft.TextButton(text=node.label(), data=node, on_click=select_suggestion)
+                    )
+        suggestion_column.update()
+
+    def select_suggestion(e):
+        """候補の地域を含む府県を選んで天気を取得"""
+        node = e.control.data
+        office = node.office
+        parent_dropdown.value = office.parent.name
+        update_child_dropdown(None)
+        child_dropdown.value = office.name
+        search_field.value = node.name
+        suggestion_column.controls.clear()
+        page.update()
+        fetch_weather(None)
+
+    search_field.on_change = show_suggestions
+
+    def fill_areas(areas, store=False):
+        # 更新のときはバックグラウンドのスレッドから呼ばれるので、新しい対応表と
+        # 選択肢を別に作ってから差し替え、画面の処理が作りかけの表を見ないようにする
+        nonlocal region_mapping, area_mapping, area_index
+        options = []
+        new_regions = {}
+        new_areas = {}
+        area_rows = []
+        for center_code, center_data in areas.get("centers", {}).items():
+            region_name = center_data["name"]
+            options.append(ft.dropdown.Option(region_name))
+            new_regions[region_name] = []
+            for child_code in center_data.get("children", []):
+                area_info = areas["offices"].get(child_code, {})
+                area_name = area_info.get("name")
+                if area_name:
+                    area_rows.append((region_name, area_name, child_code))
+                    new_regions[region_name].append(area_name)
+                    new_areas[area_name] = {"code": child_code}
+        if store:
+            # エリア情報を 1 回のトランザクションでデータベースに保存
+            weather_db.insert_areas(area_rows)
+        new_index = AreaIndex(areas)
+
+        region_mapping, area_mapping, area_index = new_regions, new_areas, new_index
+        parent_dropdown.options = options
+        parent_dropdown.update()
 
     def fetch_areas():
+        import requests
+
         try:
-            response = requests.get(AREA_URL)
-            response.raise_for_status()
-            areas = response.json()
-            for center_code, center_data in areas.get("centers", {}).items():
-                region_name = center_data["name"]
-                parent_dropdown.options.append(ft.dropdown.Option(region_name))
-                region_mapping[region_name] = []
-                for child_code in center_data.get("children", []):
-                    area_info = areas["offices"].get(child_code, {})
-                    area_name = area_info.get("name")
-                    if area_name:
-                        # エリア情報をデータベースに保存
-                        weather_db.insert_area(region_name, area_name, child_code)
-                        
-                        region_mapping[region_name].append(area_name)
-                        area_mapping[area_name] = {"code": child_code}
-            parent_dropdown.update()
+            # キャッシュからすぐに表示し、期限切れならバックグラウンドで更新する
+            fill_areas(area_cache.load(), store=True)
+            # 更新した地域情報もデータベースに保存する
+            area_cache.refresh_async(on_refresh=lambda areas: fill_areas(areas, store=True))
         except requests.RequestException as e:
-            result_listview.controls.append(ft.Text(f"地域情報の取得に失敗しました: {e}", color="red"))
-            page.update()
+            result_listview.append_message(f"地域情報の取得に失敗しました: {e}")
+
+    def load_forecast(region_code):
+        """天気予報を取得してデータベースに保存する（バックグラウンドで呼ばれる）"""
+        from jma_client import fetch_weather_data
+
+        weather_data = fetch_weather_data(region_code)
+        weather_dict = parse_weather_data(weather_data)
+        if weather_dict:
+            # 天気予報情報をデータベースに保存
+            weather_db.save_forecasts(region_code, weather_dict,
+                                      weather_data[0].get("reportDatetime"))
+        return weather_dict
+
+    fetch_worker = FetchWorker(load_forecast)
+
+    def set_busy(busy):
+        """取得中の表示を切り替える"""
+        progress_bar.visible = busy
+        progress_bar.update()
 
     def fetch_weather(e):
+        from forecast_scheduler import latest_publish
+
         selected_name = child_dropdown.value
         if not selected_name:
-            result_listview.controls.append(ft.Text("地名を選択してください。", color="red"))
-            page.update()
+            result_listview.append_message("地名を選択してください。")
             return
 
-        try:
-            region_code = area_mapping[selected_name]["code"]
-            weather_data = fetch_weather_data(region_code)
-            weather_dict = parse_weather_data(weather_data)
+        title = f"{selected_name} の天気情報"
+
+        def on_result(weather_dict):
+            set_busy(False)
             if not weather_dict:
-                result_listview.controls.append(ft.Text("天気情報が見つかりませんでした。", color="red"))
-                page.update()
+                result_listview.append_message("天気情報が見つかりませんでした。")
                 return
+            result_listview.show_forecasts(title, weather_dict)
 
-            # 天気予報情報をデータベースに保存
-            for date, forecasts in weather_dict.items():
-                for forecast in forecasts:
-                    weather_db.insert_weather_forecast(
-                        area_code=region_code,
-                        forecast_date=date,
-                        forecast_time=forecast['datetime'],
-                        weather_code=forecast['weather_code'],
-                        weather=forecast['weather'],
-                        temperature=forecast['temp'],
-                        precipitation_probability=forecast['pop']
-                    )
+        def on_error(error):
+            set_busy(False)
+            result_listview.append_message(f"天気情報の取得に失敗しました: {error}")
 
-            result_listview.controls.clear()
-            result_listview.controls.append(
-                ft.Text(f"{selected_name} の天気情報", size=20, weight="bold", color="#0d9488")
-            )
+        try:
+            region_code = area_mapping[selected_name]["code"]
+            # 先読み済みで新しい予報があればデータベースから表示する
+            # （発表時刻に合わせてスケジューラが更新しているので、最新の発表のものなら使える）
+            weather_dict = weather_db.get_fresh_forecasts(region_code,
+                                                          reported_since=latest_publish())
+            if weather_dict:
+                fetch_worker.cancel()
+                on_result(weather_dict)
+                return
 
-            for date, forecasts in weather_dict.items():
-                result_listview.controls.append(
-                    ft.Text(f"日付: {date}", size=16, weight="bold", color="#6d28d9")
-                )
-                for forecast in forecasts:
-                    result_listview.controls.append(
-                        ft.Card(
-                            content=ft.Container(
-                                content=ft.Column([
-                                    ft.Text(f"時間: {forecast['datetime']}", size=14, color="#374151"),
-                                    ft.Text(f"天気: {forecast['weather']}", size=14, color="#1e40af"),
-                                    ft.Text(f"気温: {forecast['temp']}℃", size=14, color="#d97706"),
-                                    ft.Text(f"降水確率: {forecast['pop']}%", size=14, color="#dc2626"),
-                                ], spacing=5),
-                                padding=10
-                            ),
-                            width=350,
-                            elevation=2
-                        )
-                    )
-            page.update()
+            # 通信はバックグラウンドで行い、その間は取得中の表示にする
+            set_busy(True)
+            fetch_worker.request(region_code, on_result, on_error)
         except Exception as e:
-            result_listview.controls.append(ft.Text(f"天気情報の取得に失敗しました: {e}", color="red"))
-            page.update()
+            on_error(e)
 
     def show_past_forecasts(e):
         # 過去の予報を表示する機能
         selected_name = child_dropdown.value
         if not selected_name:
-            result_listview.controls.append(ft.Text("地名を選択してください。", color="red"))
-            page.update()
+            result_listview.append_message("地名を選択してください。")
             return
 
         try:
@@ -289,39 +197,40 @@ def main(page: ft.Page):
                     end_date=selected_date
                 )
                 
-                result_listview.controls.clear()
-                result_listview.controls.append(
-                    ft.Text(f"{selected_name} の {selected_date} の天気情報", 
-                            size=20, weight="bold", color="#0d9488")
-                )
-                
+                title = f"{selected_name} の {selected_date} の天気情報"
                 if not past_forecasts:
-                    result_listview.controls.append(
-                        ft.Text("選択された日付の予報データがありません。", color="red")
-                    )
-                else:
-                    for forecast in past_forecasts:
-                        result_listview.controls.append(
-                            ft.Card(
-                                content=ft.Container(
-                                    content=ft.Column([
-                                        ft.Text(f"時間: {forecast[3]}", size=14, color="#374151"),
-                                        ft.Text(f"天気: {forecast[5]}", size=14, color="#1e40af"),
-                                        ft.Text(f"気温: {forecast[6]}℃", size=14, color="#d97706"),
-                                        ft.Text(f"降水確率: {forecast[7]}%", size=14, color="#dc2626"),
-                                    ], spacing=5),
-                                    padding=10
-                                ),
-                                width=350,
-                                elevation=2
-                            )
+                    result_listview.show_message("選択された日付の予報データがありません。", title)
+                    return
+
+                items = [("title", title)] + [
+                    ("forecast", {
+                        "datetime": format_value(forecast[3]),
+                        "weather": format_value(forecast[5]),
+                        "temp": format_value(forecast[6]),
+                        "pop": format_value(forecast[7]),
+                    })
+                    for forecast in past_forecasts
+                ]
+                # 発表ごとに予報がどう変わったか（新しい発表から順に）
+                history = weather_db.archive.date_history(region_code, selected_date)
+                if len(history) > 1:
+                    items.append(("title", "発表ごとの予報の変化"))
+                    for report_datetime, forecasts in history:
+                        items.append(("date", f"{report_datetime} 発表"))
+                        items.extend(
+                            ("forecast", {
+                                "datetime": forecast_time,
+                                "weather": format_value(weather),
+                                "temp": format_value(temp),
+                                "pop": format_value(pop),
+                            })
+                            for forecast_time, _, weather, temp, pop in forecasts
                         )
-                page.update()
+                result_listview.show_items(items)
             
             date_picker.on_change = on_date_selected
         except Exception as e:
-            result_listview.controls.append(ft.Text(f"過去の予報取得に失敗しました: {e}", color="red"))
-            page.update()
+            result_listview.append_message(f"過去の予報取得に失敗しました: {e}")
 
     fetch_button = ft.ElevatedButton(
         text="天気を取得", on_click=fetch_weather,
@@ -341,16 +250,43 @@ def main(page: ft.Page):
                 ft.Text("気象庁 天気予報アプリ +DB ", size=30, weight="bold", color="#1e3a8a"),
                 ft.Text(size=14, color="#4b5563"),
                 ft.Row([parent_dropdown, child_dropdown], alignment="center", spacing=20),
+                search_field,
+                suggestion_column,
                 ft.Row([fetch_button, past_forecast_button], alignment="center", spacing=20),
+                progress_bar,
                 result_listview,
             ],
             alignment="center",
             spacing=20
         )
     )
-    fetch_areas()
-
-ft.app(target=main)
-
-
-
+    profile.mark("最初の画面")
+
+    def start_services():
+        """データベースと地域情報を読み込み、先読みと自動更新を始める"""
+        nonlocal weather_db, area_cache
+        from area_cache import AreaCache
+        # 全地域の予報の先読み
+        from prefetch import office_codes, start_prefetch_once
+        # 発表時刻に合わせた予報の自動更新
+        from forecast_scheduler import start_scheduler_once
+        profile.mark("遅延 import")
+
+        weather_db = WeatherDatabase()
+        area_cache = AreaCache()
+        profile.mark("データベース")
+        fetch_areas()
+        profile.mark("プルダウン表示")
+        profile.report()
+
+        # 全地域の予報をバックグラウンドで先読みしておく（プロセスで 1 回だけ）
+        if area_cache.areas is not None:
+            start_prefetch_once(areas=area_cache.areas)
+            # 以降は発表時刻の少し後に地域ごとに散らして更新する（プロセスで 1 つだけ）
+            start_scheduler_once(weather_db, office_codes(area_cache.areas))
+
+    # 重い import と I/O は最初の画面を送ったあとに行う
+    start_services()
+
+if __name__ == "__main__":
+    ft.app(target=main)
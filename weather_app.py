@@ -1,76 +1,32 @@
-import requests
+# 起動時間の計測（STARTUP_PROFILE=1 で表示。最初に import して、ここから数える）
+import startup_profile
 import flet as ft
-from collections import defaultdict
 from datetime import datetime
 
-# 気象庁のAPIエンドポイント
-AREA_URL = "http://www.jma.go.jp/bosai/common/const/area.json"
-
-def fetch_weather_data(region_code):
-    """指定された地域コードの天気データを取得する関数"""
-    try:
-        weather_url = f"http://www.jma.go.jp/bosai/forecast/data/forecast/{region_code}.json"
-        response = requests.get(weather_url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"[ERROR] 天気データ取得失敗: ステータスコード {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"[EXCEPTION] 天気データ取得中にエラー発生: {e}")
-        return None
-
-def parse_weather_data(weather_data):
-    """天気情報を辞書形式で解析し、日付ごとにグループ化する関数"""
-    if not weather_data:
-        return None
-    
-    weather_dict = defaultdict(list)
-    
-    for weather_entry in weather_data:
-        publishing_office = weather_entry.get("publishingOffice", "不明")
-        report_datetime = weather_entry.get("reportDatetime", "不明")
-        time_series = weather_entry.get("timeSeries", [])
-        
-        for series in time_series:
-            time_defines = series.get("timeDefines", [])
-            areas = series.get("areas", [])
-            
-            for area in areas:
-                area_name = area.get("area", {}).get("name", "不明")
-                area_code = area.get("area", {}).get("code", "不明")
-                
-                # 各種データを取得
-                weather_codes = area.get("weatherCodes", [])
-                weathers = area.get("weathers", [])
-                winds = area.get("winds", [])
-                waves = area.get("waves", [])
-                pops = area.get("pops", [])
-                reliabilities = area.get("reliabilities", [])
-                temps = area.get("temps", [])
-                
-                # 地域コードごとに情報を格納
-                for idx, time_define in enumerate(time_defines):
-                    # 日付部分を取得し、グループ化
-                    date = time_define.split("T")[0]
-                    
-                    forecast = {
-                        "datetime": time_define,
-                        "weather_code": weather_codes[idx] if idx < len(weather_codes) else "情報なし",
-                        "weather": weathers[idx] if idx < len(weathers) else "情報なし",
-                        "wind": winds[idx] if idx < len(winds) else "情報なし",
-                        "wave": waves[idx] if idx < len(waves) else "情報なし",
-                        "pop": pops[idx] if idx < len(pops) else "情報なし",
-                        "reliability": reliabilities[idx] if idx < len(reliabilities) else "情報なし",
-                        "temp": temps[idx] if idx < len(temps) else "情報なし",
-                    }
-                    
-                    # 日付ごとに予報を追加
-                    weather_dict[date].append(forecast)
-    
-    return weather_dict
+# 全階層の地域の検索索引
+from area_index import AreaIndex
+# 結果の表示（行を使い回し、必要な分だけ作る ListView）
+from forecast_view import FORECAST_FIELDS, ForecastListView
+# 天気予報のバックグラウンド取得（同じ地域の要求はまとめ、古い要求の結果は捨てる）
+from fetch_worker import FetchWorker
+# 予報の解析（weather2 と共通）
+from forecast_parser import parse_weather_data
+# requests を使うモジュール（気象庁の API、地域情報のキャッシュ）は import に時間が
+# かかるので、最初の画面を表示したあとに import する
+IMPORT_SECONDS = startup_profile.elapsed()  # import にかかった時間
+
+# カードに表示する項目（風・波・信頼度も表示する）
+APP_FORECAST_FIELDS = FORECAST_FIELDS + (
+    ("風", "wind", "", "#374151"),
+    ("波", "wave", "", "#374151"),
+    ("信頼性", "reliability", "", "#374151"),
+)
+# 解析で加える列（表示のキー, ForecastSeries の列）
+EXTRA_COLUMNS = (("wind", "winds"), ("wave", "waves"), ("reliability", "reliabilities"))
 
 def main(page: ft.Page):
+    # 起動時間はセッションごとに、main に入った時刻から記録する
+    profile = startup_profile.StartupProfile(IMPORT_SECONDS)
     page.title = "天気予報アプリ"
     
     # 背景色やレイアウトスタイルの調整
@@ -80,11 +36,15 @@ def main(page: ft.Page):
     # コンポーネント
     parent_dropdown = ft.Dropdown(label="地方を選択", width=350)
     child_dropdown = ft.Dropdown(label="地名を選択", disabled=True, width=350)
-    result_label = ft.Text("", size=16, color="#333333", text_align="left")
+    search_field = ft.TextField(label="地名・よみ・コードで検索", width=350)
+    suggestion_column = ft.Column(spacing=0)
+    result_listview = ForecastListView(fields=APP_FORECAST_FIELDS, width=400, height=400)
+    progress_bar = ft.ProgressBar(width=400, visible=False)
 
     # 地域マッピング
     region_mapping = {}
     area_mapping = {}
+    area_cache = None  # 最初の画面を表示したあとに作る
 
     def update_child_dropdown(e):
         """選択された地方に基づいて地名をフィルタリング"""
@@ -99,90 +59,130 @@ def main(page: ft.Page):
         child_dropdown.update()
 
     parent_dropdown.on_change = update_child_dropdown
+    area_index = None
+
+    def show_suggestions(e):
+        """入力中の文字列に合う地域を候補として表示"""
+        suggestion_column.controls.clear()
+        query = search_field.value or ""
+        if area_index is not None and query.strip():
+            for node in area_index.search(query, limit=8):
+                if node.office is not None:
+                    suggestion_column.controls.append(
+                        ft.TextButton(text=node.label(), data=node, on_click=select_suggestion)
+                    )
+        suggestion_column.update()
+
+    def select_suggestion(e):
+        """候補の地域を含む府県を選んで天気を取得"""
+        node = e.control.data
+        office = node.office
+        parent_dropdown.value = office.parent.name
+        update_child_dropdown(None)
+        child_dropdown.value = office.name
+        search_field.value = node.name
+        suggestion_column.controls.clear()
+        page.update()
+        fetch_weather(None)
+
+    search_field.on_change = show_suggestions
+
+    def fill_areas(areas):
+        """地域情報からDropdownに地方名と地名を設定
+
+        更新のときはバックグラウンドのスレッドから呼ばれるので、新しい対応表と
+        選択肢を別に作ってから差し替え、画面の処理が作りかけの表を見ないようにする。
+        """
+        nonlocal region_mapping, area_mapping, area_index
+        options = []
+        new_regions = {}
+        new_areas = {}
+        for center_code, center_data in areas.get("centers", {}).items():
+            region_name = center_data["name"]
+            options.append(ft.dropdown.Option(region_name))
+            new_regions[region_name] = []
+
+            for child_code in center_data.get("children", []):
+                area_info = areas["offices"].get(child_code, {})
+                area_name = area_info.get("name")
+                if area_name:
+                    new_regions[region_name].append(area_name)
+                    new_areas[area_name] = {"code": child_code}
+        new_index = AreaIndex(areas)
+
+        region_mapping, area_mapping, area_index = new_regions, new_areas, new_index
+        parent_dropdown.options = options
+        parent_dropdown.update()
 
     def fetch_areas():
-        """地域情報を取得し、Dropdownに地方名と地名を設定"""
+        """地域情報をキャッシュから読み込み、期限切れならバックグラウンドで更新"""
+        nonlocal area_cache
+        import requests
+        from area_cache import AreaCache
+
+        profile.mark("遅延 import")
         try:
-            response = requests.get(AREA_URL)
-            response.raise_for_status()
-            areas = response.json()
-
-            for center_code, center_data in areas.get("centers", {}).items():
-                region_name = center_data["name"]
-                parent_dropdown.options.append(ft.dropdown.Option(region_name))
-                region_mapping[region_name] = []
-                
-                for child_code in center_data.get("children", []):
-                    area_info = areas["offices"].get(child_code, {})
-                    area_name = area_info.get("name")
-                    if area_name:
-                        region_mapping[region_name].append(area_name)
-                        area_mapping[area_name] = {"code": child_code}
-            
-            parent_dropdown.update()
+            area_cache = AreaCache()
+            fill_areas(area_cache.load())
+            area_cache.refresh_async(on_refresh=fill_areas)
 
         except requests.RequestException as e:
-            result_label.value = f"地域情報の取得に失敗しました: {e}"
-            page.update()
+            result_listview.show_message(f"地域情報の取得に失敗しました: {e}")
+
+    def load_forecast(region_code):
+        """天気データを取得して解析する（バックグラウンドで呼ばれる）"""
+        from jma_client import fetch_weather_data
+
+        return parse_weather_data(fetch_weather_data(region_code), EXTRA_COLUMNS)
+
+    fetch_worker = FetchWorker(load_forecast)
+
+    def set_busy(busy):
+        """取得中の表示を切り替える"""
+        progress_bar.visible = busy
+        progress_bar.update()
 
     def fetch_weather(e):
         """選択された地域の天気を取得"""
         selected_name = child_dropdown.value
         if not selected_name:
-            result_label.value = "地名を選択してください。"
-            page.update()
+            result_listview.show_message("地名を選択してください。")
             return
 
-        try:
-            # 選択された地域のコードを取得
-            region_code = area_mapping[selected_name]["code"]
-            
-            # 天気データを取得
-            weather_data = fetch_weather_data(region_code)
-            
-            # 天気データを解析
-            weather_dict = parse_weather_data(weather_data)
-            
+        def on_result(weather_dict):
+            set_busy(False)
             if not weather_dict:
-                result_label.value = "天気情報が見つかりませんでした。"
-                page.update()
-                return
-            
-            # 選択された地域の天気情報を表示
-            area_weather = weather_dict
-            if not area_weather:
-                result_label.value = "選択した地域の天気情報が見つかりませんでした。"
-                page.update()
+                result_listview.show_message("天気情報が見つかりませんでした。")
                 return
-            
-            # 天気情報の詳細を表示
-            weather_info = f"{selected_name} の天気情報:\n"
-            weather_info += f"発表局: {area_weather.get('publishing_office', '不明')}\n"
-            weather_info += f"発表日時: {area_weather.get('report_datetime', '不明')}\n\n"
-            
-            # 日付ごとにグループ化された天気情報を表示
-            for date, forecasts in area_weather.items():
-                weather_info += f"日付: {date}\n"
-                for forecast in forecasts:
-                    weather_info += (
-                        f"  時間: {forecast['datetime']}\n"
-                        f"  天気: {forecast['weather']}\n"
-                        f"  気温: {forecast['temp']}℃\n"
-                        f"  降水確率: {forecast['pop']}%\n"
-                        f"  風: {forecast['wind']}\n"
-                        f"  波: {forecast['wave']}\n"
-                        f"  信頼性: {forecast['reliability']}\n\n"
-                    )
-            
-            result_label.value = weather_info
-            page.update()
 
-        except requests.RequestException as e:
-            result_label.value = f"天気情報の取得に失敗しました: {e}"
-        except (KeyError, IndexError) as e:
-            result_label.value = f"天気情報の解析に失敗しました: {e}"
-        
-        page.update()
+            # 天気情報の詳細を表示（日付ごとにグループ化）
+            items = [
+                ("title", f"{selected_name} の天気情報"),
+                ("date", f"発表局: {weather_dict.get('publishing_office', '不明')}"),
+                ("date", f"発表日時: {weather_dict.get('report_datetime', '不明')}"),
+            ]
+            for date, forecasts in weather_dict.items():
+                items.append(("date", f"日付: {date}"))
+                items.extend(("forecast", forecast) for forecast in forecasts)
+            result_listview.show_items(items)
+
+        def on_error(error):
+            import requests
+
+            set_busy(False)
+            if isinstance(error, requests.RequestException):
+                result_listview.show_message(f"天気情報の取得に失敗しました: {error}")
+            else:
+                result_listview.show_message(f"天気情報の解析に失敗しました: {error}")
+
+        # 選択された地域のコードを取得し、通信はバックグラウンドで行う
+        # （選んだ地名が、更新した地域情報にはもうないこともある）
+        try:
+            region_code = area_mapping[selected_name]["code"]
+            set_busy(True)
+            fetch_worker.request(region_code, on_result, on_error)
+        except Exception as e:
+            on_error(e)
 
     # ボタンのデザイン
     fetch_button = ft.ElevatedButton(
@@ -198,17 +198,25 @@ def main(page: ft.Page):
                 ft.Text("気象庁 天気予報アプリ", size=30, weight="bold", color="#1e3a8a"),
                 ft.Text("（宮古島、大東島のみ正確に表示されます）", size=14, color="#6b7280"),
                 ft.Row([parent_dropdown, child_dropdown], alignment="center", spacing=20),
+                search_field,
+                suggestion_column,
                 fetch_button,
-                result_label,
+                progress_bar,
+                result_listview,
             ],
             alignment="center",
             spacing=20
         )
     )
 
-    # 起動時に地域情報を取得
+    profile.mark("最初の画面")
+
+    # 起動時に地域情報を取得（重い import と I/O は最初の画面を送ったあとに行う）
     fetch_areas()
+    profile.mark("プルダウン表示")
+    profile.report()
 
 
 # アプリ実行
-ft.app(target=main)
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,314 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from forecast_archive import ForecastArchive
+from forecast_rollups import ForecastRollups
+
+# 書き込み中のロックを待つ時間（秒）
+BUSY_TIMEOUT = 10
+# スキーマのバージョン（PRAGMA user_version に記録する）
+# 1: 気温・降水確率を TEXT で保存（"情報なし" が混ざる）
+# 2: 気温は REAL、降水確率は INTEGER、欠損は NULL。集計用の索引を追加
+SCHEMA_VERSION = 2
+# 欠損値の表示
+MISSING = "情報なし"
+
+_INSERT_FORECAST = '''
+INSERT OR REPLACE INTO weather_forecasts 
+(area_code, forecast_date, forecast_time, weather_code, weather, temperature, precipitation_probability) 
+VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class WeatherDatabase:
+    def __init__(self, db_path='weather_forecast.db'):
+        """データベース接続と初期化"""
+        # Flet のイベント処理は別スレッドで呼ばれるので、接続はロックで守って共有する
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.lock = threading.RLock()
+        # WAL にすると読み込みが書き込みを待たなくなる。
+        # WAL なら synchronous=NORMAL でも壊れることはない（停電時に直前の確定が失われるだけ）
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+        # 発表ごとの予報の履歴（変わったセルだけを保存する）
+        self.archive = ForecastArchive(self)
+        # ダッシュボード用の集計表（保存のたびに変わった日付の分だけ更新する）
+        self.rollups = ForecastRollups(self)
+
+    def create_tables(self):
+        """データベースのテーブルを作成"""
+        cursor = self.conn.cursor()
+        
+        # エリア情報テーブル
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS areas (
+            id INTEGER PRIMARY KEY,
+            region_name TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            area_code TEXT UNIQUE NOT NULL
+        )
+        ''')
+
+        # 取得履歴テーブル（地域ごとに最後に取得した時刻と発表日時）
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS forecast_fetches (
+            area_code TEXT PRIMARY KEY,
+            report_datetime TEXT,
+            fetched_at TEXT NOT NULL
+        )
+        ''')
+
+        self.conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """スキーマを最新のバージョンにする"""
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'weather_forecasts'"
+        ).fetchone()
+
+        # 移行は 1 回のトランザクションで行い、途中で失敗したら元に戻す
+        self.conn.execute('BEGIN')
+        try:
+            if exists:
+                self.conn.execute('ALTER TABLE weather_forecasts RENAME TO weather_forecasts_v1')
+            self.conn.execute('''
+            CREATE TABLE weather_forecasts (
+                id INTEGER PRIMARY KEY,
+                area_code TEXT NOT NULL,
+                forecast_date TEXT NOT NULL,
+                forecast_time TEXT NOT NULL,
+                weather_code TEXT,
+                weather TEXT,
+                temperature REAL,
+                precipitation_probability INTEGER,
+                FOREIGN KEY (area_code) REFERENCES areas (area_code),
+                UNIQUE (area_code, forecast_date, forecast_time)
+            )
+            ''')
+            # 地域と日付の範囲で集計するときに表を読まずに済むようにする
+            self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_weather_forecasts_area_date
+            ON weather_forecasts (area_code, forecast_date, temperature, precipitation_probability)
+            ''')
+            if exists:
+                # 挿入時と同じ変換で、数値にできない値（"情報なし" など）は NULL にする
+                old_rows = self.conn.execute('''
+                SELECT id, area_code, forecast_date, forecast_time, weather_code,
+                       weather, temperature, precipitation_probability
+                FROM weather_forecasts_v1
+                ''')
+                self.conn.executemany(
+                    'INSERT INTO weather_forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    ((row[0],) + _forecast_row(*row[1:]) for row in old_rows))
+                self.conn.execute('DROP TABLE weather_forecasts_v1')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def insert_area(self, region_name, area_name, area_code):
+        """エリア情報をデータベースに挿入"""
+        self.insert_areas([(region_name, area_name, area_code)])
+
+    def insert_areas(self, areas):
+        """(地方名, 地名, 地域コード) のリストを 1 回のトランザクションで挿入"""
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany('''
+                INSERT OR REPLACE INTO areas (region_name, area_name, area_code) 
+                VALUES (?, ?, ?)
+                ''', areas)
+        except sqlite3.Error as e:
+            print(f"エリア情報挿入エラー: {e}")
+
+    def insert_weather_forecast(self, area_code, forecast_date, forecast_time, 
+                                weather_code, weather, temperature, precipitation_probability):
+        """天気予報情報をデータベースに挿入"""
+        row = _forecast_row(area_code, forecast_date, forecast_time, weather_code,
+                            weather, temperature, precipitation_probability)
+        try:
+            with self.lock, self.conn:
+                self.conn.execute(_INSERT_FORECAST, row)
+                self.rollups.update_in_transaction(area_code, None, [row], new_report=False)
+        except sqlite3.Error as e:
+            print(f"天気予報情報挿入エラー: {e}")
+
+    def save_forecasts(self, area_code, weather_dict, report_datetime=None):
+        """parse_weather_data の結果と取得時刻を 1 回のトランザクションで保存する"""
+        rows = (
+            (date, forecast['datetime'], forecast['weather_code'],
+             forecast['weather'], forecast['temp'], forecast['pop'])
+            for date, forecasts in weather_dict.items()
+            for forecast in forecasts
+        )
+        self.save_forecast_rows(area_code, rows, report_datetime)
+
+    def save_forecast_rows(self, area_code, rows, report_datetime=None):
+        """(日付, 時刻, 天気コード, 天気, 気温, 降水確率) の行と取得時刻を
+        1 回のトランザクションで保存する（forecast_parser.forecast_rows の結果を渡せる）"""
+        rows = [_forecast_row(area_code, *row) for row in rows]
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(_INSERT_FORECAST, rows)
+                self._record_fetch(area_code, report_datetime)
+                # 上書きされる前の予報も残るように、発表ごとの差分を履歴に記録する
+                changes = self.archive.record_in_transaction(
+                    area_code, report_datetime, [row[2:] for row in rows])
+                # 集計表も同じトランザクションで更新する（発表ごとの予報は新しい発表のときだけ）
+                self.rollups.update_in_transaction(
+                    area_code, report_datetime, rows, new_report=changes is not None)
+        except sqlite3.Error as e:
+            print(f"天気予報情報挿入エラー: {e}")
+
+    def record_fetch(self, area_code, report_datetime=None):
+        """地域の天気予報を取得した時刻を記録する"""
+        try:
+            with self.lock, self.conn:
+                self._record_fetch(area_code, report_datetime)
+        except sqlite3.Error as e:
+            print(f"取得履歴挿入エラー: {e}")
+
+    def _record_fetch(self, area_code, report_datetime):
+        self.conn.execute('''
+        INSERT OR REPLACE INTO forecast_fetches (area_code, report_datetime, fetched_at)
+        VALUES (?, ?, ?)
+        ''', (area_code, report_datetime, datetime.now().isoformat(timespec='seconds')))
+
+    def get_last_fetch(self, area_code):
+        """最後に取得した (発表日時, 取得時刻) を返す。未取得なら None"""
+        try:
+            with self.lock:
+                row = self.conn.execute(
+                    'SELECT report_datetime, fetched_at FROM forecast_fetches WHERE area_code = ?',
+                    (area_code,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"取得履歴取得エラー: {e}")
+            return None
+        if row is None:
+            return None
+        return row[0], datetime.fromisoformat(row[1])
+
+    def get_fresh_forecasts(self, area_code, max_age=timedelta(minutes=30), reported_since=None):
+        """新しい予報があれば parse_weather_data と同じ形で返す
+
+        max_age 以内に取得したものか、発表日時が reported_since 以降のものを新しいとみなす。
+        """
+        last_fetch = self.get_last_fetch(area_code)
+        if last_fetch is None:
+            return None
+        if datetime.now() - last_fetch[1] > max_age and not (
+                reported_since is not None and last_fetch[0]
+                and datetime.fromisoformat(last_fetch[0]) >= reported_since):
+            return None
+        weather_dict = defaultdict(list)
+        today = datetime.now().strftime('%Y-%m-%d')
+        for row in self.get_weather_forecasts(area_code, start_date=today):
+            weather_dict[row[2]].append({
+                "datetime": row[3],
+                "weather_code": format_value(row[4]),
+                "weather": format_value(row[5]),
+                "temp": format_value(row[6]),
+                "pop": format_value(row[7]),
+            })
+        return weather_dict or None
+
+    def get_weather_forecasts(self, area_code, start_date=None, end_date=None):
+        """指定されたエリアと日付範囲の天気予報を取得"""
+        query = 'SELECT * FROM weather_forecasts WHERE area_code = ?'
+        params = [area_code]
+
+        if start_date:
+            query += ' AND forecast_date >= ?'
+            params.append(start_date)
+        
+        if end_date:
+            query += ' AND forecast_date <= ?'
+            params.append(end_date)
+
+        query += ' ORDER BY forecast_date, forecast_time'
+        
+        try:
+            with self.lock:
+                return self.conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"天気予報取得エラー: {e}")
+            return []
+
+    def get_forecast_stats(self, area_code, start_date=None, end_date=None):
+        """期間内の気温と降水確率を集計する（欠損値は数えない）
+
+        {"count", "min_temp", "max_temp", "avg_temp", "avg_pop", "max_pop"} を返す。
+        索引だけで計算できるので、何か月分あっても範囲の大きさに比例した時間で済む。
+        """
+        query = '''
+        SELECT COUNT(*), MIN(temperature), MAX(temperature), AVG(temperature),
+               AVG(precipitation_probability), MAX(precipitation_probability)
+        FROM weather_forecasts WHERE area_code = ?'''
+        params = [area_code]
+        if start_date:
+            query += ' AND forecast_date >= ?'
+            params.append(start_date)
+        if end_date:
+            query += ' AND forecast_date <= ?'
+            params.append(end_date)
+
+        try:
+            with self.lock:
+                row = self.conn.execute(query, params).fetchone()
+        except sqlite3.Error as e:
+            print(f"天気予報集計エラー: {e}")
+            return None
+        keys = ("count", "min_temp", "max_temp", "avg_temp", "avg_pop", "max_pop")
+        return dict(zip(keys, row))
+
+    def get_all_areas(self):
+        """全エリア情報を取得"""
+        try:
+            with self.lock:
+                return self.conn.execute(
+                    'SELECT DISTINCT region_name, area_name, area_code FROM areas').fetchall()
+        except sqlite3.Error as e:
+            print(f"エリア情報取得エラー: {e}")
+            return []
+
+    def close(self):
+        """データベース接続を閉じる"""
+        with self.lock:
+            self.conn.close()
+
+
+def _to_number(value, kind):
+    """API の文字列を数値にする（"情報なし" や空文字は None）"""
+    if value is None or value == MISSING:
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _forecast_row(area_code, forecast_date, forecast_time, weather_code,
+                  weather, temperature, precipitation_probability):
+    """weather_forecasts に挿入する 1 行を作る"""
+    return (area_code, forecast_date, forecast_time,
+            None if weather_code == MISSING else weather_code,
+            None if weather == MISSING else weather,
+            _to_number(temperature, float),
+            _to_number(precipitation_probability, int))
+
+
+def format_value(value):
+    """データベースの値を表示用の文字列にする（NULL は "情報なし"）"""
+    if value is None:
+        return MISSING
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
@@ -1,6 +1,11 @@
+# 起動時間の計測（STARTUP_PROFILE=1 で表示。最初に import して、ここから数える）
+import startup_profile
 import flet as ft
+IMPORT_SECONDS = startup_profile.elapsed()  # import にかかった時間
 
 def main(page: ft.Page):
+    # 起動時間はセッションごとに、main に入った時刻から記録する
+    profile = startup_profile.StartupProfile(IMPORT_SECONDS)
     # ページの基本設定
     page.title = "ナビゲーションとリストの例"
     page.theme_mode = ft.ThemeMode.LIGHT
@@ -119,6 +124,9 @@ def main(page: ft.Page):
     # ページにレイアウトを追加
     page.add(main_layout)
     page.update()
+    profile.mark("最初の画面")
+    profile.report()
 
 # アプリケーションの実行
-ft.app(target=main)
\ No newline at end of file
+if __name__ == "__main__":
+    ft.app(target=main)
\ No newline at end of file